@@ -0,0 +1,196 @@
+"""Benchmarks of the pipeline hot paths on synthetic data.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --catalogue-sizes 1000 10000 100000 --video-minutes 10
+
+All inputs are generated from fixed seeds, so two runs on the same machine are comparable.
+Results are written as JSON for regression comparison.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from synthetic import make_match_video, make_catalogues, write_json, DEFAULT_SEGMENTS  # noqa: E402
+from DurationProcessing import VideoTimeCutter, iter_sampled_frames  # noqa: E402
+from AudioProcessing import extract_audio  # noqa: E402
+from MatchStreamsWithHighlights import MatchHighlightsMatcher  # noqa: E402
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_is_football_scene(video, work_dir, num_frames=500):
+    cutter = VideoTimeCutter(video["path"], os.path.join(work_dir, "cut"))
+    sample_times = np.linspace(0, video["duration"] - 1, num_frames)
+    frames = np.stack([frame for _, frame in iter_sampled_frames(video["path"], sample_times)])
+
+    _, single = timed(lambda: [cutter.is_football_scene(frame) for frame in frames])
+    _, batch = timed(cutter.is_football_scene_batch, frames)
+    return {
+        "frames": len(frames),
+        "frame_shape": list(frames.shape[1:]),
+        "is_football_scene_fps": len(frames) / single,
+        "is_football_scene_batch_fps": len(frames) / batch,
+    }
+
+
+def bench_frame_sampling(video, work_dir, samples_per_second=1.0):
+    cutter = VideoTimeCutter(video["path"], os.path.join(work_dir, "cut"))
+    sample_times = np.arange(0, video["duration"], 1.0 / samples_per_second)
+
+    (times, _), elapsed = timed(cutter.sample_green_ratios, video["path"], sample_times)
+    _, full_decode = timed(lambda: sum(1 for _ in iter_sampled_frames(video["path"], sample_times)))
+    return {
+        "samples": len(times),
+        "sample_green_ratios_fps": len(times) / elapsed,
+        "iter_sampled_frames_fps": len(sample_times) / full_decode,
+    }
+
+
+def bench_process_single_video(video, work_dir, output_modes):
+    results = {}
+    hours = video["duration"] / 3600
+    for output_mode in output_modes:
+        output_folder = os.path.join(work_dir, f"cut_{output_mode}")
+        shutil.rmtree(output_folder, ignore_errors=True)
+        cutter = VideoTimeCutter(os.path.dirname(video["path"]), output_folder, output_mode=output_mode)
+        # process_single_video is quiet by default; ffmpeg and moviepy may still write to stderr
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            (success, message), elapsed = timed(cutter.process_single_video, video["path"])
+        if not success:
+            raise RuntimeError(message)
+        results[output_mode] = {"seconds": elapsed, "seconds_per_video_hour": elapsed / hours}
+    return results
+
+
+def bench_audio_extraction(video, work_dir, modes=("wav", "pcm", "copy")):
+    results = {}
+    hours = video["duration"] / 3600
+    for mode in modes:
+        audio_folder = os.path.join(work_dir, f"audio_{mode}")
+        shutil.rmtree(audio_folder, ignore_errors=True)
+        os.makedirs(audio_folder)
+        _, elapsed = timed(extract_audio, video["path"], audio_folder, mode)
+        results[mode] = {"seconds": elapsed, "seconds_per_video_hour": elapsed / hours}
+    return results
+
+
+def bench_matching(sizes, work_dir, num_queries=200, seed=0):
+    results = {}
+    folder = os.path.join(work_dir, "catalogue")
+    os.makedirs(folder, exist_ok=True)
+    logging.disable(logging.WARNING)
+    try:
+        for size in sizes:
+            streams_file, highlights_file = make_catalogues(size, size, seed)
+            write_json(streams_file, os.path.join(folder, f"youtube_streams_{size}.json"))
+            write_json(highlights_file, os.path.join(folder, f"Highlight_Match_Info_{size}.json"))
+
+            streams = streams_file["streams"][:num_queries]
+            highlights = highlights_file["infos"]
+            matcher = MatchHighlightsMatcher(0.6, folder, folder)
+            _, build = timed(matcher.get_index, highlights)
+            matches, query = timed(lambda: [matcher.find_matching_highlights(match, highlights) for match in streams])
+            pairs = len(streams) * len(highlights)
+            results[str(size)] = {
+                "highlights": len(highlights),
+                "queries": len(streams),
+                "index_build_seconds": build,
+                "query_seconds": query,
+                "pairs_per_second": pairs / query,
+                "pairs_per_second_with_build": pairs / (build + query),
+                "matches_found": sum(len(found) for found in matches),
+            }
+    finally:
+        logging.disable(logging.NOTSET)
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="JSON result file (printed to stdout when omitted)")
+    parser.add_argument("--work-dir", help="Keep generated inputs here and reuse them on the next run")
+    parser.add_argument("--video-minutes", type=float, default=3.0, help="Length of the synthetic match video")
+    parser.add_argument("--catalogue-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--output-modes", nargs="+", default=["copy", "reencode"])
+    parser.add_argument("--only", nargs="+", choices=["scene", "sampling", "cut", "audio", "matching"])
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="shv_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        # Scale the default segment layout to the requested length
+        scale = args.video_minutes * 60 / sum(seconds for _, seconds in DEFAULT_SEGMENTS)
+        segments = [(kind, seconds * scale) for kind, seconds in DEFAULT_SEGMENTS]
+        video_path = os.path.join(work_dir, "videos", f"match_{args.video_minutes:g}min.mp4")
+        os.makedirs(os.path.dirname(video_path), exist_ok=True)
+
+        benchmarks = {
+            "scene": ("is_football_scene", lambda video: bench_is_football_scene(video, work_dir)),
+            "sampling": ("frame_sampling", lambda video: bench_frame_sampling(video, work_dir)),
+            "cut": ("process_single_video", lambda video: bench_process_single_video(video, work_dir, args.output_modes)),
+            "audio": ("audio_extraction", lambda video: bench_audio_extraction(video, work_dir)),
+            "matching": ("find_matching_highlights", lambda video: bench_matching(args.catalogue_sizes, work_dir)),
+        }
+        selected = args.only or list(benchmarks)
+
+        video = None
+        if any(name != "matching" for name in selected):
+            video, elapsed = timed(make_match_video, video_path, segments)
+            logging.info(f"Synthetic video ready ({video['duration']:.0f}s) in {elapsed:.1f}s")
+
+        results = {}
+        for name in selected:
+            label, run = benchmarks[name]
+            logging.info(f"Running {label}")
+            results[label] = run(video)
+
+        report = {
+            "environment": environment(),
+            "config": {
+                "video_seconds": video["duration"] if video else None,
+                "catalogue_sizes": args.catalogue_sizes,
+                "output_modes": args.output_modes,
+            },
+            "results": results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(text)
+        else:
+            print(text)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import os
+import json
+import wave
+import subprocess
+from datetime import datetime, timedelta
+from typing import List, Tuple, Dict, Any
+
+import cv2
+import numpy as np
+from moviepy.config import get_setting
+
+# (kind, seconds) of the default synthetic match: studio build-up, ads, two halves around a break
+DEFAULT_SEGMENTS = [("studio", 20), ("ad", 10), ("pitch", 60), ("studio", 10), ("ad", 10), ("pitch", 60), ("studio", 10)]
+
+TEAMS = [
+    "Việt Nam", "Thái Lan", "Indonesia", "Malaysia", "Singapore", "Philippines", "Myanmar", "Lào",
+    "Campuchia", "Brunei", "Timor-Leste", "Hà Nội", "Hải Phòng", "Nam Định", "Thanh Hoá", "SLNA",
+    "Bình Dương", "CAHN", "Viettel", "HAGL", "Quảng Nam", "Đà Nẵng", "Khánh Hoà", "Bình Định",
+]
+COMPETITIONS = ["V.LEAGUE 1 - 2024/25", "ASEAN MITSUBISHI ELECTRIC CUP 2024", "CÚP QUỐC GIA 2024", "U23 CHÂU Á 2024"]
+
+
+def pitch_frame(rng: np.random.Generator, width: int, height: int, t: float) -> np.ndarray:
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = (40, 140, 50)
+    # Mowing stripes, touch line and centre circle, moving players
+    for x in range(0, width, width // 8):
+        frame[:, x:x + width // 16] = (45, 155, 55)
+    cv2.line(frame, (0, height // 6), (width, height // 6), (255, 255, 255), 2)
+    cv2.circle(frame, (width // 2, height // 2), height // 5, (255, 255, 255), 2)
+    for i in range(10):
+        x = int((width * (0.1 + 0.08 * i) + 40 * t * (1 if i % 2 else -1)) % width)
+        y = int(height * (0.3 + 0.05 * (i % 8)))
+        cv2.circle(frame, (x, y), 6, (0, 0, 255) if i % 2 else (255, 255, 0), -1)
+    return frame
+
+
+def studio_frame(rng: np.random.Generator, width: int, height: int, t: float) -> np.ndarray:
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = (90, 40, 20)
+    cv2.rectangle(frame, (width // 4, height // 3), (3 * width // 4, height), (70, 70, 70), -1)
+    cv2.rectangle(frame, (0, 4 * height // 5), (width, height), (200, 200, 200), -1)
+    return frame
+
+
+def ad_frame(rng: np.random.Generator, width: int, height: int, t: float) -> np.ndarray:
+    # Saturated colours that change every half second
+    color = np.random.default_rng(int(t * 2)).integers(0, 256, 3)
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = color
+    cv2.putText(frame, "SALE", (width // 3, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 4)
+    return frame
+
+
+FRAME_MAKERS = {"pitch": pitch_frame, "studio": studio_frame, "ad": ad_frame}
+
+
+def write_tone_audio(path: str, segments: List[Tuple[str, float]], sample_rate: int = 16000, seed: int = 0):
+    """Crowd-like noise with louder bursts during pitch segments, commentary tone elsewhere."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for kind, seconds in segments:
+        n = int(seconds * sample_rate)
+        t = np.arange(n) / sample_rate
+        if kind == "pitch":
+            envelope = 0.2 + 0.6 * (np.sin(2 * np.pi * t / 15) > 0.8)
+            signal = envelope * rng.normal(0, 0.3, n)
+        else:
+            signal = 0.2 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 0.02, n)
+        parts.append(signal)
+    audio = np.clip(np.concatenate(parts), -1, 1)
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((audio * 32767).astype('<i2').tobytes())
+
+
+def make_match_video(path: str, segments: List[Tuple[str, float]] = None, width: int = 640, height: int = 360,
+                     fps: int = 25, seed: int = 0) -> Dict[str, Any]:
+    """Write a synthetic match video with an audio track; reused when it already exists."""
+    segments = segments or DEFAULT_SEGMENTS
+    duration = sum(seconds for _, seconds in segments)
+    if os.path.exists(path):
+        return {"path": path, "duration": duration, "segments": segments}
+
+    rng = np.random.default_rng(seed)
+    silent_path = f"{os.path.splitext(path)[0]}.silent.mp4"
+    audio_path = f"{os.path.splitext(path)[0]}.wav"
+    writer = cv2.VideoWriter(silent_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    t = 0.0
+    for kind, seconds in segments:
+        for _ in range(int(seconds * fps)):
+            writer.write(FRAME_MAKERS[kind](rng, width, height, t))
+            t += 1.0 / fps
+    writer.release()
+
+    write_tone_audio(audio_path, segments, seed=seed)
+    result = subprocess.run([
+        get_setting("FFMPEG_BINARY"), "-v", "error", "-y", "-i", silent_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0", "-c:v", "libx264", "-preset", "veryfast", "-g", str(2 * fps),
+        "-c:a", "aac", "-shortest", path,
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    os.remove(silent_path)
+    os.remove(audio_path)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return {"path": path, "duration": duration, "segments": segments}
+
+
+def make_catalogues(num_streams: int, num_highlights: int, seed: int = 0) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Synthetic youtube_streams.json and Highlight_Match_Info.json payloads.
+
+    Every highlight is generated from a random stream fixture, so roughly num_highlights
+    true pairs exist whatever the catalogue size.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    streams = []
+    for i in range(num_streams):
+        home, away = rng.choice(len(TEAMS), 2, replace=False)
+        published = start + timedelta(minutes=int(rng.integers(0, 60 * 24 * 365)))
+        streams.append({
+            "id": i + 1,
+            "video_id": f"s{i:010d}",
+            "video_url": f"https://www.youtube.com/watch?v=s{i:010d}",
+            "title": f"🔴TRỰC TIẾP: {TEAMS[home].upper()} - {TEAMS[away].upper()} | "
+                     f"{COMPETITIONS[i % len(COMPETITIONS)]} #{i}",
+            "published_date": published.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "duration_seconds": float(rng.integers(5400, 9000)),
+            "view_count": int(rng.integers(0, 200000)),
+            "like_count": 0,
+            "comment_count": int(rng.integers(0, 100)),
+            "tags": [],
+        })
+
+    infos = []
+    for i in range(num_highlights):
+        stream = streams[int(rng.integers(0, num_streams))]
+        teams = stream["title"].split(":", 1)[1].split("|")[0]
+        infos.append({
+            "id": i + 1,
+            "video_id": f"h{i:010d}",
+            "title": f"HIGHLIGHTS: {teams.strip()} | {'BÀN THẮNG ĐẸP' if i % 2 else 'NGƯỢC DÒNG'}",
+            "url": f"https://www.youtube.com/watch?v=h{i:010d}",
+            "local_path": f"h{i:010d}.mp4",
+            "duration_seconds": float(rng.integers(120, 900)),
+            "published_date": stream["published_date"],
+            "definition": "hd",
+            "view_count": int(rng.integers(0, 100000)),
+            "like_count": 0,
+            "comment_count": 0,
+            "tags": [],
+        })
+
+    streams_file = {
+        "channel_id": "synthetic",
+        "channel_title": "Synthetic Channel",
+        "last_updated": start.strftime('%Y-%m-%d %H:%M:%S'),
+        "total_videos": len(streams),
+        "streams": streams,
+    }
+    highlights_file = {"type": "Highlight Match", "total_videos": len(infos), "infos": infos}
+    return streams_file, highlights_file
+
+
+def write_json(data: Dict[str, Any], path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
@@ -0,0 +1,197 @@
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from DurationProcessing import iter_sampled_frames
+from Instrumentation import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi')
+
+
+class AnalysisProxy:
+    """Low-resolution BGR frames of one video (N×H×W×3 memmap) with their timestamps.
+
+    Every accessor except frames_at() returns views into the memmap, so analyses read
+    the proxy at memory bandwidth and nothing is copied until a frame is actually used.
+    """
+
+    def __init__(self, frames: np.ndarray, times: np.ndarray, meta: Dict[str, Any]):
+        self.frames = frames
+        self.times = times
+        self.meta = meta
+
+    @property
+    def fps(self) -> float:
+        return self.meta["fps"]
+
+    @property
+    def duration(self) -> float:
+        return self.meta["duration"]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def index_range(self, start: float, end: float) -> Tuple[int, int]:
+        return int(np.searchsorted(self.times, start, 'left')), int(np.searchsorted(self.times, end, 'left'))
+
+    def view(self, start: float = 0.0, end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(times, frames) of [start, end) without copying."""
+        i, j = self.index_range(start, self.duration if end is None else end)
+        return self.times[i:j], self.frames[i:j]
+
+    def nearest(self, sample_times) -> np.ndarray:
+        """Index of the proxy frame closest to each requested time."""
+        sample_times = np.asarray(sample_times, dtype=np.float64)
+        idx = np.clip(np.searchsorted(self.times, sample_times), 1, max(len(self.times) - 1, 1))
+        left = self.times[idx - 1]
+        right = self.times[np.minimum(idx, len(self.times) - 1)]
+        return np.where(sample_times - left <= right - sample_times, idx - 1, idx).clip(0, len(self.times) - 1)
+
+    def frames_at(self, sample_times) -> Tuple[np.ndarray, np.ndarray]:
+        """(times, frames) of the nearest proxy frames; a copy, since the indices are arbitrary."""
+        idx = np.unique(self.nearest(sample_times))
+        return self.times[idx], self.frames[idx]
+
+    def iter_batches(self, batch_size: int = 256, start: float = 0.0,
+                     end: Optional[float] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        times, frames = self.view(start, end)
+        for i in range(0, len(times), batch_size):
+            yield times[i:i + batch_size], frames[i:i + batch_size]
+
+
+class AnalysisProxyCache:
+    """Decodes each video once into an AnalysisProxy stored under cache_folder and reuses it.
+
+    Files per video: <video_id>.frames.npy (memmap), <video_id>.times.npy and
+    <video_id>.proxy.json. A proxy is rebuilt when the source size or mtime, fps or
+    width changed.
+    """
+
+    def __init__(self, cache_folder: str, fps: float = 4.0, width: int = 160):
+        self.cache_folder = cache_folder
+        self.fps = fps
+        self.width = width
+        self._proxies: Dict[str, AnalysisProxy] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def paths(self, video_path: str) -> Dict[str, str]:
+        video_id = os.path.splitext(os.path.basename(video_path))[0]
+        base = os.path.join(self.cache_folder, video_id)
+        return {"frames": f"{base}.frames.npy", "times": f"{base}.times.npy", "meta": f"{base}.proxy.json"}
+
+    def _source_meta(self, video_path: str) -> Dict[str, Any]:
+        stat = os.stat(video_path)
+        return {"source_size": stat.st_size, "source_mtime": stat.st_mtime, "fps": self.fps, "width": self.width}
+
+    def is_fresh(self, video_path: str) -> bool:
+        paths = self.paths(video_path)
+        if not all(os.path.exists(path) for path in paths.values()):
+            return False
+        with open(paths["meta"], 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return all(meta.get(key) == value for key, value in self._source_meta(video_path).items())
+
+    def _open(self, video_path: str) -> AnalysisProxy:
+        paths = self.paths(video_path)
+        with open(paths["meta"], 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        frames = np.load(paths["frames"], mmap_mode='r')[:meta["frames"]]
+        times = np.load(paths["times"])
+        return AnalysisProxy(frames, times, meta)
+
+    def build(self, video_path: str) -> AnalysisProxy:
+        """Decode video_path once at self.fps, downscaled to self.width, into the memmap."""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"Cannot open video: {video_path}")
+        source_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / source_fps
+        cap.release()
+
+        paths = self.paths(video_path)
+        sample_times = np.arange(0, duration, 1.0 / self.fps)
+        capacity = len(np.unique(np.round(sample_times * source_fps)))
+        frames, times, count = None, np.empty(capacity), 0
+
+        # The frame count is only an estimate, so the memmap is sized for every requested
+        # sample and the number actually decoded is kept in the metadata
+        with metrics.timer("proxy_build"):
+            for t, frame in iter_sampled_frames(video_path, sample_times, self.width):
+                if frames is None:
+                    frames = np.lib.format.open_memmap(f"{paths['frames']}.tmp", mode='w+', dtype=np.uint8,
+                                                       shape=(capacity, *frame.shape))
+                if count == capacity:
+                    break
+                frames[count] = frame
+                times[count] = t
+                count += 1
+        if frames is None:
+            raise IOError(f"No frames decoded from {video_path}")
+        frames.flush()
+        del frames
+
+        meta = {**self._source_meta(video_path), "frames": count, "duration": duration, "source_fps": source_fps}
+        np.save(f"{paths['times']}.tmp.npy", times[:count])
+        with open(f"{paths['meta']}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        # Metadata last: a proxy without it is never considered fresh
+        if os.path.exists(paths["meta"]):
+            os.remove(paths["meta"])
+        os.replace(f"{paths['frames']}.tmp", paths["frames"])
+        os.replace(f"{paths['times']}.tmp.npy", paths["times"])
+        os.replace(f"{paths['meta']}.tmp", paths["meta"])
+
+        logging.info(f"Built analysis proxy of {video_path}: {count} frames")
+        return self._open(video_path)
+
+    def get(self, video_path: str) -> AnalysisProxy:
+        """Open the cached proxy of video_path, building it first when missing or stale."""
+        key = os.path.abspath(video_path)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # One build per video even when several analyses ask for it at the same time
+        with lock:
+            fresh = self.is_fresh(video_path)
+            if key not in self._proxies or not fresh:
+                self._proxies[key] = self._open(video_path) if fresh else self.build(video_path)
+            return self._proxies[key]
+
+    def build_all(self, input_folder: str, num_workers: int = 4) -> Dict[str, bool]:
+        video_files = [f for f in os.listdir(input_folder) if f.endswith(VIDEO_EXTENSIONS)]
+
+        def run(video_file):
+            try:
+                self.get(os.path.join(input_folder, video_file))
+                return True
+            except Exception as e:
+                logging.error(f"Error building proxy of {video_file}: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return dict(zip(video_files, executor.map(run, video_files)))
+
+
+def main():
+    try:
+        cache = AnalysisProxyCache("F:/proxies")
+        results = cache.build_all("F:/processed_original")
+        print(f"Built {sum(results.values())}/{len(results)} analysis proxies")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
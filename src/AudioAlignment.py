@@ -0,0 +1,245 @@
+import os
+import json
+import logging
+from typing import List, Dict, Any, Tuple, Optional
+
+import numpy as np
+
+from AudioProcessing import iter_audio_chunks, is_up_to_date, ANALYSIS_SAMPLE_RATE
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+class FingerprintIndex:
+    """Spectral peak-pair hashes of one full match, sorted by hash for binary-search lookup."""
+
+    def __init__(self, hashes: np.ndarray, times: np.ndarray, frame_seconds: float):
+        order = np.argsort(hashes, kind='stable')
+        self.hashes = hashes[order]
+        self.times = times[order]
+        self.frame_seconds = frame_seconds
+
+    def save(self, path: str):
+        np.savez(path, hashes=self.hashes, times=self.times, frame_seconds=self.frame_seconds)
+
+    @classmethod
+    def load(cls, path: str) -> "FingerprintIndex":
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.hashes = data["hashes"]
+            index.times = data["times"]
+            index.frame_seconds = float(data["frame_seconds"])
+            return index
+
+    def lookup(self, hashes: np.ndarray, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (query_time, match_time) for every index entry that shares a hash with the query."""
+        lo = np.searchsorted(self.hashes, hashes, side='left')
+        hi = np.searchsorted(self.hashes, hashes, side='right')
+        counts = hi - lo
+        if counts.sum() == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # Expand every [lo, hi) range into explicit positions without a Python loop
+        query_times = np.repeat(times, counts)
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(counts.sum())
+        return query_times, self.times[positions]
+
+
+class AudioFingerprinter:
+    def __init__(self, sample_rate: int = ANALYSIS_SAMPLE_RATE, window: int = 1024, hop: int = 512,
+                 num_bands: int = 6, min_hz: float = 300.0, max_hz: float = 4000.0,
+                 peak_neighborhood: int = 5, fan_out: int = 5, max_dt: int = 63):
+        self.sample_rate = sample_rate
+        self.window = window
+        self.hop = hop
+        self.peak_neighborhood = peak_neighborhood
+        self.fan_out = fan_out
+        self.max_dt = max_dt
+
+        freqs = np.fft.rfftfreq(window, 1.0 / sample_rate)
+        edges = np.linspace(min_hz, max_hz, num_bands + 1)
+        self.bands = [np.where((freqs >= lo) & (freqs < hi))[0] for lo, hi in zip(edges[:-1], edges[1:])]
+        self.hann = np.hanning(window).astype(np.float32)
+
+    @property
+    def frame_seconds(self) -> float:
+        return self.hop / self.sample_rate
+
+    def _band_maxima(self, audio_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        # Strongest bin of every band for every STFT frame, computed chunk by chunk
+        values, bins = [], []
+        carry = np.zeros(0, dtype=np.float32)
+        for chunk in iter_audio_chunks(audio_path, 60 * self.sample_rate, self.sample_rate):
+            buf = np.concatenate([carry, chunk])
+            n = (len(buf) - self.window) // self.hop + 1
+            if n <= 0:
+                carry = buf
+                continue
+            frames = np.lib.stride_tricks.sliding_window_view(buf, self.window)[::self.hop][:n]
+            carry = buf[n * self.hop:]
+
+            spectrum = np.log1p(np.abs(np.fft.rfft(frames * self.hann, axis=1)))
+            band_values = np.stack([spectrum[:, band].max(axis=1) for band in self.bands], axis=1)
+            band_bins = np.stack([band[spectrum[:, band].argmax(axis=1)] for band in self.bands], axis=1)
+            values.append(band_values)
+            bins.append(band_bins)
+
+        if not values:
+            return np.empty((0, len(self.bands))), np.empty((0, len(self.bands)), dtype=np.int64)
+        return np.concatenate(values), np.concatenate(bins)
+
+    def fingerprint(self, audio_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Peak-pair hashes (f1, f2, dt) and their anchor frame indices."""
+        values, bins = self._band_maxima(audio_path)
+        if len(values) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # A peak is the maximum of its band within +-peak_neighborhood frames and above the band median
+        k = self.peak_neighborhood
+        padded = np.pad(values, ((k, k), (0, 0)), constant_values=-np.inf)
+        local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * k + 1, axis=0).max(axis=-1)
+        is_peak = (values >= local_max) & (values > np.median(values, axis=0))
+        peak_times, peak_bands = np.nonzero(is_peak)
+        peak_freqs = bins[peak_times, peak_bands]
+
+        hashes, times = [], []
+        for offset in range(1, self.fan_out + 1):
+            anchor_t, target_t = peak_times[:-offset], peak_times[offset:]
+            dt = target_t - anchor_t
+            valid = (dt > 0) & (dt <= self.max_dt)
+            f1 = peak_freqs[:-offset][valid].astype(np.int64)
+            f2 = peak_freqs[offset:][valid].astype(np.int64)
+            hashes.append((f1 << 20) | (f2 << 8) | dt[valid])
+            times.append(anchor_t[valid])
+        return np.concatenate(hashes), np.concatenate(times).astype(np.int64)
+
+    def build_index(self, audio_path: str) -> FingerprintIndex:
+        hashes, times = self.fingerprint(audio_path)
+        return FingerprintIndex(hashes, times, self.frame_seconds)
+
+    def align_clip(self, index: FingerprintIndex, clip_path: str, window_seconds: float = 8.0,
+                   min_votes: int = 8, tolerance: int = 2) -> List[Dict[str, Any]]:
+        """Locate the segments of a highlight clip inside the indexed full match."""
+        hashes, times = self.fingerprint(clip_path)
+        if len(hashes) == 0:
+            return []
+
+        query_times, match_times = index.lookup(hashes, times)
+        offsets = match_times - query_times
+        frames_per_window = max(1, int(window_seconds / self.frame_seconds))
+        windows = query_times // frames_per_window
+
+        # Best match offset per clip window: one vote per (window, offset) pair
+        segments = []
+        for window_id in np.unique(windows):
+            window_offsets = offsets[windows == window_id]
+            values, counts = np.unique(window_offsets, return_counts=True)
+            best = counts.argmax()
+            if counts[best] < min_votes:
+                continue
+            offset = int(values[best])
+            start = int(window_id) * frames_per_window
+            end = start + frames_per_window
+
+            # Consecutive windows with the same offset belong to the same segment
+            if segments and abs(segments[-1]["offset"] - offset) <= tolerance and segments[-1]["end"] >= start:
+                segments[-1]["end"] = end
+                segments[-1]["votes"] += int(counts[best])
+            else:
+                segments.append({"offset": offset, "start": start, "end": end, "votes": int(counts[best])})
+
+        fs = self.frame_seconds
+        return [{
+            "highlight_start": round(s["start"] * fs, 2),
+            "highlight_end": round(s["end"] * fs, 2),
+            "match_start": round((s["start"] + s["offset"]) * fs, 2),
+            "match_end": round((s["end"] + s["offset"]) * fs, 2),
+            "votes": s["votes"],
+        } for s in segments]
+
+
+class HighlightAligner:
+    def __init__(self, audio_folder: str, index_folder: str, fingerprinter: Optional[AudioFingerprinter] = None):
+        self.audio_folder = audio_folder
+        self.index_folder = index_folder
+        self.fingerprinter = fingerprinter or AudioFingerprinter()
+        os.makedirs(index_folder, exist_ok=True)
+
+    def _audio_path(self, video_id: str) -> Optional[str]:
+        for extension in (".wav", ".pcm"):
+            path = os.path.join(self.audio_folder, f"{video_id}{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def load_index(self, video_id: str) -> Optional[FingerprintIndex]:
+        """Fingerprint a full match once and reuse the stored index while it is up to date."""
+        audio_path = self._audio_path(video_id)
+        if audio_path is None:
+            return None
+
+        index_path = os.path.join(self.index_folder, f"{video_id}.fingerprint.npz")
+        if is_up_to_date(index_path, audio_path):
+            return FingerprintIndex.load(index_path)
+
+        index = self.fingerprinter.build_index(audio_path)
+        index.save(index_path)
+        return index
+
+    def align_relationships(self, relationship_file: str) -> Dict[str, Any]:
+        relationship_path = os.path.join(os.path.dirname(__file__), "..", "data", relationship_file)
+        try:
+            with open(relationship_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            aligned = 0
+            for relationship in data["relationships"]:
+                match_id = relationship["full_match"]["video_id"]
+                index = self.load_index(match_id)
+                if index is None:
+                    logging.warning(f"No audio found for full match {match_id}")
+                    continue
+
+                for highlight in relationship["highlights"]:
+                    clip_path = self._audio_path(highlight["highlight_id"])
+                    if clip_path is None:
+                        logging.warning(f"No audio found for highlight {highlight['highlight_id']}")
+                        continue
+
+                    highlight["alignment"] = {
+                        "method": "audio_fingerprint",
+                        "segments": self.fingerprinter.align_clip(index, clip_path),
+                    }
+                    aligned += 1
+
+            with open(relationship_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+            logging.info(f"Aligned {aligned} highlights")
+            return data
+
+        except FileNotFoundError as e:
+            logging.error(f"File not found: {str(e)}")
+            raise
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON format error: {str(e)}")
+            raise
+        except Exception as e:
+            logging.error(f"Error: {str(e)}")
+            raise
+
+
+def main():
+    try:
+        aligner = HighlightAligner("F:/audio", "F:/fingerprints")
+        aligner.align_relationships("Match_Streams_With_Highlights.json")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,60 @@
 import os
+import wave
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from moviepy.editor import VideoFileClip
+from moviepy.config import get_setting
+import numpy as np
 import cv2
 from tqdm import tqdm
+from Instrumentation import metrics
+
+# Output formats of extract_audio:
+#   "copy": the original AAC track remuxed into .m4a, no re-encode
+#   "wav":  mono 16-bit PCM at ANALYSIS_SAMPLE_RATE, for analysis
+#   "pcm":  same samples as "wav" but headerless s16le, readable with np.memmap
+AUDIO_EXTENSIONS = {"copy": ".m4a", "wav": ".wav", "pcm": ".pcm"}
+ANALYSIS_SAMPLE_RATE = 16000
+
+
+def is_up_to_date(output_path, source_path):
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(source_path)
+
+
+def extract_audio(video_path, audio_folder, mode="wav", sample_rate=ANALYSIS_SAMPLE_RATE):
+    """Extract the audio track with ffmpeg directly; returns the output path, or None if it was up to date."""
+    if mode not in AUDIO_EXTENSIONS:
+        raise ValueError(f"Unknown audio mode: {mode}")
+
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    audio_path = os.path.join(audio_folder, f"{video_name}{AUDIO_EXTENSIONS[mode]}")
+    if is_up_to_date(audio_path, video_path):
+        return None
+
+    args = [get_setting("FFMPEG_BINARY"), "-v", "error", "-y", "-i", video_path, "-vn", "-map", "0:a:0"]
+    if mode == "copy":
+        args += ["-c:a", "copy"]
+    else:
+        args += ["-ac", "1", "-ar", str(sample_rate), "-c:a", "pcm_s16le"]
+        if mode == "pcm":
+            args += ["-f", "s16le"]
+
+    # Write to a temporary name first so an interrupted run never looks up to date
+    tmp_path = os.path.join(audio_folder, f"{video_name}.part{AUDIO_EXTENSIONS[mode]}")
+    with metrics.timer("audio_write"):
+        result = subprocess.run(args + [tmp_path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(result.stderr.strip())
+    os.replace(tmp_path, audio_path)
+    metrics.count("bytes_written", os.path.getsize(audio_path))
+    return audio_path
+
+
+def load_pcm(audio_path):
+    """Memory-map a raw mono s16le file written by extract_audio(mode="pcm")."""
+    return np.memmap(audio_path, dtype='<i2', mode='r')
 
 def process_video(video_path, audio_folder, frame_folder):
     video_name = os.path.splitext(os.path.basename(video_path))[0]
@@ -45,7 +98,7 @@ def process_video(video_path, audio_folder, frame_folder):
     #     print(f"Error frames {video_name}: {str(e)}")
 
 
-def process_all_videos(input_folder, audio_folder, frame_folder):
+def process_all_videos(input_folder, audio_folder, frame_folder, mode=None, num_workers=4, duplicates=None):
     os.makedirs(audio_folder, exist_ok=True)
     os.makedirs(frame_folder, exist_ok=True)
 
@@ -59,8 +112,152 @@ def process_all_videos(input_folder, audio_folder, frame_folder):
 
     print(f"Found {len(video_files)} video")
 
-    for video_path in video_files:
-        process_video(video_path, audio_folder, frame_folder)
+    # Re-uploads found by Deduplication ({video_id: canonical video_id}) are not extracted again
+    if duplicates:
+        kept = [path for path in video_files if os.path.splitext(os.path.basename(path))[0] not in duplicates]
+        print(f"Skipping {len(video_files) - len(kept)} duplicate videos")
+        video_files = kept
+
+    if mode is None:
+        for video_path in video_files:
+            process_video(video_path, audio_folder, frame_folder)
+        return
+
+    # Each task is its own ffmpeg process; num_workers bounds how many run at once
+    def run(video_path):
+        try:
+            with metrics.video(os.path.splitext(os.path.basename(video_path))[0], task="audio"):
+                return extract_audio(video_path, audio_folder, mode)
+        except Exception as e:
+            print(f"Error audio {video_path}: {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        extracted = list(tqdm(executor.map(run, video_files), total=len(video_files), desc="Extracting audio"))
+
+    print(f"Extracted {sum(1 for path in extracted if path)} audio files")
+
+
+EXCITEMENT_COLUMNS = ["rms", "high_band_energy", "spectral_flux"]
+
+
+def wav_sample_rate(audio_path):
+    with wave.open(audio_path, 'rb') as wav:
+        return wav.getframerate()
+
+
+def iter_audio_chunks(audio_path, chunk_samples, sample_rate=None):
+    """Yield float32 mono samples in [-1, 1] from a .wav or .pcm file, chunk_samples at a time.
+
+    A .pcm file has no header and is assumed to be at the caller's rate; for a .wav file
+    a sample_rate different from the one in its header raises ValueError.
+    """
+    if audio_path.endswith(".pcm"):
+        samples = load_pcm(audio_path)
+        for start in range(0, len(samples), chunk_samples):
+            yield samples[start:start + chunk_samples].astype(np.float32) / 32768.0
+        return
+
+    with wave.open(audio_path, 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"Expected 16-bit PCM: {audio_path}")
+        if sample_rate is not None and wav.getframerate() != sample_rate:
+            raise ValueError(f"Expected {sample_rate} Hz, got {wav.getframerate()} Hz: {audio_path}")
+        channels = wav.getnchannels()
+        while True:
+            data = wav.readframes(chunk_samples)
+            if not data:
+                break
+            chunk = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+            if channels > 1:
+                chunk = chunk.reshape(-1, channels).mean(axis=1)
+            yield chunk
+
+
+def compute_excitement_envelope(audio_path, sample_rate=ANALYSIS_SAMPLE_RATE, chunk_seconds=60,
+                                hops_per_second=20, high_band_hz=2000):
+    """Per-second RMS, high-band energy (crowd roar proxy) and spectral flux, streamed chunk by chunk.
+
+    sample_rate only applies to headerless .pcm files; a .wav file is read at its own rate.
+    """
+    if audio_path.endswith(".wav"):
+        sample_rate = wav_sample_rate(audio_path)
+    chunks = iter_audio_chunks(audio_path, chunk_seconds * sample_rate, sample_rate)
+    return excitement_envelope(chunks, sample_rate, hops_per_second, high_band_hz)
+
+
+def excitement_envelope(chunks, sample_rate=ANALYSIS_SAMPLE_RATE, hops_per_second=20, high_band_hz=2000):
+    """compute_excitement_envelope over any iterable of float32 mono chunks (e.g. a decode stream)."""
+    hop = sample_rate // hops_per_second
+    win = 2 * hop
+    window = np.hanning(win).astype(np.float32)
+    high_band = np.fft.rfftfreq(win, 1.0 / sample_rate) >= high_band_hz
+
+    carry = np.zeros(win - hop, dtype=np.float32)
+    prev_spectrum = None
+    pending = np.empty((0, 3), dtype=np.float32)
+    seconds = []
+
+    for chunk in chunks:
+        buf = np.concatenate([carry, chunk])
+        n = (len(buf) - win) // hop + 1
+        if n <= 0:
+            carry = buf
+            continue
+        frames = np.lib.stride_tricks.sliding_window_view(buf, win)[::hop][:n]
+        carry = buf[n * hop:]
+
+        spectrum = np.abs(np.fft.rfft(frames * window, axis=1))
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        high_energy = (spectrum[:, high_band] ** 2).sum(axis=1) / win
+        previous = spectrum[:1] if prev_spectrum is None else prev_spectrum
+        flux = np.maximum(np.diff(spectrum, axis=0, prepend=previous), 0).sum(axis=1)
+        prev_spectrum = spectrum[-1:]
+
+        # Average whole seconds and keep the remainder for the next chunk
+        pending = np.concatenate([pending, np.stack([rms, high_energy, flux], axis=1)])
+        whole = len(pending) // hops_per_second * hops_per_second
+        if whole:
+            seconds.append(pending[:whole].reshape(-1, hops_per_second, 3).mean(axis=1))
+            pending = pending[whole:]
+
+    if len(pending):
+        seconds.append(pending.mean(axis=0, keepdims=True))
+
+    return np.concatenate(seconds).astype(np.float32) if seconds else np.empty((0, 3), dtype=np.float32)
+
+
+def save_excitement_envelope(audio_path, output_folder, sample_rate=ANALYSIS_SAMPLE_RATE):
+    video_id = os.path.splitext(os.path.basename(audio_path))[0]
+    output_path = os.path.join(output_folder, f"{video_id}.excitement.npz")
+    if is_up_to_date(output_path, audio_path):
+        return None
+
+    features = compute_excitement_envelope(audio_path, sample_rate)
+    np.savez(output_path, video_id=video_id, columns=EXCITEMENT_COLUMNS, features=features)
+    return output_path
+
+
+def load_excitement_envelope(feature_path):
+    with np.load(feature_path) as data:
+        return str(data["video_id"]), data["features"]
+
+
+def process_all_audio(audio_folder, output_folder, num_workers=4):
+    os.makedirs(output_folder, exist_ok=True)
+
+    audio_files = [os.path.join(audio_folder, file) for file in os.listdir(audio_folder)
+                   if file.endswith(('.wav', '.pcm')) and '.part.' not in file]
+    print(f"Found {len(audio_files)} audio")
+
+    # FFT work is CPU bound, so spread files over processes
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(save_excitement_envelope, path, output_folder): path for path in audio_files}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Audio envelope"):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error envelope {futures[future]}: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -71,7 +268,8 @@ if __name__ == "__main__":
 
         path = "F:/processed_original/_KPD_5LtFNw.mp4"
 
-        process_all_videos(input_folder, audio_folder, frame_folder)
+        process_all_videos(input_folder, audio_folder, frame_folder, mode="wav")
+        process_all_audio(audio_folder, "F:/audio_features")
         # process_video(path, audio_folder, frame_folder)
 
     except Exception as e:
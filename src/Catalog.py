@@ -0,0 +1,279 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable
+
+from TitleNormalization import title_key
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Top-level list key of each fetcher output file and the catalogue type it maps to
+LIST_KEYS = {"streams": "stream", "videos": "highlight", "shorts": "short"}
+TOTAL_KEYS = {"stream": "total_videos", "highlight": "total_videos", "short": "total_shorts"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    id INTEGER,
+    title TEXT NOT NULL,
+    title_hash TEXT NOT NULL,
+    channel_id TEXT,
+    type TEXT NOT NULL,
+    local_path TEXT,
+    published_date TEXT,
+    duration_seconds REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_title_hash ON videos(title_hash);
+CREATE INDEX IF NOT EXISTS idx_videos_channel_type ON videos(channel_id, type, published_date);
+CREATE INDEX IF NOT EXISTS idx_videos_type_published ON videos(type, published_date);
+CREATE INDEX IF NOT EXISTS idx_videos_local_path ON videos(local_path);
+
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id TEXT PRIMARY KEY,
+    channel_title TEXT,
+    last_updated TEXT
+);
+
+CREATE TABLE IF NOT EXISTS fetch_watermarks (
+    channel_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    published_after TEXT NOT NULL,
+    PRIMARY KEY (channel_id, type)
+);
+"""
+
+
+class Catalog:
+    """Embedded SQLite catalogue of every fetched video, shared by all pipeline stages."""
+
+    def __init__(self, db_file: str = "catalog.db"):
+        self.db_path = os.path.join(os.path.dirname(__file__), "..", "data", db_file)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _fetch(self, query: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        # The connection is shared between threads (e.g. YouTubeFetcher's videos.list batches),
+        # so reads are serialized with the writes instead of running on it concurrently
+        with self._lock:
+            return self.conn.execute(query, tuple(params)).fetchall()
+
+    def _fetchone(self, query: str, params: Iterable[Any] = ()) -> Optional[sqlite3.Row]:
+        rows = self._fetch(query, params)
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _row(video: Dict[str, Any], video_type: str, channel_id: Optional[str]) -> tuple:
+        return (
+            video["video_id"],
+            video.get("id"),
+            video["title"],
+            title_key(video["title"]),
+            channel_id or video.get("channel_id"),
+            video_type,
+            video.get("local_path"),
+            video.get("published_date"),
+            video.get("duration_seconds"),
+            json.dumps(video, ensure_ascii=False),
+        )
+
+    def upsert_videos(self, videos: Iterable[Dict[str, Any]], video_type: str, channel_id: Optional[str] = None) -> int:
+        """Bulk insert or update records in one transaction; an existing local_path is kept."""
+        rows = [self._row(video, video_type, channel_id) for video in videos]
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                INSERT INTO videos (video_id, id, title, title_hash, channel_id, type, local_path,
+                                    published_date, duration_seconds, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET
+                    id = COALESCE(excluded.id, videos.id),
+                    title = excluded.title,
+                    title_hash = excluded.title_hash,
+                    channel_id = COALESCE(excluded.channel_id, videos.channel_id),
+                    type = excluded.type,
+                    local_path = COALESCE(excluded.local_path, videos.local_path),
+                    published_date = excluded.published_date,
+                    duration_seconds = excluded.duration_seconds,
+                    data = excluded.data
+            """, rows)
+        return len(rows)
+
+    def upsert_channel(self, channel_id: str, channel_title: str = None, last_updated: str = None):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO channels (channel_id, channel_title, last_updated) VALUES (?, ?, ?)
+                ON CONFLICT(channel_id) DO UPDATE SET
+                    channel_title = COALESCE(excluded.channel_title, channels.channel_title),
+                    last_updated = COALESCE(excluded.last_updated, channels.last_updated)
+            """, (channel_id, channel_title, last_updated))
+
+    def get_channel(self, channel_id: str) -> Optional[Dict[str, Any]]:
+        row = self._fetchone("SELECT * FROM channels WHERE channel_id = ?", (channel_id,))
+        return dict(row) if row else None
+
+    def watermark(self, video_type: str, channel_id: str) -> Optional[str]:
+        """publishedAfter of the next fetch of this channel and type, None before the first complete fetch."""
+        row = self._fetchone("SELECT published_after FROM fetch_watermarks WHERE channel_id = ? AND type = ?",
+                             (channel_id, video_type))
+        return row["published_after"] if row else None
+
+    def set_watermark(self, video_type: str, channel_id: str, published_after: str):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT INTO fetch_watermarks (channel_id, type, published_after) VALUES (?, ?, ?)
+                ON CONFLICT(channel_id, type) DO UPDATE SET published_after = excluded.published_after
+            """, (channel_id, video_type, published_after))
+
+    def import_json(self, json_file: str) -> int:
+        """Load a fetcher output file (youtube_streams.json, youtube_highlights.json, ...)."""
+        path = os.path.join(os.path.dirname(__file__), "..", "data", json_file)
+        with open(path, 'r', encoding='utf-8') as f:
+            file_data = json.load(f)
+
+        for key, video_type in LIST_KEYS.items():
+            if key in file_data:
+                channel_id = file_data.get("channel_id")
+                if channel_id:
+                    self.upsert_channel(channel_id, file_data.get("channel_title"), file_data.get("last_updated"))
+                count = self.upsert_videos(file_data[key], video_type, channel_id)
+                logging.info(f"Imported {count} {video_type} records from {json_file}")
+                return count
+        raise ValueError(f"Invalid input file: no {', '.join(LIST_KEYS)} key found.")
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        row = self._fetchone("SELECT data, local_path FROM videos WHERE video_id = ?", (video_id,))
+        return self._record(row) if row else None
+
+    def channel_of(self, video_id: str) -> Optional[str]:
+        row = self._fetchone("SELECT channel_id FROM videos WHERE video_id = ?", (video_id,))
+        return row["channel_id"] if row else None
+
+    @staticmethod
+    def _record(row) -> Dict[str, Any]:
+        video = json.loads(row["data"])
+        if row["local_path"]:
+            video["local_path"] = row["local_path"]
+        return video
+
+    def find_by_title_hash(self, hashed_title: str, video_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        query = "SELECT data, local_path FROM videos WHERE title_hash = ?"
+        params = [hashed_title]
+        if video_type:
+            query += " AND type = ?"
+            params.append(video_type)
+        # Same title under several ids (re-uploads): always the earliest published, as in Deduplication
+        row = self._fetchone(query + " ORDER BY published_date IS NULL, published_date, video_id LIMIT 1", params)
+        return self._record(row) if row else None
+
+    def find_by_title(self, title: str, video_type: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return self.find_by_title_hash(title_key(title), video_type)
+
+    def _select(self, video_type: str, channel_id: Optional[str] = None, published_after: Optional[str] = None,
+                published_before: Optional[str] = None, local_only: bool = False) -> List[sqlite3.Row]:
+        query = "SELECT data, local_path FROM videos WHERE type = ?"
+        params: List[Any] = [video_type]
+        if channel_id:
+            query += " AND channel_id = ?"
+            params.append(channel_id)
+        if published_after:
+            query += " AND published_date >= ?"
+            params.append(published_after)
+        if published_before:
+            query += " AND published_date < ?"
+            params.append(published_before)
+        if local_only:
+            query += " AND local_path IS NOT NULL"
+        return self._fetch(query + " ORDER BY id, video_id", params)
+
+    def videos(self, video_type: str, channel_id: Optional[str] = None, published_after: Optional[str] = None,
+               published_before: Optional[str] = None, local_only: bool = False) -> List[Dict[str, Any]]:
+        """Range query over type / channel / published date, oldest id first."""
+        rows = self._select(video_type, channel_id, published_after, published_before, local_only)
+        return [self._record(row) for row in rows]
+
+    def latest_published(self, video_type: str, channel_id: Optional[str] = None) -> Optional[str]:
+        query = "SELECT MAX(published_date) FROM videos WHERE type = ?"
+        params: List[Any] = [video_type]
+        if channel_id:
+            query += " AND channel_id = ?"
+            params.append(channel_id)
+        return self._fetchone(query, params)[0]
+
+    def max_id(self, video_type: str) -> int:
+        return self._fetchone("SELECT COALESCE(MAX(id), 0) FROM videos WHERE type = ?", (video_type,))[0]
+
+    def known_ids(self, video_ids: Iterable[str]) -> set:
+        video_ids = list(video_ids)
+        known = set()
+        for start in range(0, len(video_ids), 500):
+            chunk = video_ids[start:start + 500]
+            rows = self._fetch(f"SELECT video_id FROM videos WHERE video_id IN ({','.join('?' * len(chunk))})", chunk)
+            known.update(row["video_id"] for row in rows)
+        return known
+
+    def set_local_path(self, video_id: str, local_path: Optional[str]):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE videos SET local_path = ? WHERE video_id = ?", (local_path, video_id))
+
+    def infos(self, video_type: str) -> List[Dict[str, Any]]:
+        """Downloaded videos in the same shape as the "infos" list written by InitMatchInfo."""
+        return [{
+            "id": video.get("id"),
+            "video_id": video["video_id"],
+            "title": video["title"],
+            "url": video.get("video_url") or video.get("url"),
+            "local_path": video["local_path"],
+            "duration_seconds": video.get("duration_seconds"),
+            "published_date": video.get("published_date"),
+            "definition": video.get("definition"),
+            "view_count": video.get("view_count"),
+            "like_count": video.get("like_count"),
+            "comment_count": video.get("comment_count"),
+            "tags": video.get("tags", []),
+        } for video in self.videos(video_type, local_only=True)]
+
+    def export_json(self, video_type: str, output_file: str, channel_id: Optional[str] = None) -> Dict[str, Any]:
+        """Write the fetcher-compatible JSON file for one type, for tools that still read the files."""
+        list_key = next(key for key, value in LIST_KEYS.items() if value == video_type)
+        channel = self.get_channel(channel_id) if channel_id else None
+        videos = [json.loads(row["data"]) for row in self._select(video_type, channel_id)]
+        output_data = {
+            "channel_id": channel_id,
+            "channel_title": channel["channel_title"] if channel else "",
+            "last_updated": (channel or {}).get("last_updated") or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            TOTAL_KEYS[video_type]: len(videos),
+            list_key: videos,
+        }
+
+        output_path = os.path.join(os.path.dirname(__file__), "..", "data", output_file)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, ensure_ascii=False, indent=2)
+        return output_data
+
+
+def main():
+    try:
+        catalog = Catalog()
+        for json_file in ["youtube_streams.json", "youtube_highlights.json", "youtube_shorts.json"]:
+            catalog.import_json(json_file)
+        catalog.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
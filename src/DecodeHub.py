@@ -0,0 +1,404 @@
+import os
+import json
+import queue
+import logging
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.editor import VideoFileClip
+
+from DurationProcessing import VideoTimeCutter, resize_to_width
+from AudioProcessing import ANALYSIS_SAMPLE_RATE, EXCITEMENT_COLUMNS, excitement_envelope
+from FrameProcessing import ShardWriter, encode_jpeg
+from Instrumentation import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+class ConsumerStream:
+    """Bounded queue between the decoder and one consumer, iterated as (t, data) items."""
+
+    _END = object()
+
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def put(self, item):
+        # Blocks while the consumer is maxsize items behind: this is the backpressure
+        self.queue.put(item)
+
+    def close(self):
+        self.queue.put(self._END)
+
+    def __iter__(self) -> Iterator[Tuple[float, Any]]:
+        while not self.closed:
+            item = self.queue.get()
+            if item is self._END:
+                self.closed = True
+                return
+            yield item
+
+    def drain(self):
+        for _ in self:
+            pass
+
+
+class Consumer(ABC):
+    """Something that wants a video's frames (kind "video", sampled at fps) or its audio (kind "audio").
+
+    consume() receives an iterator of (t, frame) or (t, samples) and returns the result.
+    Frames are shared between consumers and read-only.
+    """
+
+    kind = "video"
+    fps = 1.0
+
+    def sample_times(self, duration: float) -> np.ndarray:
+        """Times (seconds) of the frames this consumer receives; every 1 / fps by default."""
+        return np.arange(0, duration, 1.0 / self.fps)
+
+    @abstractmethod
+    def consume(self, items: Iterator[Tuple[float, Any]]) -> Any:
+        ...
+
+
+class PitchRatioConsumer(Consumer):
+    """Pitch ratio per sample and the first/last football sample, as in VideoTimeCutter.process_single_video.
+
+    Samples every 1 / fps by default, or at the given times (the cutter's own grid).
+    """
+
+    def __init__(self, cutter: VideoTimeCutter, fps: float = 1.0, batch_size: int = 256,
+                 sample_times: Optional[np.ndarray] = None):
+        self.cutter = cutter
+        self.fps = fps
+        self.batch_size = batch_size
+        self._sample_times = sample_times
+
+    def sample_times(self, duration: float) -> np.ndarray:
+        if self._sample_times is not None:
+            return self._sample_times
+        return super().sample_times(duration)
+
+    def consume(self, items):
+        times, ratios, batch = [], [], []
+        for t, frame in items:
+            times.append(t)
+            batch.append(resize_to_width(frame, self.cutter.analysis_width))
+            if len(batch) == self.batch_size:
+                ratios.append(self.cutter.green_ratios(np.stack(batch)))
+                batch = []
+        if batch:
+            ratios.append(self.cutter.green_ratios(np.stack(batch)))
+
+        times = np.array(times)
+        ratios = np.concatenate(ratios) if ratios else np.empty(0)
+        football = np.flatnonzero(ratios > self.cutter.green_threshold)
+        return {
+            "times": times,
+            "ratios": ratios,
+            "start": float(times[football[0]]) if len(football) else None,
+            "end": float(times[football[-1]]) if len(football) else None,
+        }
+
+
+class SceneChangeConsumer(Consumer):
+    """Timestamps where VideoTimeCutter.detect_scene_change fires between consecutive samples."""
+
+    def __init__(self, cutter: VideoTimeCutter, fps: float = 2.0, threshold: float = 30):
+        self.cutter = cutter
+        self.fps = fps
+        self.threshold = threshold
+
+    def consume(self, items):
+        changes, previous = [], None
+        for t, frame in items:
+            small = resize_to_width(frame, self.cutter.analysis_width)
+            if previous is not None and self.cutter.detect_scene_change(previous, small, self.threshold):
+                changes.append(round(float(t), 3))
+            previous = small
+        return changes
+
+
+class FrameExportConsumer(Consumer):
+    """Same shards and <video_id>.index.json as FrameProcessing.export_video_frames."""
+
+    def __init__(self, video_id: str, output_folder: str, fps: float = 1.0, width: Optional[int] = None,
+                 quality: int = 90, max_shard_bytes: int = 1 << 30):
+        self.video_id = video_id
+        self.output_folder = output_folder
+        self.fps = fps
+        self.width = width
+        self.quality = quality
+        self.max_shard_bytes = max_shard_bytes
+
+    def consume(self, items):
+        os.makedirs(self.output_folder, exist_ok=True)
+        writer = ShardWriter(self.output_folder, self.video_id, self.max_shard_bytes)
+        index = []
+        try:
+            for t, frame in items:
+                data = encode_jpeg(resize_to_width(frame, self.width), self.quality)
+                shard, offset, size = writer.write(f"{self.video_id}/{int(round(t * 1000)):010d}.jpg", data)
+                index.append({"timestamp": round(t, 3), "shard": shard, "offset": offset, "size": size})
+        finally:
+            writer.close()
+
+        index_path = os.path.join(self.output_folder, f"{self.video_id}.index.json")
+        with open(index_path, 'w', encoding='utf-8') as f:
+            json.dump({"video_id": self.video_id, "fps": self.fps, "width": self.width, "frames": index}, f)
+        return index_path
+
+
+class AudioEnvelopeConsumer(Consumer):
+    """Excitement envelope written as <video_id>.excitement.npz, like save_excitement_envelope."""
+
+    kind = "audio"
+
+    def __init__(self, video_id: str, output_folder: str, sample_rate: int = ANALYSIS_SAMPLE_RATE):
+        self.video_id = video_id
+        self.output_folder = output_folder
+        self.sample_rate = sample_rate
+
+    def consume(self, items):
+        features = excitement_envelope((samples for _, samples in items), self.sample_rate)
+        os.makedirs(self.output_folder, exist_ok=True)
+        output_path = os.path.join(self.output_folder, f"{self.video_id}.excitement.npz")
+        np.savez(output_path, video_id=self.video_id, columns=EXCITEMENT_COLUMNS, features=features)
+        return output_path
+
+
+class DecodeHub:
+    """Decodes one video once and fans frames and audio chunks out to registered consumers.
+
+    Each consumer runs in its own thread behind a ConsumerStream of queue_size items, so a
+    slow consumer stalls the decoder instead of letting frames pile up in memory. Video
+    frames are decoded with a single VideoCapture pass; only the union of the consumers'
+    sample times is converted to BGR. Audio is decoded by one ffmpeg process to mono PCM.
+    """
+
+    def __init__(self, video_path: str, queue_size: int = 32, sample_rate: int = ANALYSIS_SAMPLE_RATE,
+                 audio_chunk_seconds: float = 10.0):
+        self.video_path = video_path
+        self.queue_size = queue_size
+        self.sample_rate = sample_rate
+        self.audio_chunk_seconds = audio_chunk_seconds
+        self.consumers: Dict[str, Consumer] = {}
+        self.errors: Dict[str, str] = {}
+
+    def register(self, name: str, consumer: Consumer) -> "DecodeHub":
+        if consumer.kind not in ("video", "audio"):
+            raise ValueError(f"Unknown consumer kind: {consumer.kind}")
+        self.consumers[name] = consumer
+        return self
+
+    def _decode_video(self, streams: Dict[str, ConsumerStream]):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise IOError(f"Cannot open video: {self.video_path}")
+
+        decoded = 0
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            duration = frame_count / fps
+
+            # Frame index -> streams that sample it, mapped like iter_sampled_frames
+            schedule: Dict[int, List[ConsumerStream]] = {}
+            for name, stream in streams.items():
+                targets = np.round(np.asarray(self.consumers[name].sample_times(duration)) * fps).astype(np.int64)
+                if frame_count > 0:
+                    targets = np.minimum(targets, frame_count - 1)
+                for idx in np.unique(targets):
+                    schedule.setdefault(int(idx), []).append(stream)
+            last = max(schedule, default=-1)
+
+            frame_idx = 0
+            while frame_idx <= last:
+                if not cap.grab():
+                    break
+                decoded += 1
+                targets = schedule.get(frame_idx)
+                if targets:
+                    ok, frame = cap.retrieve()
+                    if ok:
+                        frame.flags.writeable = False
+                        for stream in targets:
+                            stream.put((frame_idx / fps, frame))
+                frame_idx += 1
+        finally:
+            cap.release()
+            metrics.count("frames_decoded", decoded)
+
+    def _decode_audio(self, streams: Dict[str, ConsumerStream]):
+        process = subprocess.Popen(
+            [get_setting("FFMPEG_BINARY"), "-v", "error", "-i", self.video_path, "-vn", "-map", "0:a:0",
+             "-ac", "1", "-ar", str(self.sample_rate), "-f", "s16le", "-"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        chunk_bytes = int(self.audio_chunk_seconds * self.sample_rate) * 2
+        position = 0
+        try:
+            while True:
+                data = process.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                samples = np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2').astype(np.float32) / 32768.0
+                # Blocking puts also throttle ffmpeg through the pipe
+                for stream in streams.values():
+                    stream.put((position / self.sample_rate, samples))
+                position += len(samples)
+        finally:
+            process.stdout.close()
+            stderr = process.stderr.read().decode(errors='replace').strip()
+            if process.wait() != 0:
+                raise RuntimeError(stderr)
+
+    def _feed(self, kind: str, decode, streams: Dict[str, ConsumerStream]):
+        try:
+            if streams:
+                decode(streams)
+        except Exception as e:
+            logging.error(f"Error decoding {kind} of {self.video_path}: {str(e)}")
+            self.errors[f"{kind}_decode"] = str(e)
+        finally:
+            for stream in streams.values():
+                stream.close()
+
+    def run(self) -> Dict[str, Any]:
+        """Run all consumers over one decode; returns {name: result} of those that succeeded."""
+        streams = {name: ConsumerStream(self.queue_size) for name in self.consumers}
+        results: Dict[str, Any] = {}
+
+        def work(name, consumer, stream):
+            try:
+                results[name] = consumer.consume(iter(stream))
+            except Exception as e:
+                logging.error(f"Consumer {name} failed on {self.video_path}: {str(e)}")
+                self.errors[name] = str(e)
+            finally:
+                # Keep reading so a failed or finished consumer never blocks the decoder
+                stream.drain()
+
+        workers = [
+            threading.Thread(target=work, args=(name, consumer, streams[name]), daemon=True)
+            for name, consumer in self.consumers.items()
+        ]
+        video_streams = {name: streams[name] for name, c in self.consumers.items() if c.kind == "video"}
+        audio_streams = {name: streams[name] for name, c in self.consumers.items() if c.kind == "audio"}
+        feeders = [
+            threading.Thread(target=self._feed, args=("video", self._decode_video, video_streams), daemon=True),
+            threading.Thread(target=self._feed, args=("audio", self._decode_audio, audio_streams), daemon=True),
+        ]
+
+        with metrics.timer("decode_hub"):
+            for thread in workers + feeders:
+                thread.start()
+            for thread in feeders + workers:
+                thread.join()
+        return results
+
+
+def match_range(video_path: str, cutter: VideoTimeCutter, sample_times: Optional[np.ndarray],
+                pitch: Optional[Dict[str, Any]]) -> Tuple[float, float]:
+    """Cut range chosen exactly as VideoTimeCutter.process_single_video does.
+
+    Boundary bisection and the proxy cache are used as in the cutter; otherwise pitch holds
+    the ratios at the cutter's sample_times, read from the hub's decode.
+    """
+    if cutter.boundary_precision is not None:
+        with metrics.timer("decode"):
+            boundaries = cutter.find_match_boundaries(video_path, precision=cutter.boundary_precision)
+        return boundaries["start"], boundaries["end"]
+    if cutter.proxy_cache is not None:
+        times, ratios = cutter.proxy_green_ratios(video_path, sample_times)
+    elif pitch is not None:
+        times, ratios = pitch["times"], pitch["ratios"]
+    else:
+        raise RuntimeError("No pitch ratios")
+    start_idx, end_idx = cutter.football_range((ratios > cutter.green_threshold).tolist())
+    return float(times[start_idx]), float(times[end_idx])
+
+
+def analyze_video(video_path: str, cutter: VideoTimeCutter, frame_folder: Optional[str] = None,
+                  feature_folder: Optional[str] = None, pitch_fps: float = 1.0, scene_fps: float = 2.0,
+                  frame_fps: float = 1.0, frame_width: Optional[int] = None) -> Dict[str, Any]:
+    """Pitch ratio, scene changes, frame export and audio envelope of one video from a single decode.
+
+    The match range (see match_range) is cut right away: by keyframes when the cutter's
+    output_mode is "copy"/"smart", otherwise re-encoded like process_single_video, so both
+    paths give the same cut. This is what VideoTimeCutter.process_batch runs when given a
+    frame or feature folder.
+    """
+    video_id = os.path.splitext(os.path.basename(video_path))[0]
+    sample_times = None
+    if cutter.boundary_precision is None:
+        # Same duration and grid as process_single_video
+        clip = VideoFileClip(video_path)
+        try:
+            sample_times = cutter.coarse_sample_times(clip.duration)
+        finally:
+            clip.close()
+
+    hub = DecodeHub(video_path)
+    # With a proxy cache the ratios come from the proxy; the decode still runs for the other consumers
+    pitch_times = sample_times if cutter.proxy_cache is None else None
+    hub.register("pitch", PitchRatioConsumer(cutter, pitch_fps, sample_times=pitch_times))
+    hub.register("scene_changes", SceneChangeConsumer(cutter, scene_fps))
+    if frame_folder:
+        hub.register("frames", FrameExportConsumer(video_id, frame_folder, frame_fps, frame_width))
+    if feature_folder:
+        hub.register("audio_envelope", AudioEnvelopeConsumer(video_id, feature_folder))
+
+    with metrics.video(video_id, task="analyze") as scope:
+        results = hub.run()
+        try:
+            start, end = match_range(video_path, cutter, sample_times, results.get("pitch"))
+            results["range"] = {"start": start, "end": end}
+        except Exception as e:
+            logging.error(f"Error finding the match range of {video_path}: {str(e)}")
+            hub.errors["range"] = str(e)
+
+        if "range" in results:
+            output_path = os.path.join(cutter.output_folder, os.path.basename(video_path))
+            try:
+                if cutter.trimmer is not None:
+                    with metrics.timer("cut"):
+                        results["cut"] = cutter.trimmer.trim(video_path, output_path, start, end,
+                                                             exact=cutter.output_mode == "smart")
+                    metrics.count("bytes_written", os.path.getsize(output_path))
+                else:
+                    clip = VideoFileClip(video_path)
+                    try:
+                        cutter.write_subclip(clip, output_path, start, end)
+                    finally:
+                        clip.close()
+                    results["cut"] = output_path
+            except Exception as e:
+                logging.error(f"Error cutting {video_path}: {str(e)}")
+                hub.errors["cut"] = str(e)
+        scope["status"] = "failed" if hub.errors else "ok"
+    results["errors"] = hub.errors
+    return results
+
+
+def main():
+    try:
+        input_folder = "F:/processed_original"
+        cutter = VideoTimeCutter(input_folder, "F:/test", output_mode="copy")
+        cutter.process_batch(num_workers=2, frame_folder="F:/frame", feature_folder="F:/audio_features")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
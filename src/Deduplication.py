@@ -0,0 +1,266 @@
+import os
+import json
+import logging
+import threading
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from DurationProcessing import iter_sampled_frames
+from Catalog import Catalog
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi')
+HASH_BITS = 64
+
+
+def dhash(frame: np.ndarray) -> int:
+    """64-bit difference hash: sign of the horizontal gradient on a 9×8 grayscale thumbnail."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def pack_signature(hashes: List[int]) -> int:
+    """Concatenate the frame hashes into one integer, so the Hamming distance of two
+    signatures is the sum of the per-frame distances."""
+    key = 0
+    for value in hashes:
+        key = (key << HASH_BITS) | value
+    return key
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHamming:
+    """Multi-index hashing over Hamming distance (Norouzi et al.).
+
+    Keys are cut into m substrings of substring_bits, each indexed in its own table. Two
+    keys within radius r have a substring differing in at most s = r // m bits (pigeonhole);
+    more precisely, at most r // (s + 1) substrings can differ in more than s bits, so at
+    least m - r // (s + 1) of them are within s. A query looks up the s-bit neighbourhood of
+    every substring, keeps the keys found in enough tables, and verifies only those on the
+    full key. A BK-tree cannot prune at the radius used for signatures (a sixth of the bits).
+    """
+
+    def __init__(self, key_bits: int, substring_bits: int = 12):
+        self.substring_bits = substring_bits
+        self.shifts = list(range(0, key_bits, substring_bits))
+        self.keys: List[int] = []
+        self.items: List[Any] = []
+        self._substrings: List[List[int]] = []
+        # Per table, key indices sorted by substring and where each substring value starts
+        self._members: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    def add(self, key: int, item: Any):
+        mask = (1 << self.substring_bits) - 1
+        self.keys.append(key)
+        self.items.append(item)
+        self._substrings.append([(key >> shift) & mask for shift in self.shifts])
+        self._members = None
+
+    def _build(self):
+        substrings = np.array(self._substrings, dtype=np.int64).reshape(len(self.keys), len(self.shifts)).T
+        self._members = np.argsort(substrings, axis=1, kind='stable')
+        values = np.take_along_axis(substrings, self._members, axis=1)
+        bounds = np.arange((1 << self.substring_bits) + 1)
+        self._offsets = np.stack([np.searchsorted(row, bounds) for row in values])
+
+    @staticmethod
+    def flip_masks(width: int, bits: int) -> np.ndarray:
+        """Every mask of width bits with at most `bits` bits set."""
+        return np.array([
+            sum(1 << position for position in positions)
+            for count in range(min(bits, width) + 1)
+            for positions in combinations(range(width), count)
+        ], dtype=np.int64)
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, Any]]:
+        if not self.keys:
+            return []
+        if self._members is None:
+            self._build()
+        num_tables = len(self.shifts)
+        bits = radius // num_tables
+        min_hits = num_tables - radius // (bits + 1)
+
+        # Bucket ranges of the s-bit neighbourhood of every substring
+        query = np.array([(key >> shift) & ((1 << self.substring_bits) - 1) for shift in self.shifts])
+        neighbours = query[:, None] ^ self.flip_masks(self.substring_bits, bits)[None, :]
+        rows = np.arange(num_tables)[:, None]
+        starts = self._offsets[rows, neighbours].ravel()
+        lengths = self._offsets[rows, neighbours + 1].ravel() - starts
+        tables = np.repeat(np.broadcast_to(rows, neighbours.shape).ravel(), lengths)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        hits = np.bincount(self._members[tables, positions], minlength=len(self.keys))
+
+        results = []
+        for index in np.flatnonzero(hits >= max(min_hits, 1)):
+            distance = hamming(key, self.keys[index])
+            if distance <= radius:
+                results.append((distance, self.items[index]))
+        return results
+
+
+class DuplicateIndex:
+    """Perceptual signatures of local videos and the clusters of near-duplicates among them.
+
+    A signature is num_frames dHashes sampled at the same relative positions of each
+    video, so re-uploads and re-encodes of the same stream land within max_bit_distance
+    bits per frame. Signatures are cached in data/<hash_file> and recomputed only when the
+    file changes. Each cluster is collapsed to one canonical video_id: the earliest
+    published when a Catalog is given, otherwise the smallest id.
+    """
+
+    def __init__(self, hash_file: str = "video_hashes.json", duplicates_file: str = "duplicates.json",
+                 num_frames: int = 16, max_bit_distance: int = 10, max_duration_delta: float = 0.02,
+                 catalog: Optional[Catalog] = None, num_workers: int = 4):
+        data_folder = os.path.join(os.path.dirname(__file__), "..", "data")
+        self.hash_path = os.path.join(data_folder, hash_file)
+        self.duplicates_path = os.path.join(data_folder, duplicates_file)
+        self.num_frames = num_frames
+        self.max_bit_distance = max_bit_distance
+        # Relative duration difference above which two videos are never duplicates
+        self.max_duration_delta = max_duration_delta
+        self.catalog = catalog
+        self.num_workers = num_workers
+        self._lock = threading.Lock()
+        self.signatures: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.hash_path):
+            with open(self.hash_path, 'r', encoding='utf-8') as f:
+                self.signatures = json.load(f)
+
+    def signature(self, video_path: str) -> Dict[str, Any]:
+        video_id = os.path.splitext(os.path.basename(video_path))[0]
+        stat = os.stat(video_path)
+        cached = self.signatures.get(video_id)
+        if cached and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime \
+                and len(cached["hashes"]) == self.num_frames:
+            return cached
+
+        cap = cv2.VideoCapture(video_path)
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / (cap.get(cv2.CAP_PROP_FPS) or 25.0)
+        cap.release()
+        # Skip the first and last few percent, where channel intros and outros differ
+        sample_times = np.linspace(0.05, 0.95, self.num_frames) * duration
+        hashes = [dhash(frame) for _, frame in iter_sampled_frames(video_path, sample_times, width=160)]
+        if len(hashes) < self.num_frames:
+            raise IOError(f"Only {len(hashes)}/{self.num_frames} frames decoded from {video_path}")
+
+        signature = {"hashes": [f"{value:016x}" for value in hashes], "duration": duration,
+                     "size": stat.st_size, "mtime": stat.st_mtime}
+        with self._lock:
+            self.signatures[video_id] = signature
+        return signature
+
+    def index_folders(self, folders: List[str]) -> int:
+        """Compute the missing or stale signatures of every video in folders."""
+        video_paths = [
+            os.path.join(folder, file) for folder in folders
+            for file in sorted(os.listdir(folder)) if file.endswith(VIDEO_EXTENSIONS)
+        ]
+
+        def run(video_path):
+            try:
+                self.signature(video_path)
+                return True
+            except Exception as e:
+                logging.error(f"Error hashing {video_path}: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            indexed = sum(executor.map(run, video_paths))
+
+        tmp_path = f"{self.hash_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.signatures, f)
+        os.replace(tmp_path, self.hash_path)
+        logging.info(f"Hashed {indexed}/{len(video_paths)} videos")
+        return indexed
+
+    def _published(self, video_id: str) -> str:
+        video = self.catalog.get(video_id) if self.catalog is not None else None
+        return (video or {}).get("published_date") or "9999"
+
+    def clusters(self) -> List[List[str]]:
+        """Groups of near-duplicate video_ids (singletons left out), canonical id first."""
+        index = MultiIndexHamming(HASH_BITS * self.num_frames)
+        keys = {}
+        for video_id, signature in self.signatures.items():
+            if len(signature["hashes"]) != self.num_frames:
+                continue
+            keys[video_id] = pack_signature([int(value, 16) for value in signature["hashes"]])
+            index.add(keys[video_id], video_id)
+
+        # Union-find over every pair the index reports within the radius
+        parent = {video_id: video_id for video_id in keys}
+
+        def find(video_id):
+            while parent[video_id] != video_id:
+                parent[video_id] = parent[parent[video_id]]
+                video_id = parent[video_id]
+            return video_id
+
+        radius = self.max_bit_distance * self.num_frames
+        for video_id, key in keys.items():
+            duration = self.signatures[video_id]["duration"]
+            for _, other in index.search(key, radius):
+                other_duration = self.signatures[other]["duration"]
+                if other == video_id or abs(duration - other_duration) > self.max_duration_delta * max(duration, 1.0):
+                    continue
+                parent[find(other)] = find(video_id)
+
+        groups: Dict[str, List[str]] = {}
+        for video_id in keys:
+            groups.setdefault(find(video_id), []).append(video_id)
+        return [
+            sorted(group, key=lambda video_id: (self._published(video_id), video_id))
+            for group in groups.values() if len(group) > 1
+        ]
+
+    def save_duplicates(self) -> Dict[str, str]:
+        """Write {duplicate video_id: canonical video_id} and the clusters to data/<duplicates_file>."""
+        clusters = self.clusters()
+        duplicates = {video_id: group[0] for group in clusters for video_id in group[1:]}
+        tmp_path = f"{self.duplicates_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"total_clusters": len(clusters), "duplicates": duplicates, "clusters": clusters},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.duplicates_path)
+        logging.info(f"Found {len(duplicates)} duplicates in {len(clusters)} clusters")
+        return duplicates
+
+
+def load_duplicates(duplicates_file: str = "duplicates.json") -> Dict[str, str]:
+    """{duplicate video_id: canonical video_id} written by DuplicateIndex.save_duplicates, empty if missing."""
+    duplicates_path = os.path.join(os.path.dirname(__file__), "..", "data", duplicates_file)
+    if not os.path.exists(duplicates_path):
+        return {}
+    with open(duplicates_path, 'r', encoding='utf-8') as f:
+        return json.load(f)["duplicates"]
+
+
+def main():
+    try:
+        catalog = Catalog()
+        index = DuplicateIndex(catalog=catalog)
+        index.index_folders(["F:/processed_original", "F:/processed_highlight"])
+        index.save_duplicates()
+        catalog.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,222 @@ import numpy as np
 from moviepy.editor import VideoFileClip
 from sklearn.cluster import KMeans
 import os
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from tqdm import tqdm
+import json
+from KeyframeTrimmer import KeyframeTrimmer
+from Instrumentation import metrics
+
+# Ngưỡng HSV của màu sân cỏ (theo quy ước OpenCV: H trong [0, 180])
+LOWER_GREEN = np.array([35, 30, 30])
+UPPER_GREEN = np.array([85, 255, 255])
+GREEN_RATIO_THRESHOLD = 0.3
+# Sai số tối đa cho phép giữa green_ratios (thu nhỏ + bảng tra) và is_football_scene
+GREEN_RATIO_TOLERANCE = 0.01
+
+
+def build_pitch_lut():
+    """Tạo bảng tra chính xác cho cả 2^24 màu sang cờ 'sân cỏ' (bỏ qua bước đổi sang HSV).
+
+    Chỉ số là B | (G << 8) | (R << 16), tức giá trị uint32 little-endian của pixel BGR thêm
+    một byte 0. Mỗi màu được đổi sang HSV đúng như is_football_scene nên kết quả theo
+    từng pixel trùng khớp hoàn toàn, không có sai số lượng tử hóa.
+    """
+    idx = np.arange(1 << 24, dtype=np.uint32)
+    bgr = np.stack([idx & 0xFF, (idx >> 8) & 0xFF, idx >> 16], axis=-1).astype(np.uint8).reshape(4096, 4096, 3)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    return cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN).reshape(-1) > 0
+
+
+def resize_to_width(frame, width):
+    """Thu nhỏ frame về chiều rộng cho trước, giữ nguyên tỷ lệ khung hình"""
+    if width is None or frame.shape[1] <= width:
+        return frame
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def iter_sampled_frames(video_path, sample_times, width=None, seek_start=False):
+    """Giải mã video một lượt từ đầu đến cuối và trả về (t, frame) tại các thời điểm lấy mẫu.
+
+    Các frame không cần phân tích chỉ được grab() (không chuyển sang BGR), không có thao
+    tác seek nào, và tại mỗi thời điểm chỉ giữ một frame đã thu nhỏ trong bộ nhớ.
+    Với seek_start=True, seek đúng một lần tới mẫu đầu tiên (dùng khi xử lý theo đoạn).
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video: {video_path}")
+
+    decoded, seeks = 0, 0
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        targets = np.round(np.asarray(sample_times) * fps).astype(np.int64)
+        # np.linspace(0, duration, n) đặt mẫu cuối đúng bằng số frame: kẹp về frame cuối cùng
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count > 0:
+            targets = np.minimum(targets, frame_count - 1)
+        targets = np.unique(targets)
+        if len(targets) == 0:
+            return
+
+        frame_idx = 0
+        if seek_start and targets[0] > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(targets[0]))
+            frame_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+            seeks += 1
+
+        for target in targets:
+            # Bỏ qua các frame nằm giữa hai thời điểm lấy mẫu
+            while frame_idx < target:
+                if not cap.grab():
+                    return
+                frame_idx += 1
+                decoded += 1
+
+            if not cap.grab():
+                return
+            ok, frame = cap.retrieve()
+            frame_idx += 1
+            decoded += 1
+            if ok:
+                yield target / fps, resize_to_width(frame, width)
+    finally:
+        cap.release()
+        # Đếm một lần khi kết thúc thay vì mỗi frame
+        metrics.count("frames_decoded", decoded)
+        metrics.count("seeks", seeks)
+
+
+class FrameProbe:
+    """Đọc từng frame tại thời điểm bất kỳ (có seek) và đếm số lần đọc.
+
+    Mỗi lần seek, decoder còn giải mã thêm các frame từ keyframe trước đó mà OpenCV
+    không cho biết, nên frames_read là cận dưới của số frame thực sự được giải mã.
+    """
+
+    def __init__(self, video_path, cutter):
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video: {video_path}")
+        self.cutter = cutter
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.duration = self.cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+        self.frames_read = 0
+        self._cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cap.release()
+
+    def ratio_at(self, t):
+        key = round(t, 3)
+        if key not in self._cache:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+            ok, frame = self.cap.read()
+            metrics.count("seeks")
+            if not ok:
+                raise IOError(f"Cannot read frame at {t:.2f}s")
+            self.frames_read += 1
+            metrics.count("probe_reads")
+            with metrics.timer("classify"):
+                self._cache[key] = float(self.cutter.green_ratios(resize_to_width(frame, self.cutter.analysis_width))[0])
+        return self._cache[key]
+
+    def is_football(self, t):
+        return self.ratio_at(t) > self.cutter.green_threshold
+
+    def bisect(self, lo, hi, precision, rising):
+        """Chia đôi [lo, hi] tới khi độ rộng <= precision; rising=True nghĩa là lo không phải, hi là bóng đá"""
+        while hi - lo > precision:
+            mid = (lo + hi) / 2
+            try:
+                football = self.is_football(mid)
+            except IOError:
+                # Không đọc được (thường là sát cuối file): coi như không phải bóng đá
+                football = False
+            if football == rising:
+                hi = mid
+            else:
+                lo = mid
+        return hi if rising else lo
+
+
+class ProxyProbe(FrameProbe):
+    """FrameProbe đọc frame gần nhất trong proxy phân tích (memmap) thay vì seek trong file gốc.
+
+    Độ chính xác của bisect bị giới hạn bởi 1 / fps của proxy.
+    """
+
+    def __init__(self, proxy, cutter):
+        self.proxy = proxy
+        self.cutter = cutter
+        self.duration = proxy.duration
+        self.frames_read = 0
+        self._cache = {}
+
+    def __exit__(self, *exc):
+        pass
+
+    def ratio_at(self, t):
+        key = round(t, 3)
+        if key not in self._cache:
+            idx = int(self.proxy.nearest(t))
+            # Frame đọc từ proxy (memmap), không phải seek trong file gốc
+            self.frames_read += 1
+            metrics.count("probe_reads")
+            with metrics.timer("classify"):
+                self._cache[key] = float(self.cutter.green_ratios(self.proxy.frames[idx])[0])
+        return self._cache[key]
 
 
 class VideoTimeCutter:
-    def __init__(self, input_folder, output_folder):
+    _pitch_lut = None
+
+    def __init__(self, input_folder, output_folder, num_samples=20, analysis_width=96,
+                 green_threshold=GREEN_RATIO_THRESHOLD, boundary_precision=None, output_mode="reencode",
+                 num_shards=1, verbose=False, metrics_file=None, proxy_cache=None, duplicates=None):
         self.input_folder = input_folder
         self.output_folder = output_folder
+        # In từng bước xử lý (tắt mặc định); số liệu thời gian ghi qua Instrumentation
+        self.verbose = verbose
+        if metrics_file:
+            metrics.configure(metrics_file)
+        # AnalysisProxyCache (tùy chọn): phân tích trên proxy độ phân giải thấp đã giải mã sẵn
+        self.proxy_cache = proxy_cache
+        # {video_id: canonical video_id} của Deduplication: các bản trùng bị bỏ qua trong process_batch
+        self.duplicates = duplicates or {}
+        # Số đoạn thời gian phân tích song song trong một video (1 = tuần tự)
+        self.num_shards = num_shards
+        # "reencode": libx264 như cũ, "copy": cắt theo keyframe không encode lại,
+        # "smart": chỉ encode lại phần GOP dở dang ở hai đầu để cắt chính xác
+        if output_mode not in ("reencode", "copy", "smart"):
+            raise ValueError(f"Unknown output mode: {output_mode}")
+        self.output_mode = output_mode
+        self.trimmer = KeyframeTrimmer() if output_mode != "reencode" else None
+        self.cut_reports = {}
+        self.num_samples = num_samples
+        # Nếu đặt (giây), dùng tìm kiếm ranh giới thô-rồi-tinh thay cho lấy mẫu đều
+        self.boundary_precision = boundary_precision
+        self.analysis_width = analysis_width
+        self.green_threshold = green_threshold
         os.makedirs(output_folder, exist_ok=True)
 
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    @classmethod
+    def pitch_lut(cls):
+        """Bảng tra dùng chung cho mọi instance, chỉ tính một lần"""
+        if cls._pitch_lut is None:
+            cls._pitch_lut = build_pitch_lut()
+        return cls._pitch_lut
+
     def detect_scene_change(self, frame1, frame2, threshold=30):
-        """Phát hiện thay đổi cảnh dựa trên sự khác biệt giữa các frame"""
-        diff = cv2.absdiff(frame1, frame2)
+        """Phát hiện thay đổi cảnh dựa trên sự khác biệt giữa các frame (so sánh trên ảnh thu nhỏ)"""
+        diff = cv2.absdiff(resize_to_width(frame1, self.analysis_width), resize_to_width(frame2, self.analysis_width))
         return np.mean(diff) > threshold
 
     def is_football_scene(self, frame):
@@ -24,14 +227,106 @@ class VideoTimeCutter:
         hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
 
         # Tìm màu xanh của sân cỏ
-        lower_green = np.array([35, 30, 30])
-        upper_green = np.array([85, 255, 255])
-        green_mask = cv2.inRange(hsv, lower_green, upper_green)
+        green_mask = cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
 
         # Tính tỷ lệ pixel màu xanh
         green_ratio = np.sum(green_mask > 0) / (frame.shape[0] * frame.shape[1])
 
-        return green_ratio > 0.3  # Ngưỡng tỷ lệ màu xanh của sân cỏ
+        return green_ratio > self.green_threshold  # Ngưỡng tỷ lệ màu xanh của sân cỏ
+
+    def green_ratios(self, frames):
+        """Tính tỷ lệ pixel sân cỏ cho cả lô frame (N×H×W×3) trong một lượt vector hóa"""
+        frames = np.asarray(frames)
+        if frames.ndim == 3:
+            frames = frames[np.newaxis]
+
+        # Thu nhỏ bằng cách lấy pixel giữa mỗi ô step×step (chỉ là view, không copy)
+        step = max(1, frames.shape[2] // self.analysis_width)
+        small = frames[:, step // 2::step, step // 2::step]
+
+        # Thêm byte thứ tư bằng 0 rồi đọc mỗi pixel như một uint32: đó chính là chỉ số bảng tra
+        padded = np.zeros(small.shape[:-1] + (4,), dtype=np.uint8)
+        padded[..., :3] = small
+        idx = padded.view('<u4')[..., 0]
+
+        return self.pitch_lut()[idx].mean(axis=(1, 2))
+
+    def is_football_scene_batch(self, frames):
+        """Phiên bản theo lô của is_football_scene, trả về mảng bool cho từng frame"""
+        return self.green_ratios(frames) > self.green_threshold
+
+    def sample_green_ratios(self, video_path, sample_times, batch_size=256, seek_start=False):
+        """Lấy mẫu tuần tự và tính tỷ lệ sân cỏ theo từng lô, bộ nhớ bị chặn bởi batch_size"""
+        times, ratios, batch = [], [], []
+        for t, frame in iter_sampled_frames(video_path, sample_times, self.analysis_width, seek_start):
+            times.append(t)
+            batch.append(frame)
+            if len(batch) == batch_size:
+                with metrics.timer("classify"):
+                    ratios.append(self.green_ratios(np.stack(batch)))
+                batch = []
+        if batch:
+            with metrics.timer("classify"):
+                ratios.append(self.green_ratios(np.stack(batch)))
+
+        return np.array(times), np.concatenate(ratios) if ratios else np.empty(0)
+
+    def proxy_green_ratios(self, video_path, sample_times):
+        """Tỷ lệ sân cỏ tại các frame proxy gần nhất với sample_times, không giải mã lại video"""
+        times, frames = self.proxy_cache.get(video_path).frames_at(sample_times)
+        with metrics.timer("classify"):
+            return times, self.green_ratios(frames)
+
+    def sample_green_ratios_sharded(self, video_path, sample_times, num_shards):
+        """Chia video thành num_shards đoạn thời gian, phân tích song song bằng process pool rồi ghép lại"""
+        shards = [shard for shard in np.array_split(np.asarray(sample_times), num_shards) if len(shard)]
+
+        # Mỗi tiến trình tự mở VideoCapture riêng và giải mã tuần tự trong đoạn của mình
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(self.sample_green_ratios, video_path, shard, 256, True) for shard in shards]
+            results = [future.result() for future in futures]
+
+        times = np.concatenate([r[0] for r in results])
+        ratios = np.concatenate([r[1] for r in results])
+        order = np.argsort(times, kind='stable')
+        return times[order], ratios[order]
+
+    def find_match_boundaries(self, video_path, coarse_samples=120, precision=1.0, min_run=2):
+        """Tìm thời điểm bắt đầu/kết thúc trận đấu: quét thô rồi chia đôi tới độ chính xác precision (giây).
+
+        Một đoạn chỉ được coi là trận đấu khi có ít nhất min_run mẫu thô liên tiếp là cảnh
+        bóng đá, để tránh một cảnh sân cỏ lẻ trong phần trước/sau trận.
+        """
+        probe = ProxyProbe(self.proxy_cache.get(video_path), self) if self.proxy_cache else FrameProbe(video_path, self)
+        with probe:
+            sample_times = np.linspace(0, probe.duration, coarse_samples, endpoint=False)
+            is_football = np.array([probe.is_football(t) for t in sample_times])
+
+            runs = np.convolve(is_football.astype(int), np.ones(min_run, dtype=int), mode='valid') == min_run
+            if not runs.any():
+                raise Exception("Không tìm thấy cảnh bóng đá nào")
+
+            start_idx = int(np.argmax(runs))
+            end_idx = len(runs) - 1 - int(np.argmax(runs[::-1])) + min_run - 1
+
+            # Tinh chỉnh điểm bắt đầu trong khoảng (mẫu không phải bóng đá, mẫu bóng đá)
+            start = sample_times[start_idx]
+            if start_idx > 0:
+                start = probe.bisect(sample_times[start_idx - 1], start, precision, rising=True)
+
+            # Tinh chỉnh điểm kết thúc trong khoảng (mẫu bóng đá, mẫu không phải bóng đá)
+            if end_idx + 1 < len(sample_times):
+                end = probe.bisect(sample_times[end_idx], sample_times[end_idx + 1], precision, rising=False)
+            else:
+                end = probe.bisect(sample_times[end_idx], probe.duration, precision, rising=False)
+
+            return {
+                "start": float(start),
+                "end": float(end),
+                "precision": precision,
+                "coarse_samples": coarse_samples,
+                "frames_read": probe.frames_read,
+            }
 
     # def process_single_video(self, video_path):
     #     """Xử lý một video và cắt phần không liên quan"""
@@ -72,111 +367,185 @@ class VideoTimeCutter:
     #     except Exception as e:
     #         return False, f"Error processing {video_path}: {str(e)}"
 
+    def coarse_sample_times(self, duration):
+        """Thời điểm lấy mẫu khi không dùng boundary_precision (dùng chung với DecodeHub.analyze_video)"""
+        return np.linspace(0, duration, self.num_samples)
+
+    @staticmethod
+    def football_range(is_football):
+        """Chỉ số mẫu bóng đá đầu tiên và cuối cùng"""
+        if True not in is_football:
+            raise Exception("Không tìm thấy cảnh bóng đá nào")
+        return is_football.index(True), len(is_football) - 1 - is_football[::-1].index(True)
+
+    def write_subclip(self, clip, output_path, start_time, end_time):
+        """Encode lại đoạn [start_time, end_time] của clip bằng libx264 (output_mode "reencode")"""
+        new_clip = clip.subclip(start_time, end_time)
+        try:
+            with metrics.timer("cut"):
+                new_clip.write_videofile(output_path, codec='libx264', audio_codec='aac',
+                                         verbose=self.verbose, logger='bar' if self.verbose else None)
+        finally:
+            new_clip.close()
+        metrics.count("bytes_written", os.path.getsize(output_path))
+
     def process_single_video(self, video_path):
-        """Xử lý một video và cắt phần không liên quan"""
+        """Xử lý một video và cắt phần không liên quan; thời gian từng bước được ghi theo video_id"""
+        video_id = os.path.splitext(os.path.basename(video_path))[0]
+        with metrics.video(video_id, task="cut") as scope:
+            # Kích thước file nguồn, không phải số byte thực sự đọc (chỉ một phần file được giải mã)
+            metrics.count("source_bytes", os.path.getsize(video_path) if os.path.exists(video_path) else 0)
+            success, message = self._process_single_video(video_path)
+            scope["status"] = "ok" if success else "failed"
+        return success, message
+
+    def _process_single_video(self, video_path):
         try:
             output_path = os.path.join(self.output_folder, os.path.basename(video_path))
-            print(f"Output path: {output_path}")
+            self.log(f"Output path: {output_path}")
 
-            print("Đang đọc video...")
+            self.log("Đang đọc video...")
             clip = VideoFileClip(video_path)
-            print(f"Đã đọc video. Độ dài: {clip.duration} giây")
+            self.log(f"Đã đọc video. Độ dài: {clip.duration} giây")
 
             # Kiểm tra xem video có đọc được không
             if clip.reader is None:
                 raise Exception("Không thể đọc video")
 
-            print("Đang lấy mẫu frames...")
-            try:
-                # Giảm số lượng frame mẫu xuống để test
-                sample_times = np.linspace(0, clip.duration, 20)  # Giảm xuống 20 frame
-                frames = []
-                for t in sample_times:
-                    try:
-                        frame = clip.get_frame(t)
-                        frames.append(frame)
-                        print(f"Đã lấy frame tại thời điểm {t:.2f}s")
-                    except Exception as e:
-                        print(f"Lỗi khi lấy frame tại {t}s: {str(e)}")
-
-                if not frames:
-                    raise Exception("Không lấy được frame nào")
-
-                print(f"Đã lấy được {len(frames)} frames")
+            if self.boundary_precision is not None:
+                self.log("Đang tìm ranh giới trận đấu...")
+                try:
+                    with metrics.timer("decode"):
+                        boundaries = self.find_match_boundaries(video_path, precision=self.boundary_precision)
+                    start_time, end_time = boundaries["start"], boundaries["end"]
+                    source = "proxy" if self.proxy_cache is not None else "seek"
+                    self.log(f"Đã đọc {boundaries['frames_read']} frames ({source}) để tìm ranh giới")
+
+                except Exception as e:
+                    self.log(f"Lỗi khi tìm ranh giới trận đấu: {str(e)}")
+                    if clip:
+                        clip.close()
+                    return False, f"Error searching match boundaries: {str(e)}"
+
+            else:
+                self.log("Đang lấy mẫu frames...")
+                try:
+                    sample_times = self.coarse_sample_times(clip.duration)
+                    # "decode" không tính thời gian của "classify" lồng bên trong (timer loại trừ)
+                    with metrics.timer("decode"):
+                        if self.proxy_cache is not None:
+                            sample_times, ratios = self.proxy_green_ratios(video_path, sample_times)
+                        elif self.num_shards > 1:
+                            sample_times, ratios = self.sample_green_ratios_sharded(video_path, sample_times, self.num_shards)
+                        else:
+                            sample_times, ratios = self.sample_green_ratios(video_path, sample_times)
+
+                    if len(ratios) == 0:
+                        raise Exception("Không lấy được frame nào")
+
+                    self.log(f"Đã lấy được {len(ratios)} frames")
+
+                except Exception as e:
+                    self.log(f"Lỗi khi lấy mẫu frames: {str(e)}")
+                    if clip:
+                        clip.close()
+                    return False, f"Error sampling frames: {str(e)}"
+
+                # Phát hiện cảnh bóng đá
+                self.log("Đang phân tích frames...")
+                try:
+                    is_football = (ratios > self.green_threshold).tolist()
+                    if self.verbose:
+                        for t, result in zip(sample_times, is_football):
+                            self.log(f"Frame tại {t:.2f}s: {'là' if result else 'không phải'} cảnh bóng đá")
+
+                    self.log(f"Kết quả phân tích: {is_football}")
+
+                    # Tìm đoạn video chính
+                    start_idx, end_idx = self.football_range(is_football)
+                    self.log(f"Đoạn video chính: từ frame {start_idx} đến frame {end_idx}")
+
+                    start_time = sample_times[start_idx]
+                    end_time = sample_times[end_idx]
+
+                except Exception as e:
+                    self.log(f"Lỗi khi phân tích frames: {str(e)}")
+                    if clip:
+                        clip.close()
+                    return False, f"Error analyzing frames: {str(e)}"
 
-            except Exception as e:
-                print(f"Lỗi khi lấy mẫu frames: {str(e)}")
-                if clip:
-                    clip.close()
-                return False, f"Error sampling frames: {str(e)}"
-
-            # Phát hiện cảnh bóng đá
-            print("Đang phân tích frames...")
             try:
-                is_football = []
-                for i, frame in enumerate(frames):
-                    try:
-                        result = self.is_football_scene(frame)
-                        is_football.append(result)
-                        print(f"Frame {i}: {'là' if result else 'không phải'} cảnh bóng đá")
-                    except Exception as e:
-                        print(f"Lỗi khi phân tích frame {i}: {str(e)}")
-
-                if not is_football:
-                    raise Exception("Không phân tích được frame nào")
-
-                print("Kết quả phân tích:", is_football)
-
-            except Exception as e:
-                print(f"Lỗi khi phân tích frames: {str(e)}")
-                if clip:
-                    clip.close()
-                return False, f"Error analyzing frames: {str(e)}"
-
-            try:
-                # Tìm đoạn video chính
-                if True not in is_football:
-                    raise Exception("Không tìm thấy cảnh bóng đá nào")
-
-                start_idx = is_football.index(True)
-                end_idx = len(is_football) - 1 - is_football[::-1].index(True)
-                print(f"Đoạn video chính: từ frame {start_idx} đến frame {end_idx}")
-
                 # Cắt video
-                start_time = sample_times[start_idx]
-                end_time = sample_times[end_idx]
-                print(f"Thời gian cắt: từ {start_time:.2f}s đến {end_time:.2f}s")
+                self.log(f"Thời gian cắt: từ {start_time:.2f}s đến {end_time:.2f}s")
 
                 # Tạo video mới
-                print("Đang tạo video mới...")
-                new_clip = clip.subclip(start_time, end_time)
-                new_clip.write_videofile(output_path, codec='libx264', audio_codec='aac')
-                print("Đã tạo xong video mới")
+                self.log("Đang tạo video mới...")
+                if self.trimmer is not None:
+                    clip.close()
+                    with metrics.timer("cut"):
+                        report = self.trimmer.trim(video_path, output_path, float(start_time), float(end_time),
+                                                   exact=self.output_mode == "smart")
+                    metrics.count("bytes_written", os.path.getsize(output_path))
+                    self.cut_reports[video_path] = report
+                    self.log(f"Đã tạo xong video mới (cắt thực tế: {report['actual_start']:.2f}s - {report['actual_end']:.2f}s)")
+                    return True, video_path
+
+                self.write_subclip(clip, output_path, start_time, end_time)
+                self.log("Đã tạo xong video mới")
 
                 clip.close()
-                new_clip.close()
 
                 return True, video_path
 
             except Exception as e:
-                print(f"Lỗi trong quá trình cắt và lưu video: {str(e)}")
+                self.log(f"Lỗi trong quá trình cắt và lưu video: {str(e)}")
                 if clip:
                     clip.close()
                 return False, f"Error in cutting and saving video: {str(e)}"
 
         except Exception as e:
-            print(f"Lỗi tổng thể: {str(e)}")
+            self.log(f"Lỗi tổng thể: {str(e)}")
             return False, f"General error: {str(e)}"
 
-    def process_batch(self, num_workers=4):
-        """Xử lý hàng loạt video sử dụng đa luồng"""
+    def analyze_single_video(self, video_path, frame_folder=None, feature_folder=None):
+        """Cắt video bằng DecodeHub: tỷ lệ sân cỏ, xuất frame và đặc trưng âm thanh từ một lượt giải mã"""
+        # Import tại chỗ vì DecodeHub phụ thuộc vào module này
+        from DecodeHub import analyze_video
+        try:
+            results = analyze_video(video_path, self, frame_folder, feature_folder)
+        except Exception as e:
+            return False, f"Error analyzing {video_path}: {str(e)}"
+
+        errors = results["errors"]
+        if "video_decode" in errors or "cut" in errors:
+            return False, f"Error analyzing {video_path}: {errors}"
+        if "range" in errors:
+            return False, f"Error analyzing frames: {errors['range']} ({video_path})"
+        if isinstance(results.get("cut"), dict):
+            self.cut_reports[video_path] = results["cut"]
+        return True, video_path
+
+    def process_batch(self, num_workers=4, frame_folder=None, feature_folder=None):
+        """Xử lý hàng loạt video sử dụng đa luồng.
+
+        Nếu có frame_folder hoặc feature_folder, mỗi video chỉ được giải mã một lần (DecodeHub)
+        để vừa cắt vừa xuất frame và đặc trưng âm thanh, thay vì giải mã riêng cho từng bước.
+        """
+        use_hub = bool(frame_folder or feature_folder)
         video_files = [f for f in os.listdir(self.input_folder) if f.endswith(('.mp4', '.mkv', '.avi'))]
+        skipped = [f for f in video_files if os.path.splitext(f)[0] in self.duplicates]
+        if skipped:
+            print(f"Skipping {len(skipped)} duplicate videos")
+            video_files = [f for f in video_files if f not in skipped]
 
         with ThreadPoolExecutor(max_workers=num_workers) as executor:
             futures = []
             for video_file in video_files:
                 video_path = os.path.join(self.input_folder, video_file)
-                futures.append(executor.submit(self.process_single_video, video_path))
+                if use_hub:
+                    futures.append(executor.submit(self.analyze_single_video, video_path, frame_folder, feature_folder))
+                else:
+                    futures.append(executor.submit(self.process_single_video, video_path))
 
             # Theo dõi tiến trình xử lý
             results = []
@@ -187,6 +556,15 @@ class VideoTimeCutter:
         successful = [r[1] for r in results if r[0]]
         failed = [r[1] for r in results if not r[0]]
 
+        # Lưu báo cáo thời điểm cắt thực tế so với yêu cầu
+        if self.cut_reports:
+            with open(os.path.join(self.output_folder, "cut_report.json"), 'w', encoding='utf-8') as f:
+                json.dump(list(self.cut_reports.values()), f, ensure_ascii=False, indent=2)
+
+        # Tổng hợp phân vị thời gian từng bước cho Prometheus (node_exporter textfile)
+        if metrics.jsonl_path:
+            metrics.write_prometheus(os.path.splitext(metrics.jsonl_path)[0] + ".prom", metrics.jsonl_path)
+
         print(f"Processed {len(successful)} videos successfully")
         print(f"Failed to process {len(failed)} videos")
         if failed:
@@ -194,14 +572,15 @@ class VideoTimeCutter:
             for f in failed:
                 print(f"- {f}")
 
-# Khởi tạo processor
-processor = VideoTimeCutter(
-    input_folder="F:/processed_original",
-    output_folder="F:/test"
-)
+if __name__ == "__main__":
+    # Khởi tạo processor
+    processor = VideoTimeCutter(
+        input_folder="F:/processed_original",
+        output_folder="F:/test"
+    )
 
-path = "F:/processed_original/cNHVkAvqkMA.mp4"
+    path = "F:/processed_original/cNHVkAvqkMA.mp4"
 
-# Xử lý tất cả video trong thư mục
-processor.process_batch(num_workers=4)  # Số luồng có thể điều chỉnh tùy theo CPU
-# processor.process_single_video(path)
\ No newline at end of file
+    # Xử lý tất cả video trong thư mục
+    processor.process_batch(num_workers=4)  # Số luồng có thể điều chỉnh tùy theo CPU
+    # processor.process_single_video(path)
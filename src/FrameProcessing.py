@@ -0,0 +1,134 @@
+import os
+import io
+import json
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from tqdm import tqdm
+from DurationProcessing import iter_sampled_frames
+
+
+class ShardWriter:
+    """Writes frames into a sequence of large tar shards (WebDataset layout) instead of one file per frame."""
+
+    def __init__(self, output_folder, prefix, max_shard_bytes=1 << 30):
+        self.output_folder = output_folder
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.shard_index = -1
+        self.shard_name = None
+        self.tar = None
+
+    def _open_next(self):
+        self.close()
+        self.shard_index += 1
+        self.shard_name = f"{self.prefix}-{self.shard_index:05d}.tar"
+        self.tar = tarfile.open(os.path.join(self.output_folder, self.shard_name), "w")
+
+    def write(self, name, data):
+        if self.tar is None or self.tar.offset >= self.max_shard_bytes:
+            self._open_next()
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        # The payload starts right after the header block(s) written by addfile
+        offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+        self.tar.addfile(info, io.BytesIO(data))
+        return self.shard_name, offset, len(data)
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+
+def encode_jpeg(frame, quality):
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return buf.tobytes()
+
+
+def export_video_frames(video_path, output_folder, fps=1.0, width=None, quality=90, num_workers=4,
+                        max_shard_bytes=1 << 30):
+    video_id = os.path.splitext(os.path.basename(video_path))[0]
+    os.makedirs(output_folder, exist_ok=True)
+
+    cap = cv2.VideoCapture(video_path)
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / (cap.get(cv2.CAP_PROP_FPS) or 25.0)
+    cap.release()
+    sample_times = np.arange(0, duration, 1.0 / fps)
+
+    writer = ShardWriter(output_folder, video_id, max_shard_bytes)
+    index = []
+    pending = deque()
+    max_pending = num_workers * 4
+
+    def flush(limit):
+        # Write finished encodes in timestamp order, keeping at most `limit` in flight
+        while len(pending) > limit:
+            t, future = pending.popleft()
+            shard, offset, size = writer.write(f"{video_id}/{int(round(t * 1000)):010d}.jpg", future.result())
+            index.append({"timestamp": round(t, 3), "shard": shard, "offset": offset, "size": size})
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for t, frame in tqdm(iter_sampled_frames(video_path, sample_times, width),
+                                 total=len(sample_times), desc=f"Exporting {video_id}"):
+                pending.append((t, executor.submit(encode_jpeg, frame, quality)))
+                flush(max_pending)
+            flush(0)
+    finally:
+        writer.close()
+
+    index_path = os.path.join(output_folder, f"{video_id}.index.json")
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump({"video_id": video_id, "fps": fps, "width": width, "frames": index}, f)
+
+    return index_path
+
+
+def read_frame(output_folder, video_id, timestamp):
+    """Read the exported frame closest to `timestamp` straight from its shard offset."""
+    with open(os.path.join(output_folder, f"{video_id}.index.json"), 'r', encoding='utf-8') as f:
+        frames = json.load(f)["frames"]
+    if not frames:
+        return None
+
+    times = np.array([entry["timestamp"] for entry in frames])
+    entry = frames[int(np.abs(times - timestamp).argmin())]
+    with open(os.path.join(output_folder, entry["shard"]), 'rb') as f:
+        f.seek(entry["offset"])
+        data = f.read(entry["size"])
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def export_all_videos(input_folder, output_folder, fps=1.0, width=None, quality=90, num_workers=4):
+    video_extensions = ['.mp4', '.avi', '.mov', '.mkv']
+
+    video_files = []
+    for root, _, files in os.walk(input_folder):
+        for file in files:
+            if any(file.lower().endswith(ext) for ext in video_extensions):
+                video_files.append(os.path.join(root, file))
+
+    print(f"Found {len(video_files)} video")
+
+    for video_path in video_files:
+        try:
+            export_video_frames(video_path, output_folder, fps, width, quality, num_workers)
+        except Exception as e:
+            print(f"Error frames {video_path}: {str(e)}")
+
+
+if __name__ == "__main__":
+    try:
+        input_folder = "F:/processed_original"
+        frame_folder = "F:/frame"
+
+        export_all_videos(input_folder, frame_folder, fps=1.0, width=640)
+
+    except Exception as e:
+        print(e)
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from DurationProcessing import VideoTimeCutter
+from DecodeHub import DecodeHub, PitchRatioConsumer, SceneChangeConsumer, AudioEnvelopeConsumer
+from AudioProcessing import is_up_to_date, load_excitement_envelope
+from KeyframeTrimmer import KeyframeTrimmer
+from Instrumentation import metrics
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+DEFAULT_WEIGHTS = {"audio": 0.5, "cuts": 0.3, "pitch": 0.2}
+
+
+def standardize(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    std = values.std()
+    return (values - values.mean()) / std if std > 1e-9 else np.zeros_like(values)
+
+
+def window_means(per_second: np.ndarray, starts: np.ndarray, length: int) -> np.ndarray:
+    """Mean of per_second[s:s + length] for every start, from one cumulative sum."""
+    cumsum = np.concatenate([[0.0], np.cumsum(per_second, dtype=np.float64)])
+    return (cumsum[starts + length] - cumsum[starts]) / length
+
+
+def overlap_seconds(segments: List[Tuple[float, float]], reference: List[Tuple[float, float]]) -> float:
+    """Total overlap between two lists of intervals; each list is assumed free of self-overlap."""
+    return sum(max(0.0, min(e1, e2) - max(s1, s2)) for s1, e1 in segments for s2, e2 in reference)
+
+
+def merge_intervals(intervals: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def load_alignments(relationship_file: str) -> Dict[str, List[Tuple[float, float]]]:
+    """Match-time intervals covered by the paired highlights, per full match video_id.
+
+    Only highlights aligned by AudioAlignment.HighlightAligner carry these intervals.
+    """
+    relationship_path = os.path.join(os.path.dirname(__file__), "..", "data", relationship_file)
+    with open(relationship_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    alignments = {}
+    for relationship in data["relationships"]:
+        intervals = [
+            (segment["match_start"], segment["match_end"])
+            for highlight in relationship["highlights"]
+            for segment in highlight.get("alignment", {}).get("segments", [])
+        ]
+        if intervals:
+            alignments[relationship["full_match"]["video_id"]] = merge_intervals(intervals)
+    return alignments
+
+
+def evaluate(segments: List[Tuple[float, float]], reference: List[Tuple[float, float]]) -> Dict[str, float]:
+    """Time-overlap precision and recall of the reel against the aligned highlight intervals."""
+    segments, reference = merge_intervals(segments), merge_intervals(reference)
+    overlap = overlap_seconds(segments, reference)
+    reel = sum(end - start for start, end in segments)
+    truth = sum(end - start for start, end in reference)
+    precision = overlap / reel if reel else 0.0
+    recall = overlap / truth if truth else 0.0
+    return {
+        "overlap_seconds": round(overlap, 2),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+    }
+
+
+class HighlightGenerator:
+    """Builds a highlight reel of a trimmed full match from cheap per-second signals.
+
+    Signals come from one DecodeHub pass: pitch ratio (green_ratios), scene-change density
+    and the audio excitement envelope (reused from feature_folder unless older than the video).
+    Fixed windows are scored, the best non-overlapping ones are kept under target_duration
+    and cut by keyframe-aligned stream copy, then concatenated without re-encoding.
+    """
+
+    def __init__(self, cutter: VideoTimeCutter, output_folder: str, feature_folder: Optional[str] = None,
+                 window_seconds: int = 15, hop_seconds: int = 5, target_duration: float = 300.0,
+                 max_segments: int = 20, min_pitch_ratio: float = 0.2, weights: Optional[Dict[str, float]] = None,
+                 pitch_fps: float = 1.0, scene_fps: float = 2.0, trimmer: Optional[KeyframeTrimmer] = None):
+        self.cutter = cutter
+        self.output_folder = output_folder
+        self.feature_folder = feature_folder or output_folder
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.target_duration = target_duration
+        self.max_segments = max_segments
+        self.min_pitch_ratio = min_pitch_ratio
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.pitch_fps = pitch_fps
+        self.scene_fps = scene_fps
+        self.trimmer = trimmer or cutter.trimmer or KeyframeTrimmer()
+        os.makedirs(output_folder, exist_ok=True)
+
+    def signals(self, video_path: str) -> Dict[str, np.ndarray]:
+        """Per-second pitch ratio, scene changes and audio features of the whole video."""
+        video_id = os.path.splitext(os.path.basename(video_path))[0]
+        feature_path = os.path.join(self.feature_folder, f"{video_id}.excitement.npz")
+
+        hub = DecodeHub(video_path)
+        hub.register("pitch", PitchRatioConsumer(self.cutter, self.pitch_fps))
+        hub.register("scene_changes", SceneChangeConsumer(self.cutter, self.scene_fps))
+        # An envelope older than the video (re-downloaded or re-cut since) is recomputed
+        reuse_audio = is_up_to_date(feature_path, video_path)
+        if not reuse_audio:
+            hub.register("audio_envelope", AudioEnvelopeConsumer(video_id, self.feature_folder))
+        results = hub.run()
+        if "pitch" not in results:
+            raise RuntimeError(f"Pitch analysis failed: {hub.errors}")
+
+        pitch = results["pitch"]
+        seconds = int(np.ceil(pitch["times"][-1])) + 1 if len(pitch["times"]) else 0
+        # A stale file left behind by a failed recomputation is not used either
+        fresh_audio = reuse_audio or "audio_envelope" in results
+        _, audio = load_excitement_envelope(feature_path) if fresh_audio else (None, None)
+        if audio is not None and len(audio):
+            seconds = max(seconds, len(audio))
+            audio = np.pad(audio, ((0, seconds - len(audio)), (0, 0)))
+        else:
+            audio = np.zeros((seconds, 3))
+
+        # Sampled pitch ratios held over the seconds between samples
+        bins = np.floor(pitch["times"]).astype(np.int64)
+        pitch_per_second = np.zeros(seconds)
+        pitch_per_second[bins] = pitch["ratios"]
+        filled = np.maximum.accumulate(np.where(np.isin(np.arange(seconds), bins), np.arange(seconds), 0))
+        pitch_per_second = pitch_per_second[filled]
+
+        changes = np.floor(np.asarray(results.get("scene_changes", []))).astype(np.int64)
+        cuts = np.bincount(changes, minlength=seconds)[:seconds].astype(np.float64)
+        return {"pitch": pitch_per_second, "cuts": cuts, "audio": audio}
+
+    def score_windows(self, signals: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Start times and scores of window_seconds windows every hop_seconds."""
+        seconds = len(signals["pitch"])
+        if seconds < self.window_seconds:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        starts = np.arange(0, seconds - self.window_seconds + 1, self.hop_seconds)
+
+        # Crowd noise: every envelope column standardized, then averaged
+        audio = np.mean([standardize(column) for column in signals["audio"].T], axis=0)
+        pitch = window_means(signals["pitch"], starts, self.window_seconds)
+        scores = (
+            self.weights["audio"] * standardize(window_means(audio, starts, self.window_seconds))
+            + self.weights["cuts"] * standardize(window_means(signals["cuts"], starts, self.window_seconds))
+            + self.weights["pitch"] * standardize(pitch)
+        )
+        # Studio, ads and crowd shots without the pitch are never picked
+        scores[pitch < self.min_pitch_ratio] = -np.inf
+        return starts, scores
+
+    def select_segments(self, starts: np.ndarray, scores: np.ndarray) -> List[Dict[str, float]]:
+        """Greedy top-K: best windows first, skipping overlaps, until the target duration is reached."""
+        chosen, total = [], 0.0
+        for i in np.argsort(-scores, kind='stable'):
+            if not np.isfinite(scores[i]) or len(chosen) == self.max_segments:
+                break
+            start, end = float(starts[i]), float(starts[i] + self.window_seconds)
+            if total + self.window_seconds > self.target_duration:
+                break
+            if any(start < c["end"] and end > c["start"] for c in chosen):
+                continue
+            chosen.append({"start": start, "end": end, "score": round(float(scores[i]), 4)})
+            total += self.window_seconds
+        return sorted(chosen, key=lambda segment: segment["start"])
+
+    def assemble(self, video_path: str, segments: List[Dict[str, float]], output_path: str) -> List[Dict[str, Any]]:
+        """Stream-copy every segment between keyframes and concatenate them into output_path."""
+        # Snapping outward can make neighbours overlap, so merge after snapping
+        snapped = merge_intervals([self.trimmer.snap(video_path, s["start"], s["end"]) for s in segments])
+
+        with tempfile.TemporaryDirectory(dir=self.output_folder) as work_dir:
+            extension = os.path.splitext(output_path)[1] or ".mp4"
+            parts, reports = [], []
+            for i, (start, end) in enumerate(snapped):
+                parts.append(os.path.join(work_dir, f"part{i:03d}{extension}"))
+                reports.append(self.trimmer.trim(video_path, parts[-1], start, end))
+            if len(parts) == 1:
+                os.replace(parts[0], output_path)
+            else:
+                self.trimmer.concat(parts, output_path)
+        return reports
+
+    def generate(self, video_path: str, reference: Optional[List[Tuple[float, float]]] = None) -> Dict[str, Any]:
+        """Write <video_id>.highlights.mp4 and its <video_id>.highlights.json report."""
+        video_id = os.path.splitext(os.path.basename(video_path))[0]
+        output_path = os.path.join(self.output_folder, f"{video_id}.highlights.mp4")
+        started = time.perf_counter()
+
+        with metrics.video(video_id, task="highlights"):
+            with metrics.timer("signals"):
+                signals = self.signals(video_path)
+            starts, scores = self.score_windows(signals)
+            segments = self.select_segments(starts, scores)
+            if not segments:
+                raise RuntimeError("No window passed the pitch ratio filter")
+            with metrics.timer("assemble"):
+                cuts = self.assemble(video_path, segments, output_path)
+
+        elapsed = time.perf_counter() - started
+        match_seconds = len(signals["pitch"])
+        actual = [(cut["actual_start"], cut["actual_end"]) for cut in cuts]
+        report = {
+            "video_id": video_id,
+            "output_path": output_path,
+            "match_seconds": match_seconds,
+            "reel_seconds": round(sum(end - start for start, end in actual), 2),
+            "segments": segments,
+            "cuts": [{"start": start, "end": end} for start, end in actual],
+            "elapsed_seconds": round(elapsed, 2),
+            "realtime_factor": round(elapsed / match_seconds, 4) if match_seconds else None,
+        }
+        if reference:
+            report["validation"] = evaluate(actual, reference)
+
+        with open(os.path.join(self.output_folder, f"{video_id}.highlights.json"), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+    def process_batch(self, input_folder: str, relationship_file: Optional[str] = None,
+                      num_workers: int = 2) -> List[Dict[str, Any]]:
+        """Generate reels for every video in input_folder and validate them when alignments exist."""
+        alignments = load_alignments(relationship_file) if relationship_file else {}
+        video_files = [f for f in os.listdir(input_folder) if f.endswith(('.mp4', '.mkv', '.avi'))]
+
+        def run(video_file):
+            try:
+                video_id = os.path.splitext(video_file)[0]
+                return self.generate(os.path.join(input_folder, video_file), alignments.get(video_id))
+            except Exception as e:
+                logging.error(f"Error generating highlights of {video_file}: {str(e)}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            reports = [report for report in executor.map(run, video_files) if report]
+
+        validated = [report["validation"] for report in reports if "validation" in report]
+        logging.info(f"Generated {len(reports)}/{len(video_files)} highlight reels")
+        if validated:
+            logging.info(
+                f"Validation on {len(validated)} matches: "
+                f"precision {np.mean([v['precision'] for v in validated]):.3f}, "
+                f"recall {np.mean([v['recall'] for v in validated]):.3f}"
+            )
+        return reports
+
+
+def main():
+    try:
+        cutter = VideoTimeCutter("F:/processed_original_cut", "F:/highlights_generated", output_mode="copy")
+        generator = HighlightGenerator(cutter, "F:/highlights_generated", feature_folder="F:/features")
+        generator.process_batch("F:/processed_original_cut", "Match_Streams_With_Highlights.json")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
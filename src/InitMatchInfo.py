@@ -2,36 +2,17 @@ import os
 import json
 import logging
 from typing import Dict, Any
-import hashlib
-import re
+
+from TitleNormalization import title_key, title_keys
+from Instrumentation import metrics
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-def generate_hash(value: str) -> str:
-    return hashlib.md5(value.encode('utf-8')).hexdigest()
-
-def clean_title(title: str) -> str:
-    if not isinstance(title, str):
-        return ""
-    title = re.sub(r"[/.🔴:|：｜⧸'&＂-]", '', title)
-    title = title.lower()
-    return '_'.join(title.split())
-
-def clean_text(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    text = text.lower()
-    text = re.sub(r"[/.🔴:|'&-]", '', text)
-    text = re.sub(r"amp;", "", text)
-    text = re.sub(r"#39;", "", text)
-    text = re.sub(r"quot;", "", text)
-    return '_'.join(text.split())
-
 class InitMatchInfo:
-    def __init__(self, input_file: str, input_folder: str, output_file: str):
+    def __init__(self, input_file: str, input_folder: str, output_file: str, catalog=None, catalog_type: str = None):
         self.input_file = os.path.join(
             os.path.dirname(__file__),
             "..",
@@ -45,53 +26,85 @@ class InitMatchInfo:
             "data",
             output_file,
         )
+        # Optional Catalog: titles are then looked up by hash in SQLite instead of loading input_file
+        self.catalog = catalog
+        self.catalog_type = catalog_type
 
-    def initialize_match_infomation(self) -> Dict[str, Any]:
+    def initialize_match_infomation(self, incremental: bool = False) -> Dict[str, Any]:
         logging.info(f"Checking file {self.input_file}")
         logging.info(f"Checking folder {self.input_folder}")
 
         try:
-            with open(self.input_file, 'r', encoding='utf-8') as f:
-                file_data = json.load(f)
-
-            datas = file_data.get("streams") or file_data.get("videos")
-            if not datas:
-                raise ValueError("Invalid input file: no 'streams' or 'videos' key found.")
-
-            video_type = "Full Match" if "streams" in file_data else "Highlight Match"
+            file_names = [file_name for file_name in os.listdir(self.input_folder) if file_name.endswith(".mp4")]
+
+            # Incremental mode: reuse the infos of files that were already matched on a previous run
+            state_file = f"{os.path.splitext(self.output_file)[0]}.state.json"
+            matched_files = {}
+            infos_by_id = {}
+            video_type = None
+            if incremental and os.path.exists(self.output_file) and os.path.exists(state_file):
+                with metrics.timer("json_load"):
+                    with open(self.output_file, 'r', encoding='utf-8') as f:
+                        previous = json.load(f)
+                    with open(state_file, 'r', encoding='utf-8') as f:
+                        matched_files = json.load(f)
+                video_type = previous["type"]
+                infos_by_id = {info["video_id"]: info for info in previous["infos"]}
+
+            current_files = set(file_names)
+            matched_files = {name: video_id for name, video_id in matched_files.items()
+                             if name in current_files and video_id in infos_by_id}
+            new_files = [file_name for file_name in file_names if file_name not in matched_files]
 
             video_info_by_hash = {}
-            for video in datas:
-                hashed_title = generate_hash(clean_text(video["title"]))
-                # print(clean_text(video["title"]))
-                video_info_by_hash[hashed_title] = video
-
-            infos = []
-            for file_name in os.listdir(self.input_folder):
-                if file_name.endswith(".mp4"):
-                    cleaned_file_name = clean_title(os.path.splitext(file_name)[0])
-                    hashed_file_name = generate_hash(cleaned_file_name)
-
-                    if hashed_file_name in video_info_by_hash:
-                        video = video_info_by_hash[hashed_file_name]
-                        local_path = os.path.join(self.input_folder, f"{video["title"]}.mp4").replace("/", '')
-                        info = {
-                            "id": video["id"],
-                            "video_id": video["video_id"],
-                            "title": video["title"],
-                            "url": video["video_url"],
-                            "local_path": local_path,
-                            "duration_seconds": video["duration_seconds"],
-                            "published_date": video["published_date"],
-                            "definition": video["definition"],
-                            "view_count": video["view_count"],
-                            "like_count": video["like_count"],
-                            "comment_count": video["comment_count"],
-                            "tags": video["tags"],
-                        }
-                        infos.append(info)
-                    # if hashed_file_name not in video_info_by_hash:
-                    #     print(cleaned_file_name)
+            if self.catalog is not None:
+                video_type = "Full Match" if self.catalog_type == "stream" else "Highlight Match"
+            elif new_files or video_type is None:
+                with metrics.timer("json_load"), open(self.input_file, 'r', encoding='utf-8') as f:
+                    file_data = json.load(f)
+
+                datas = file_data.get("streams") or file_data.get("videos")
+                if not datas:
+                    raise ValueError("Invalid input file: no 'streams' or 'videos' key found.")
+
+                video_type = "Full Match" if "streams" in file_data else "Highlight Match"
+
+                video_info_by_hash = dict(zip(title_keys(video["title"] for video in datas), datas))
+
+            infos = [infos_by_id[video_id] for video_id in matched_files.values()]
+            reused_count = len(infos)
+            for file_name in new_files:
+                hashed_file_name = title_key(os.path.splitext(file_name)[0])
+
+                if self.catalog is not None:
+                    video = self.catalog.find_by_title_hash(hashed_file_name, self.catalog_type)
+                else:
+                    video = video_info_by_hash.get(hashed_file_name)
+
+                if video is not None:
+                    local_path = os.path.join(self.input_folder, f"{video["title"]}.mp4").replace("/", '')
+                    info = {
+                        "id": video["id"],
+                        "video_id": video["video_id"],
+                        "title": video["title"],
+                        "url": video["video_url"],
+                        "local_path": local_path,
+                        "duration_seconds": video["duration_seconds"],
+                        "published_date": video["published_date"],
+                        "definition": video["definition"],
+                        "view_count": video["view_count"],
+                        "like_count": video["like_count"],
+                        "comment_count": video["comment_count"],
+                        "tags": video["tags"],
+                    }
+                    infos.append(info)
+                    matched_files[file_name] = video["video_id"]
+                    if self.catalog is not None:
+                        self.catalog.set_local_path(video["video_id"], local_path)
+                # if hashed_file_name not in video_info_by_hash:
+                #     print(cleaned_file_name)
+
+            logging.info(f"Checked {len(new_files)} new files, reused {reused_count} infos")
 
             output_data = {
                 "type": video_type,
@@ -99,8 +112,12 @@ class InitMatchInfo:
                 "infos": infos,
             }
 
-            with open(self.output_file, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=2)
+            with metrics.timer("json_dump"):
+                with open(self.output_file, 'w', encoding='utf-8') as f:
+                    json.dump(output_data, f, ensure_ascii=False, indent=2)
+                if incremental:
+                    with open(state_file, 'w', encoding='utf-8') as f:
+                        json.dump(matched_files, f, ensure_ascii=False)
 
             logging.info(f"File {self.output_file} has been initialized")
             return output_data
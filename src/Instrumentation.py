@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99)
+METRIC_PREFIX = "soccer_highlight"
+
+
+class Instrumentation:
+    """Stage timers and counters, recorded per video as JSONL and summarized as a Prometheus textfile.
+
+    Timers and counters go to the video scope opened by video() on the current thread; outside
+    a scope every timed call is its own sample. Scopes are per thread, so work that runs in a
+    process pool (e.g. sharded sampling) is only counted where the scope was opened.
+
+    Stage times are exclusive: the time spent in a timer nested inside another one is only
+    charged to the inner stage, so the stages of a video never overlap.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.counters: Dict[str, float] = {}
+
+    def configure(self, jsonl_path: Optional[str]):
+        self.jsonl_path = jsonl_path
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+
+    def _scope(self) -> Optional[Dict[str, Any]]:
+        return getattr(self._local, "scope", None)
+
+    @contextmanager
+    def video(self, video_id: str, **labels):
+        """Collect everything timed or counted on this thread into one JSONL record for video_id."""
+        scope = {"video_id": video_id, **labels, "stages": {}, "counters": {}}
+        previous = self._scope()
+        self._local.scope = scope
+        started = time.perf_counter()
+        scope["started"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            yield scope
+            scope.setdefault("status", "ok")
+        except Exception:
+            scope["status"] = "error"
+            raise
+        finally:
+            self._local.scope = previous
+            scope["total_seconds"] = time.perf_counter() - started
+            with self._lock:
+                for stage, seconds in scope["stages"].items():
+                    self.samples.setdefault(stage, []).append(seconds)
+                self.samples.setdefault("video_total", []).append(scope["total_seconds"])
+                for name, value in scope["counters"].items():
+                    self.counters[name] = self.counters.get(name, 0) + value
+                if self.jsonl_path:
+                    with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(scope, ensure_ascii=False) + "\n")
+
+    @contextmanager
+    def timer(self, stage: str):
+        # One entry per open timer on this thread: seconds spent in the timers nested inside it
+        stack = self._local.__dict__.setdefault("timers", [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - started
+            elapsed = total - stack.pop()
+            if stack:
+                stack[-1] += total
+            scope = self._scope()
+            if scope is not None:
+                scope["stages"][stage] = scope["stages"].get(stage, 0.0) + elapsed
+            else:
+                with self._lock:
+                    self.samples.setdefault(stage, []).append(elapsed)
+
+    def timed(self, stage: str):
+        """Decorator form of timer()."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: float = 1):
+        scope = self._scope()
+        if scope is not None:
+            scope["counters"][name] = scope["counters"].get(name, 0) + value
+        else:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def write_prometheus(self, textfile_path: str, jsonl_path: Optional[str] = None):
+        """Write stage latency quantiles and counter totals in the node_exporter textfile format.
+
+        With jsonl_path the summary is rebuilt from all records in that file, which also
+        covers videos processed by other processes or earlier runs.
+        """
+        if jsonl_path:
+            samples, counters = {}, {}
+            with open(jsonl_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    for stage, seconds in record["stages"].items():
+                        samples.setdefault(stage, []).append(seconds)
+                    samples.setdefault("video_total", []).append(record["total_seconds"])
+                    for name, value in record["counters"].items():
+                        counters[name] = counters.get(name, 0) + value
+        else:
+            with self._lock:
+                samples = {stage: list(values) for stage, values in self.samples.items()}
+                counters = dict(self.counters)
+
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds Time spent per stage (per video when run inside a video scope).",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds summary",
+        ]
+        for stage, values in sorted(samples.items()):
+            for quantile, value in zip(QUANTILES, np.quantile(values, QUANTILES)):
+                lines.append(f'{METRIC_PREFIX}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {sum(values):.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage}"}} {len(values)}')
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+            lines.append(f"{METRIC_PREFIX}_{name}_total {value:g}")
+
+        # node_exporter may read the file at any time, so replace it atomically
+        tmp_path = f"{textfile_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, textfile_path)
+
+
+metrics = Instrumentation()
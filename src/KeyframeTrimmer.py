@@ -0,0 +1,336 @@
+import os
+import re
+import json
+import shutil
+import logging
+import subprocess
+import tempfile
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple, Dict, Any, Optional
+
+from moviepy.config import get_setting
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+# Source video codec -> encoder able to produce a stream that can be joined to it
+VIDEO_ENCODERS = {"h264": "libx264"}
+# Containers whose muxer takes -video_track_timescale
+TIMESCALE_EXTENSIONS = (".mp4", ".mov", ".m4v")
+# Commas that separate the fields of a stream line in ffmpeg's input banner (not those inside parentheses)
+FIELD_SEPARATOR = re.compile(r',\s*(?![^()]*\))')
+
+
+class KeyframeTrimmer:
+    """Cut videos by stream copy on keyframe boundaries instead of re-encoding them."""
+
+    def __init__(self, ffmpeg_binary: Optional[str] = None, search_window: float = 60.0,
+                 ffprobe_binary: Optional[str] = None):
+        self.ffmpeg_binary = ffmpeg_binary or get_setting("FFMPEG_BINARY")
+        # ffprobe is optional: without it the stream parameters are read from ffmpeg's banner
+        self.ffprobe_binary = ffprobe_binary or shutil.which("ffprobe")
+        self.search_window = search_window
+
+    def _run(self, args: List[str]) -> str:
+        result = subprocess.run(
+            [self.ffmpeg_binary, "-v", "error", "-y", *args],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def probe(self, video_path: str) -> Dict[str, Any]:
+        """Codec, profile, level, pix_fmt and time base of the first video stream."""
+        if self.ffprobe_binary:
+            result = subprocess.run(
+                [self.ffprobe_binary, "-v", "error", "-select_streams", "v:0", "-show_entries",
+                 "stream=codec_name,profile,level,pix_fmt,time_base", "-of", "json", video_path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"ffprobe failed: {result.stderr.strip()}")
+            streams = json.loads(result.stdout).get("streams", [])
+            if not streams:
+                raise RuntimeError(f"No video stream in {video_path}")
+            stream = streams[0]
+            level = stream.get("level")
+            return {
+                "codec": stream.get("codec_name"),
+                "profile": stream.get("profile"),
+                # H.264 levels are reported as level_idc (e.g. 40 for 4.0)
+                "level": f"{level / 10:g}" if isinstance(level, int) and level > 0 else None,
+                "pix_fmt": stream.get("pix_fmt"),
+                "timescale": int(stream["time_base"].split("/")[1]) if stream.get("time_base") else None,
+            }
+
+        # "ffmpeg -i" exits with an error (no output file) but still prints the stream lines
+        result = subprocess.run([self.ffmpeg_binary, "-hide_banner", "-i", video_path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        line = next((l for l in result.stderr.splitlines() if re.search(r"Stream #\d+:\d+.*: Video: ", l)), None)
+        if line is None:
+            raise RuntimeError(f"No video stream in {video_path}")
+        fields = FIELD_SEPARATOR.split(line.split(": Video: ", 1)[1])
+        codec = fields[0].split()[0]
+        profile = re.match(r"\w+ \(([^)/]+)\)", fields[0])
+        timescale = next((f.split()[0] for f in fields if re.match(r"[\d.]+k? tbn", f)), None)
+        if timescale is not None:
+            timescale = int(float(timescale[:-1]) * 1000) if timescale.endswith("k") else int(float(timescale))
+        return {
+            "codec": codec,
+            "profile": profile.group(1) if profile else None,
+            # The banner does not show the level; x264 then derives it from the resolution and frame rate
+            "level": None,
+            "pix_fmt": re.match(r"\w+", fields[1]).group(0) if len(fields) > 1 else None,
+            "timescale": timescale,
+        }
+
+    def encoder_args(self, video_path: str, output_path: str) -> Optional[List[str]]:
+        """libx264 options reproducing the source stream's parameters, or None when it cannot be matched."""
+        try:
+            params = self.probe(video_path)
+        except Exception as e:
+            logging.warning(f"Cannot probe {video_path}: {str(e)}")
+            return None
+        encoder = VIDEO_ENCODERS.get(params["codec"])
+        if encoder is None or not params["pix_fmt"]:
+            return None
+
+        args = ["-c:v", encoder, "-pix_fmt", params["pix_fmt"]]
+        if params["profile"]:
+            # "Constrained Baseline" -> baseline, "High 10" -> high10
+            profile = params["profile"].lower().replace("constrained ", "").replace(" ", "")
+            args += ["-profile:v", profile]
+        if params["level"]:
+            args += ["-level:v", params["level"]]
+        if params["timescale"] and output_path.lower().endswith(TIMESCALE_EXTENSIONS):
+            args += ["-video_track_timescale", str(params["timescale"])]
+        return args
+
+    def packet_times(self, video_path: str) -> List[Tuple[float, float]]:
+        """(pts, duration) in seconds of the video packets, in decoding order, read without decoding."""
+        output = self._run(["-i", video_path, "-map", "0:v:0", "-c", "copy", "-f", "framemd5", "-"])
+        time_base, packets = 1.0, []
+        for line in output.splitlines():
+            if line.startswith("#tb 0:"):
+                num, den = line.split(":", 1)[1].strip().split("/")
+                time_base = int(num) / int(den)
+            elif line and not line.startswith("#"):
+                _, _, pts, duration = (int(value) for value in line.split(",")[:4])
+                packets.append((pts * time_base, duration * time_base))
+        if not packets:
+            raise RuntimeError(f"No video packets in {video_path}")
+        return packets
+
+    def video_span(self, video_path: str) -> Tuple[float, float]:
+        """(first pts, last pts + duration) of the video packets."""
+        packets = self.packet_times(video_path)
+        return min(pts for pts, _ in packets), max(pts + duration for pts, duration in packets)
+
+    def decode_errors(self, video_path: str, start: float, duration: float) -> str:
+        """Decoder errors in [start, start + duration] of video_path, empty when it decodes cleanly."""
+        result = subprocess.run(
+            [self.ffmpeg_binary, "-v", "error", "-ss", f"{max(0.0, start):.3f}", "-i", video_path,
+             "-t", f"{duration:.3f}", "-map", "0:v:0", "-f", "null", "-"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        return result.stderr.strip() if result.stderr.strip() or result.returncode == 0 else "decode failed"
+
+    def keyframe_times(self, video_path: str, start: float = None, duration: float = None) -> List[float]:
+        """List keyframe timestamps by copying only key packets, without decoding anything."""
+        args = []
+        if start is not None:
+            args += ["-ss", f"{max(0.0, start):.3f}"]
+        if duration is not None:
+            args += ["-t", f"{duration:.3f}"]
+        output = self._run(args + [
+            "-copyts", "-i", video_path,
+            "-map", "0:v:0", "-c", "copy",
+            "-bsf:v", "noise=drop=not(key)",
+            "-f", "framemd5", "-",
+        ])
+
+        time_base = 1.0
+        times = []
+        for line in output.splitlines():
+            if line.startswith("#tb 0:"):
+                num, den = line.split(":", 1)[1].strip().split("/")
+                time_base = int(num) / int(den)
+            elif line and not line.startswith("#"):
+                times.append(int(line.split(",")[2]) * time_base)
+        return sorted(times)
+
+    def _keyframes_around(self, video_path: str, t: float) -> List[float]:
+        # Widen the window until there is a keyframe on both sides of t (or we hit the file start)
+        window = self.search_window
+        while True:
+            lo = max(0.0, t - window)
+            times = self.keyframe_times(video_path, lo, 2 * window)
+            if (times and times[0] <= t) or lo == 0.0:
+                return times
+            window *= 2
+
+    def snap(self, video_path: str, start: float, end: float) -> Tuple[float, float]:
+        """Snap outward: last keyframe at or before start, first keyframe at or after end."""
+        start_keyframes = self._keyframes_around(video_path, start)
+        i = bisect_right(start_keyframes, start + 1e-3)
+        snapped_start = start_keyframes[i - 1] if i > 0 else 0.0
+
+        end_keyframes = self._keyframes_around(video_path, end)
+        j = bisect_left(end_keyframes, end - 1e-3)
+        snapped_end = end_keyframes[j] if j < len(end_keyframes) else end
+        return snapped_start, snapped_end
+
+    def _copy(self, video_path: str, output_path: str, start: float, end: float):
+        self._run([
+            "-ss", f"{start:.3f}", "-i", video_path, "-t", f"{end - start:.3f}",
+            "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+            "-avoid_negative_ts", "make_zero", output_path,
+        ])
+
+    def _encode(self, video_path: str, output_path: str, start: float, end: float,
+                video_args: Optional[List[str]] = None):
+        """Re-encode [start, end]; with video_args only the video stream, with those encoder options."""
+        if video_args is None:
+            streams = ["-map", "0:v:0", "-map", "0:a?", "-c:v", "libx264", "-c:a", "aac"]
+        else:
+            streams = ["-map", "0:v:0", "-an", *video_args]
+        self._run(["-ss", f"{start:.3f}", "-i", video_path, "-t", f"{end - start:.3f}", *streams, output_path])
+
+    def _copy_video(self, video_path: str, output_path: str, start: float, end: float):
+        args = ["-ss", f"{start:.3f}", "-i", video_path, "-t", f"{end - start:.3f}",
+                "-map", "0:v:0", "-an", "-c", "copy", "-avoid_negative_ts", "make_zero"]
+        self._run([*args, output_path])
+        # Stream copy stops on decoding order, so with B-frames the keyframe at `end` and a few
+        # packets after it get in while the B-frames shown before them do not. Keep exactly
+        # the packets displayed before `end` (they precede that keyframe in a closed GOP).
+        packets = self.packet_times(output_path)
+        first = min(pts for pts, _ in packets)
+        keep = sum(1 for pts, _ in packets if pts - first < end - start - 1e-3)
+        if keep < len(packets):
+            self._run([*args, "-frames:v", str(keep), output_path])
+
+    def _mux_audio(self, video_only_path: str, video_path: str, output_path: str, start: float, end: float):
+        # The audio is stream-copied over the whole range in one piece, so there are no
+        # encoder-delay gaps at the joins of the video parts
+        self._run([
+            "-i", video_only_path, "-ss", f"{start:.3f}", "-i", video_path, "-t", f"{end - start:.3f}",
+            "-map", "0:v:0", "-map", "1:a?", "-c", "copy", output_path,
+        ])
+
+    def _concat(self, parts: List[str], output_path: str, work_dir: str):
+        list_path = os.path.join(work_dir, "parts.txt")
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for part in parts:
+                escaped = part.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        self._run(["-f", "concat", "-safe", "0", "-i", list_path, "-map", "0", "-c", "copy", output_path])
+
+    def concat(self, parts: List[str], output_path: str):
+        """Join parts cut from the same source (same codecs and parameters) without re-encoding."""
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as work_dir:
+            self._concat(parts, output_path, work_dir)
+
+    def trim(self, video_path: str, output_path: str, start: float, end: float, exact: bool = False) -> Dict[str, Any]:
+        """Trim [start, end] into output_path and report the actual cut points.
+
+        With exact=False the cut is a pure remux between the snapped keyframes. With
+        exact=True only the partial GOPs at both edges are re-encoded, with the source's
+        codec parameters, and joined to the stream-copied middle part; the audio is copied
+        over the whole range. When the source cannot be matched (unknown codec, failed
+        probe) or a join does not decode cleanly, the range is re-encoded entirely instead.
+        actual_end is measured from the packets of the written file.
+        """
+        if end <= start:
+            raise ValueError(f"Invalid cut range: {start:.2f}s - {end:.2f}s")
+
+        report = {
+            "video_path": video_path,
+            "output_path": output_path,
+            "requested_start": start,
+            "requested_end": end,
+            "mode": "smart" if exact else "copy",
+            "reencoded_seconds": 0.0,
+        }
+
+        if not exact:
+            actual_start, snapped_end = self.snap(video_path, start, end)
+            self._copy(video_path, output_path, actual_start, snapped_end)
+            self._report_output(report, actual_start)
+            logging.info(f"Stream-copied {video_path}: {report['actual_start']:.2f}s - {report['actual_end']:.2f}s")
+            return report
+
+        # First keyframe inside the range and last keyframe before its end
+        start_keyframes = self._keyframes_around(video_path, start)
+        end_keyframes = self._keyframes_around(video_path, end)
+        i = bisect_left(start_keyframes, start - 1e-3)
+        j = bisect_right(end_keyframes, end + 1e-3)
+        inner_start = start_keyframes[i] if i < len(start_keyframes) else end
+        inner_end = end_keyframes[j - 1] if j > 0 else start
+
+        video_args = self.encoder_args(video_path, output_path)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as work_dir:
+            extension = os.path.splitext(output_path)[1] or ".mp4"
+            joined = False
+            if inner_start < inner_end and video_args is not None:
+                joined = self._smart_cut(video_path, output_path, start, end, inner_start, inner_end,
+                                         video_args, work_dir, extension)
+                if joined:
+                    report["reencoded_seconds"] = (inner_start - start) + (end - inner_end)
+            if not joined:
+                # The whole range sits inside a single GOP, or the edges cannot be joined to the source
+                if inner_start < inner_end:
+                    logging.warning(f"Cannot smart-cut {video_path} losslessly, re-encoding the whole range")
+                    report["mode"] = "reencode"
+                self._encode(video_path, output_path, start, end)
+                report["reencoded_seconds"] = end - start
+
+        self._report_output(report, start)
+        logging.info(f"Smart-cut {video_path} ({report['mode']}): re-encoded {report['reencoded_seconds']:.2f}s")
+        return report
+
+    def _smart_cut(self, video_path: str, output_path: str, start: float, end: float, inner_start: float,
+                   inner_end: float, video_args: List[str], work_dir: str, extension: str) -> bool:
+        """Encode the edges, copy the middle, join and check the joins; False when they do not decode cleanly."""
+        parts, joins, offset = [], [], 0.0
+        for name, part_start, part_end, copy in (("head", start, inner_start, False),
+                                                 ("middle", inner_start, inner_end, True),
+                                                 ("tail", inner_end, end, False)):
+            # Each part starts where the previous one actually ended, after frame rounding
+            part_start = max(part_start, start + offset)
+            if part_end - part_start <= 1e-3:
+                continue
+            parts.append(os.path.join(work_dir, f"{name}{extension}"))
+            if copy:
+                self._copy_video(video_path, parts[-1], part_start, part_end)
+            else:
+                self._encode(video_path, parts[-1], part_start, part_end, video_args)
+            if offset > 0:
+                joins.append(offset)
+            first, last = self.video_span(parts[-1])
+            offset += last - first
+
+        video_only = os.path.join(work_dir, f"video{extension}")
+        if len(parts) == 1:
+            os.replace(parts[0], video_only)
+        else:
+            self._concat(parts, video_only, work_dir)
+
+        for join in joins:
+            errors = self.decode_errors(video_only, join - 1.0, 2.0)
+            if errors:
+                logging.warning(f"Join at {join:.2f}s of {video_path} does not decode cleanly: {errors}")
+                return False
+        self._mux_audio(video_only, video_path, output_path, start, end)
+        return True
+
+    def _report_output(self, report: Dict[str, Any], actual_start: float):
+        # Measured from the written file rather than taken from the requested range
+        first, last = self.video_span(report["output_path"])
+        report.update(actual_start=actual_start, actual_end=actual_start + last - first,
+                      output_duration=last - first)
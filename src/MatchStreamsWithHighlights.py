@@ -3,38 +3,27 @@ import re
 import logging
 import os
 from difflib import SequenceMatcher
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Optional, Set
+import hashlib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from TitleNormalization import normalize_title
+from Instrumentation import metrics
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def clean_title(title: str) -> str:
-    if not isinstance(title, str):
-        return ""
-    title = re.sub(r"[/.🔴:|：｜⧸'&＂-]", '', title)
-    title = title.lower()
-    return '_'.join(title.split())
-
-def clean_text(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    text = text.lower()
-    text = re.sub(r"[/.🔴:|'&-]", '', text)
-    text = re.sub(r"amp;", "", text)
-    text = re.sub(r"#39;", "", text)
-    text = re.sub(r"quot;", "", text)
-    return '_'.join(text.split())
-
 def extract_team_names(title: str) -> List[str]:
     if not isinstance(title, str):
         return []
     title = re.sub(r'^.*?:', '', title)
     match = re.search(r'([^-]+)-([^|]+)', title)
     if match:
-        team1 = clean_title(match.group(1))
-        team2 = clean_title(match.group(2))
+        team1 = normalize_title(match.group(1))
+        team2 = normalize_title(match.group(2))
         return [team1, team2]
     return []
 
@@ -47,77 +36,294 @@ def teams_similarity(teams1: List[str], teams2: List[str]) -> bool:
     )
     return forward_match
 
+def fit_team_vectorizer(teams: List[List[str]]) -> TfidfVectorizer:
+    """Character 2-3-gram TF-IDF fitted on the home and away names of the given team pairs."""
+    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 3), lowercase=False)
+    return vectorizer.fit([name.replace('_', ' ') for pair in teams for name in pair])
+
+
+class HighlightIndex:
+    """Highlights parsed once, with their team names as character n-gram TF-IDF vectors.
+
+    The sparse product of stream and highlight vectors only touches pairs that share an
+    n-gram, so it acts as the inverted index and the scorer in one batched pass. By default
+    the IDF is fitted on the indexed highlights; a vectorizer fitted earlier (MatchState)
+    can be passed in so that indexes over different subsets score pairs the same way.
+    """
+
+    def __init__(self, highlights_datas: List[Dict[str, Any]], team_threshold: float = 0.75,
+                 teams: Optional[List[List[str]]] = None, vectorizer: Optional[TfidfVectorizer] = None):
+        self.team_threshold = team_threshold
+        self.highlights = []
+        self.teams = []
+        # Already parsed team names (e.g. from MatchState) can be passed in to skip the regex work
+        if teams is None:
+            teams = [extract_team_names(highlight["title"]) for highlight in highlights_datas]
+        for highlight, highlight_teams in zip(highlights_datas, teams):
+            if highlight_teams:
+                self.highlights.append(highlight)
+                self.teams.append(highlight_teams)
+
+        self.vectorizer = vectorizer
+        if self.teams:
+            if self.vectorizer is None:
+                self.vectorizer = fit_team_vectorizer(self.teams)
+            self.home, self.away = self._vectorize(self.teams)
+
+    def _vectorize(self, teams: List[List[str]]):
+        home = self.vectorizer.transform([pair[0].replace('_', ' ') for pair in teams])
+        away = self.vectorizer.transform([pair[1].replace('_', ' ') for pair in teams])
+        return home, away
+
+    def match(self, streams_teams: List[List[str]]) -> List[List[Tuple[int, float]]]:
+        """For each stream's team pair, the (highlight position, score) pairs above team_threshold."""
+        results = [[] for _ in streams_teams]
+        positions = [i for i, teams in enumerate(streams_teams) if len(teams) == 2]
+        if not positions or not self.teams:
+            return results
+
+        home, away = self._vectorize([streams_teams[i] for i in positions])
+        # Both teams have to match in order, so the pair score is the weaker of the two cosines
+        scores = (home @ self.home.T).minimum(away @ self.away.T).tocoo()
+        keep = scores.data >= self.team_threshold
+        for row, col, score in zip(scores.row[keep], scores.col[keep], scores.data[keep]):
+            results[positions[row]].append((int(col), float(score)))
+
+        for pairs in results:
+            pairs.sort()
+        return results
+
+
+class MatchState:
+    """Persistent record of processed video_ids, their parsed team names and their links.
+
+    Records are keyed by a hash of their title, so a retitled video is treated as new. The
+    TF-IDF vocabulary and IDF are fitted on the highlights of the first run and kept, so the
+    scores of links stored earlier stay comparable with the ones of new videos; delete the
+    state file to refit them on the current highlights.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.streams: Dict[str, Dict[str, Any]] = {}
+        self.highlights: Dict[str, Dict[str, Any]] = {}
+        self.links: Dict[str, List[Dict[str, Any]]] = {}
+        self.vectorizer: Optional[TfidfVectorizer] = None
+
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.streams = data.get("streams", {})
+            self.highlights = data.get("highlights", {})
+            self.links = data.get("links", {})
+            if data.get("idf"):
+                self.vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 3), lowercase=False,
+                                                  vocabulary=data["idf"]["vocabulary"])
+                self.vectorizer.idf_ = np.array(data["idf"]["weights"])
+
+    def team_vectorizer(self, highlights_teams: List[List[str]]) -> TfidfVectorizer:
+        """The stored vectorizer, fitted on highlights_teams the first time."""
+        if self.vectorizer is None:
+            self.vectorizer = fit_team_vectorizer([teams for teams in highlights_teams if teams])
+        return self.vectorizer
+
+    @staticmethod
+    def record_key(video: Dict[str, Any]) -> str:
+        return hashlib.md5(video["title"].encode('utf-8')).hexdigest()
+
+    @classmethod
+    def refresh(cls, section: Dict[str, Dict[str, Any]], datas: List[Dict[str, Any]]) -> Tuple[List[List[str]], Set[str], Set[str]]:
+        """Update one section with the current records; returns (teams per record, changed ids, removed ids)."""
+        teams, changed = [], set()
+        for video in datas:
+            key = cls.record_key(video)
+            entry = section.get(video["video_id"])
+            if entry is None or entry["key"] != key:
+                entry = {"key": key, "teams": extract_team_names(video["title"])}
+                section[video["video_id"]] = entry
+                changed.add(video["video_id"])
+            teams.append(entry["teams"])
+
+        current = {video["video_id"] for video in datas}
+        removed = set(section) - current
+        for video_id in removed:
+            del section[video_id]
+        return teams, changed, removed
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            data = {"streams": self.streams, "highlights": self.highlights, "links": self.links}
+            if self.vectorizer is not None:
+                data["idf"] = {
+                    "vocabulary": {ngram: int(i) for ngram, i in self.vectorizer.vocabulary_.items()},
+                    "weights": self.vectorizer.idf_.tolist(),
+                }
+            json.dump(data, f, ensure_ascii=False)
+
+
 class MatchHighlightsMatcher:
-    def __init__(self, min_similarity: float , streams_folder: str, highlights_folder: str):
+    def __init__(self, min_similarity: float , streams_folder: str, highlights_folder: str, catalog=None,
+                 duplicates: Optional[Dict[str, str]] = None):
         self.min_similarity = min_similarity
+        # Optional Catalog: downloaded streams/highlights are then read from SQLite instead of the info files
+        self.catalog = catalog
+        # Optional {video_id: canonical video_id} from Deduplication: duplicates are left out of matching
+        self.duplicates = duplicates or {}
         self.streams_folder = streams_folder
         self.highlights_folder = highlights_folder
+        self._index = None
+        self._indexed_datas = None
+
+    def get_index(self, highlights_datas: List[Dict[str, Any]]) -> HighlightIndex:
+        # Parse the highlight list once and reuse it for every stream
+        if self._indexed_datas is not highlights_datas:
+            self._index = HighlightIndex(highlights_datas)
+            self._indexed_datas = highlights_datas
+        return self._index
 
     def find_matching_highlights(self, match: Dict[str, Any], highlights_datas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        matching_highlights = []
         full_match_teams = extract_team_names(match["title"])
 
         if not full_match_teams:
             logging.warning(f"No team name found in the match: {match["title"]}")
-            return matching_highlights
-
-        for highlight in highlights_datas:
-            highlight_teams = extract_team_names(highlight["title"])
-
-            if not highlight_teams:
-                continue
-
-            if teams_similarity(full_match_teams, highlight_teams):
-                local_path = highlight["local_path"]
-                # local_path = "path"
-                matching_highlights.append({
-                    "highlight_id": highlight["video_id"],
-                    "highlight_title": highlight["title"],
-                    "url": highlight["url"],
-                    # "url": match["video_url"],
-                    "local_path": local_path,
-                    "file_exists": True,
-                    "duration_seconds": highlight["duration_seconds"],
-                    "definition": highlight["definition"],
-                    "view_count": highlight["view_count"],
-                    "like_count": highlight["like_count"],
-                    "comment_count": highlight["comment_count"],
-                    "tags": highlight["tags"],
-                    "similarity_score": SequenceMatcher(None, match["title"], highlight["title"]).ratio(),
-                    "teams_matched": full_match_teams,
-                    "linking_info": {
-                        "linking_method": "string_matching",
-                        "confidence_level": "high" if self.min_similarity > 0.8 else "medium"
-                    }
-                })
+            return []
+
+        index = self.get_index(highlights_datas)
+        return [
+            self.build_highlight_entry(match, full_match_teams, index.highlights[position], team_score)
+            for position, team_score in index.match([full_match_teams])[0]
+        ]
+
+    def build_highlight_entry(self, match: Dict[str, Any], full_match_teams: List[str], highlight: Dict[str, Any],
+                              team_score: float, similarity_score: Optional[float] = None) -> Dict[str, Any]:
+        if similarity_score is None:
+            similarity_score = SequenceMatcher(None, match["title"], highlight["title"]).ratio()
+        local_path = highlight["local_path"]
+        # local_path = "path"
+        return {
+            "highlight_id": highlight["video_id"],
+            "highlight_title": highlight["title"],
+            "url": highlight["url"],
+            # "url": match["video_url"],
+            "local_path": local_path,
+            "file_exists": True,
+            "duration_seconds": highlight["duration_seconds"],
+            "definition": highlight["definition"],
+            "view_count": highlight["view_count"],
+            "like_count": highlight["like_count"],
+            "comment_count": highlight["comment_count"],
+            "tags": highlight["tags"],
+            "similarity_score": similarity_score,
+            "teams_matched": full_match_teams,
+            "linking_info": {
+                "linking_method": "string_matching",
+                "confidence_level": "high" if self.min_similarity > 0.8 else "medium",
+                "team_score": round(team_score, 4)
+            }
+        }
+
+    def update_links(self, state: MatchState, streams_datas: List[Dict[str, Any]],
+                     highlights_datas: List[Dict[str, Any]]) -> Tuple[List[List[str]], int, int]:
+        """Match only new or changed records against the index and merge them into state.links."""
+        streams_teams, new_streams, removed_streams = state.refresh(state.streams, streams_datas)
+        highlights_teams, new_highlights, removed_highlights = state.refresh(state.highlights, highlights_datas)
 
-        return matching_highlights
+        # Forget links of streams that changed, and links pointing at highlights that changed
+        stale_highlights = new_highlights | removed_highlights
+        for video_id in new_streams | removed_streams:
+            state.links.pop(video_id, None)
+        for video_id in list(state.links):
+            state.links[video_id] = [l for l in state.links[video_id] if l["highlight_id"] not in stale_highlights]
 
-    def create_relationship_json(self, streams_file: str, highlights_file: str, output_file: str) -> Dict[str, Any]:
+        def add_links(stream_positions, index):
+            candidates = index.match([streams_teams[i] for i in stream_positions])
+            for i, match_candidates in zip(stream_positions, candidates):
+                match = streams_datas[i]
+                for position, team_score in match_candidates:
+                    highlight = index.highlights[position]
+                    state.links.setdefault(match["video_id"], []).append({
+                        "highlight_id": highlight["video_id"],
+                        "team_score": round(team_score, 4),
+                        "similarity_score": SequenceMatcher(None, match["title"], highlight["title"]).ratio(),
+                    })
+
+        if not any(highlights_teams):
+            return streams_teams, len(new_streams), len(new_highlights)
+        # Both indexes below score with the same IDF, fitted once and kept in the state
+        vectorizer = state.team_vectorizer(highlights_teams)
+
+        # New streams against every highlight
+        changed_positions = [i for i, match in enumerate(streams_datas) if match["video_id"] in new_streams]
+        if changed_positions:
+            add_links(changed_positions, HighlightIndex(highlights_datas, teams=highlights_teams, vectorizer=vectorizer))
+
+        # Unchanged streams against the new highlights only
+        if new_highlights:
+            new_positions = [i for i, h in enumerate(highlights_datas) if h["video_id"] in new_highlights]
+            unchanged_positions = [i for i, match in enumerate(streams_datas) if match["video_id"] not in new_streams]
+            if unchanged_positions:
+                add_links(unchanged_positions, HighlightIndex(
+                    [highlights_datas[i] for i in new_positions],
+                    teams=[highlights_teams[i] for i in new_positions],
+                    vectorizer=vectorizer,
+                ))
+
+        return streams_teams, len(new_streams), len(new_highlights)
+
+    def create_relationship_json(self, streams_file: str, highlights_file: str, output_file: str,
+                                 state_file: Optional[str] = None) -> Dict[str, Any]:
         logging.info(f"Checking folder {self.streams_folder} - Found {len(os.listdir(self.streams_folder))} files")
         logging.info(f"Checking folder {self.highlights_folder} - Found {len(os.listdir(self.highlights_folder))} files")
 
         try:
-            streams_path = os.path.join(os.path.dirname(__file__), "..", "data", streams_file)
-            highlights_path = os.path.join(os.path.dirname(__file__), "..", "data", highlights_file)
-            with open(streams_path, 'r', encoding="utf-8") as f:
-                streams_data = json.load(f)
+            if self.catalog is not None:
+                streams_datas = self.catalog.infos("stream")
+                highlights_datas = self.catalog.infos("highlight")
+            else:
+                streams_path = os.path.join(os.path.dirname(__file__), "..", "data", streams_file)
+                highlights_path = os.path.join(os.path.dirname(__file__), "..", "data", highlights_file)
+                with metrics.timer("json_load"):
+                    with open(streams_path, 'r', encoding="utf-8") as f:
+                        streams_data = json.load(f)
 
-            with open(highlights_path, 'r', encoding="utf-8") as f:
-                highlights_data = json.load(f)
+                    with open(highlights_path, 'r', encoding="utf-8") as f:
+                        highlights_data = json.load(f)
 
-            # if 'streams' not in full_matches_data or 'videos' not in highlights_data:
-            #     raise ValueError("Dữ liệu đầu vào không đúng định dạng yêu cầu")
+                # if 'streams' not in full_matches_data or 'videos' not in highlights_data:
+                #     raise ValueError("Dữ liệu đầu vào không đúng định dạng yêu cầu")
 
-            streams_datas = streams_data["infos"]
-            highlights_datas = highlights_data["infos"]
+                streams_datas = streams_data["infos"]
+                highlights_datas = highlights_data["infos"]
+
+            if self.duplicates:
+                streams_datas = [video for video in streams_datas if video["video_id"] not in self.duplicates]
+                highlights_datas = [video for video in highlights_datas if video["video_id"] not in self.duplicates]
 
             # streams_datas = streams_data["streams"]
             # highlights_datas = highlights_data["videos"]
 
+            # With a state file only new or changed videos are matched; without one every video is new
+            state_path = os.path.join(os.path.dirname(__file__), "..", "data", state_file) if state_file else None
+            state = MatchState(state_path)
+            with metrics.timer("matching"):
+                streams_teams, new_streams, new_highlights = self.update_links(state, streams_datas, highlights_datas)
+            logging.info(f"Matched {new_streams} new streams and {new_highlights} new highlights")
+
+            highlight_order = {h["video_id"]: i for i, h in enumerate(highlights_datas)}
             relationships = []
-            for match in streams_datas:
-                matching_highlights = self.find_matching_highlights(match, highlights_datas)
+            for match, full_match_teams in zip(streams_datas, streams_teams):
+                if not full_match_teams:
+                    logging.warning(f"No team name found in the match: {match["title"]}")
+                    continue
+
+                links = sorted(state.links.get(match["video_id"], []), key=lambda l: highlight_order[l["highlight_id"]])
+                matching_highlights = [
+                    self.build_highlight_entry(match, full_match_teams, highlights_datas[highlight_order[l["highlight_id"]]],
+                                               l["team_score"], l["similarity_score"])
+                    for l in links
+                ]
 
                 if matching_highlights:
                     local_path = match["local_path"]
@@ -137,7 +343,7 @@ class MatchHighlightsMatcher:
                             "like_count": match["like_count"],
                             "comment_count": match["comment_count"],
                             "tags": match["tags"],
-                            "team_names": extract_team_names(match["title"])
+                            "team_names": full_match_teams
                         },
                         "highlights": matching_highlights
                     }
@@ -149,8 +355,11 @@ class MatchHighlightsMatcher:
             }
 
             output_path = os.path.join(os.path.dirname(__file__), "..", "data", output_file)
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=2)
+            with metrics.timer("json_dump"):
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(output_data, f, ensure_ascii=False, indent=2)
+
+                state.save()
 
             logging.info(f"Successfully joined {len(relationships)} videos")
             print(f"Total matches: {len(streams_datas)}")
@@ -177,7 +386,8 @@ def main():
             # "match_streams_highlights.json"
             "Full_Match_Info.json",
             "Highlight_Match_Info.json",
-            "Match_Streams_With_Highlights.json"
+            "Match_Streams_With_Highlights.json",
+            state_file="match_state.json"
         )
         print(f"{relationships['total_matches']} pairs have been created")
     except Exception as e:
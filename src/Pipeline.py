@@ -0,0 +1,341 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Dict, Any, Optional, Iterable
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+PARTIAL_HASH_BYTES = 1 << 20
+SRC_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+def partial_hash(path: str, size: int, block: int = PARTIAL_HASH_BYTES) -> str:
+    """Hash of the first, middle and last block of a file; full hash for files under three blocks."""
+    digest = hashlib.blake2b(str(size).encode())
+    with open(path, 'rb') as f:
+        if size <= 3 * block:
+            digest.update(f.read())
+        else:
+            for offset in (0, size // 2, size - block):
+                f.seek(offset)
+                digest.update(f.read(block))
+    return digest.hexdigest()
+
+
+def code_version(modules: Iterable[str]) -> str:
+    digest = hashlib.blake2b()
+    for module in sorted(modules):
+        with open(os.path.join(SRC_FOLDER, module), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def list_videos(folder: str) -> Dict[str, List[str]]:
+    """One item per video file, keyed by its file name without extension."""
+    if not os.path.isdir(folder):
+        return {}
+    return {
+        os.path.splitext(file)[0]: [os.path.join(folder, file)]
+        for file in sorted(os.listdir(folder)) if file.lower().endswith(VIDEO_EXTENSIONS)
+    }
+
+
+class StageCache:
+    """Content keys of finished work per stage and item, plus memoized file identities.
+
+    Each finished item is appended to <cache_file>.log, so recording it does not rewrite the
+    whole cache; save() folds the log into the JSON snapshot once a stage is done.
+    """
+
+    def __init__(self, cache_file: str):
+        self.path = os.path.join(os.path.dirname(__file__), "..", "data", cache_file)
+        self.log_path = f"{self.path}.log"
+        self._lock = threading.Lock()
+        self.data = {"identities": {}, "stages": {}}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line cut short by an interrupted run
+                        break
+                    self.data["stages"].setdefault(entry["stage"], {})[entry["item"]] = entry["key"]
+
+    def identity(self, path: str) -> str:
+        """Content identity of an input file; re-hashed only when its size or mtime changed."""
+        stat = os.stat(path)
+        with self._lock:
+            known = self.data["identities"].get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["hash"]
+
+        file_hash = partial_hash(path, stat.st_size)
+        with self._lock:
+            self.data["identities"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": file_hash}
+        return file_hash
+
+    def get(self, stage: str, item: str) -> Optional[str]:
+        return self.data["stages"].get(stage, {}).get(item)
+
+    def put(self, stage: str, item: str, key: str):
+        with self._lock:
+            self.data["stages"].setdefault(stage, {})[item] = key
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"stage": stage, "item": item, "key": key}, ensure_ascii=False) + "\n")
+
+    def save(self):
+        """Write the snapshot (keys and file identities) atomically and drop the log it now contains."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+
+
+class Stage:
+    """One pipeline step.
+
+    items() is evaluated when the stage starts, after its dependencies finished, and maps
+    item ids (usually video ids) to their input files. run(item, inputs) does the work for one
+    item and outputs(item, inputs) lists the files it produces; an item whose outputs are missing is
+    redone. With clear_outputs those files are removed before a stale item runs, for steps
+    that skip work on their own when the output is newer than the input.
+    """
+
+    def __init__(self, name: str, run: Callable[[str, List[str]], Any], items: Callable[[], Dict[str, List[str]]],
+                 params: Optional[Dict[str, Any]] = None, depends_on: Iterable[str] = (),
+                 code: Iterable[str] = (), outputs: Optional[Callable[[str, List[str]], List[str]]] = None,
+                 clear_outputs: bool = False, num_workers: int = 1):
+        self.name = name
+        self.run = run
+        self.items = items
+        self.params = params or {}
+        self.depends_on = list(depends_on)
+        self.code_version = code_version(code) if code else ""
+        self.outputs = outputs or (lambda item, inputs: [])
+        self.clear_outputs = clear_outputs
+        self.num_workers = num_workers
+
+    def key(self, cache: StageCache, inputs: List[str]) -> str:
+        payload = json.dumps({
+            "stage": self.name,
+            "params": self.params,
+            "code": self.code_version,
+            "inputs": [cache.identity(path) for path in inputs],
+        }, sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode()).hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], cache_file: str = "pipeline_cache.json", max_parallel_stages: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [name for name in stage.depends_on if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(missing)}")
+        self.cache = StageCache(cache_file)
+        self.max_parallel_stages = max_parallel_stages
+
+    def run_stage(self, stage: Stage) -> Dict[str, int]:
+        items = stage.items()
+        stale = {}
+        for item, inputs in items.items():
+            key = stage.key(self.cache, inputs)
+            outputs_present = all(os.path.exists(path) for path in stage.outputs(item, inputs))
+            if self.cache.get(stage.name, item) != key or not outputs_present:
+                stale[item] = (inputs, key)
+
+        logging.info(f"[{stage.name}] {len(items) - len(stale)} cached, {len(stale)} to run")
+
+        def execute(item):
+            inputs, key = stale[item]
+            for path in stage.outputs(item, inputs) if stage.clear_outputs else []:
+                if os.path.exists(path):
+                    os.remove(path)
+            stage.run(item, inputs)
+            self.cache.put(stage.name, item, key)
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=stage.num_workers) as executor:
+            futures = {executor.submit(execute, item): item for item in stale}
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"[{stage.name}] Error on {futures[future]}: {str(e)}")
+        self.cache.save()
+
+        return {"cached": len(items) - len(stale), "ran": len(stale) - failed, "failed": failed}
+
+    def run(self, targets: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """Run the requested stages and their dependencies; stages whose dependencies are done run concurrently."""
+        needed, todo = set(), list(targets or self.stages)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].depends_on)
+
+        results, running = {}, {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel_stages) as executor:
+            while len(results) < len(needed):
+                for name in needed:
+                    stage = self.stages[name]
+                    if name not in results and name not in running and all(dep in results for dep in stage.depends_on):
+                        running[name] = executor.submit(self.run_stage, stage)
+                if not running:
+                    raise ValueError(f"Dependency cycle between stages: {', '.join(sorted(needed - set(results)))}")
+
+                done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+                for name in [name for name, future in running.items() if future in done]:
+                    results[name] = running.pop(name).result()
+
+        return results
+
+
+def build_pipeline(settings: Dict[str, Any]) -> Pipeline:
+    """The InitMatchInfo -> TitleProcessing -> DurationProcessing -> AudioProcessing and matching stages."""
+    from InitMatchInfo import InitMatchInfo
+    from TitleProcessing import VideoFileRenamer
+    from DurationProcessing import VideoTimeCutter
+    from AudioProcessing import extract_audio, save_excitement_envelope, AUDIO_EXTENSIONS
+    from MatchStreamsWithHighlights import MatchHighlightsMatcher
+
+    data_folder = os.path.join(os.path.dirname(__file__), "..", "data")
+    folders = settings["folders"]
+    cut_params = settings.get("cut", {})
+    audio_params = settings.get("audio", {"mode": "wav"})
+    audio_extension = AUDIO_EXTENSIONS[audio_params["mode"]]
+
+    def data_item(*files):
+        return lambda: {"all": [os.path.join(data_folder, file) for file in files]}
+
+    def video_folder_item(json_file, folder):
+        # The info file depends on the fetcher file and on which videos are in the folder
+        return lambda: {"all": [os.path.join(data_folder, json_file)] + sum(list_videos(folder).values(), [])}
+
+    stages = []
+    for kind, json_file, info_file in (("streams", "youtube_streams.json", "Full_Match_Info.json"),
+                                        ("highlights", "youtube_highlights.json", "Highlight_Match_Info.json")):
+        original, processed = folders[f"{kind}_original"], folders[f"{kind}_processed"]
+        stages.append(Stage(
+            f"init_{kind}",
+            lambda item, inputs, j=json_file, o=original, i=info_file:
+                InitMatchInfo(j, o, i).initialize_match_infomation(incremental=True),
+            video_folder_item(json_file, original),
+            code=["InitMatchInfo.py", "TitleNormalization.py"],
+            outputs=lambda item, inputs, i=info_file: [os.path.join(data_folder, i)],
+        ))
+        stages.append(Stage(
+            f"rename_{kind}",
+            lambda item, inputs, o=original, p=processed, i=info_file:
+                VideoFileRenamer(o, p, i, mode=settings.get("placement_mode", "hardlink")).process_files(),
+            video_folder_item(info_file, original),
+            params={"mode": settings.get("placement_mode", "hardlink")},
+            depends_on=[f"init_{kind}"],
+            code=["TitleProcessing.py", "TitleNormalization.py"],
+        ))
+
+    cutter = VideoTimeCutter(folders["streams_processed"], folders["streams_cut"], **cut_params)
+
+    def cut(item, inputs):
+        success, message = cutter.process_single_video(inputs[0])
+        if not success:
+            raise RuntimeError(message)
+
+    stages.append(Stage(
+        "cut_streams", cut, lambda: list_videos(folders["streams_processed"]),
+        params=cut_params,
+        depends_on=["rename_streams"],
+        code=["DurationProcessing.py", "KeyframeTrimmer.py"],
+        # process_single_video keeps the source file name, extension included
+        outputs=lambda item, inputs: [os.path.join(folders["streams_cut"], os.path.basename(inputs[0]))],
+        num_workers=settings.get("num_workers", 4),
+    ))
+    stages.append(Stage(
+        "audio_streams",
+        lambda item, inputs: extract_audio(inputs[0], folders["audio"], **audio_params),
+        lambda: list_videos(folders["streams_cut"]),
+        params=audio_params,
+        depends_on=["cut_streams"],
+        code=["AudioProcessing.py"],
+        outputs=lambda item, inputs: [os.path.join(folders["audio"], f"{item}{audio_extension}")],
+        clear_outputs=True,
+        num_workers=settings.get("num_workers", 4),
+    ))
+    if audio_params["mode"] != "copy":
+        stages.append(Stage(
+            "excitement_streams",
+            lambda item, inputs: save_excitement_envelope(inputs[0], folders["features"]),
+            lambda: {
+                os.path.splitext(file)[0]: [os.path.join(folders["audio"], file)]
+                for file in sorted(os.listdir(folders["audio"])) if file.endswith(audio_extension)
+            },
+            depends_on=["audio_streams"],
+            code=["AudioProcessing.py"],
+            outputs=lambda item, inputs: [os.path.join(folders["features"], f"{item}.excitement.npz")],
+            clear_outputs=True,
+            num_workers=settings.get("num_workers", 4),
+        ))
+
+    match_params = settings.get("match", {"min_similarity": 0.6})
+    stages.append(Stage(
+        "match",
+        lambda item, inputs: MatchHighlightsMatcher(
+            match_params["min_similarity"], folders["streams_original"], folders["highlights_original"]
+        ).create_relationship_json("Full_Match_Info.json", "Highlight_Match_Info.json",
+                                   "Match_Streams_With_Highlights.json", state_file="match_state.json"),
+        data_item("Full_Match_Info.json", "Highlight_Match_Info.json"),
+        params=match_params,
+        depends_on=["init_streams", "init_highlights"],
+        code=["MatchStreamsWithHighlights.py", "TitleNormalization.py"],
+        outputs=lambda item, inputs: [os.path.join(data_folder, "Match_Streams_With_Highlights.json")],
+    ))
+
+    os.makedirs(folders["audio"], exist_ok=True)
+    os.makedirs(folders["features"], exist_ok=True)
+    return Pipeline(stages, max_parallel_stages=settings.get("max_parallel_stages", 4))
+
+
+def main():
+    settings = {
+        "folders": {
+            "streams_original": "F:/original",
+            "streams_processed": "F:/processed_original",
+            "streams_cut": "F:/processed_original_cut",
+            "highlights_original": "F:/highlight",
+            "highlights_processed": "F:/processed_highlight",
+            "audio": "F:/audio",
+            "features": "F:/features",
+        },
+        "placement_mode": "hardlink",
+        "cut": {"num_samples": 20, "green_threshold": 0.3, "output_mode": "copy"},
+        "audio": {"mode": "wav"},
+        "match": {"min_similarity": 0.6},
+        "num_workers": 4,
+    }
+
+    try:
+        results = build_pipeline(settings).run()
+        for name, counts in results.items():
+            print(f"{name}: {counts}")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import os
+import re
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable
+
+import cv2
+import numpy as np
+
+from DurationProcessing import iter_sampled_frames
+from Catalog import Catalog
+from Instrumentation import metrics
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+CLOCK_PATTERN = re.compile(r'(\d{1,3})\s*[:.]\s*([0-5]\d)')
+# "1-0", "1 – 0", "1:0" or "1 0"; a channel can override it with "score_pattern" in its cached ROI
+SCORE_PATTERN = re.compile(r'(?<!\d)(\d{1,2})(?:\s*[-–:]\s*|\s+)(\d{1,2})(?!\d)')
+TESSERACT_CONFIG = "--psm 7 -c tessedit_char_whitelist=0123456789:-"
+
+
+def tesseract_ocr(image: np.ndarray) -> str:
+    if pytesseract is None:
+        raise ImportError("pytesseract is required for scoreboard OCR (pip install pytesseract)")
+    return pytesseract.image_to_string(image, config=TESSERACT_CONFIG)
+
+
+def parse_scoreboard(text: str, score_pattern: re.Pattern = SCORE_PATTERN) -> Dict[str, Any]:
+    """Match clock (seconds) and score (home, away) found in the OCR text, None when missing."""
+    clock = CLOCK_PATTERN.search(text)
+    # Remove the clock first so "45:12" is never read as a score
+    rest = text[:clock.start()] + " " + text[clock.end():] if clock else text
+    score = score_pattern.search(rest)
+    return {
+        "clock": int(clock.group(1)) * 60 + int(clock.group(2)) if clock else None,
+        "score": [int(score.group(1)), int(score.group(2))] if score else None,
+    }
+
+
+class RoiCache:
+    """Scoreboard ROI per channel, stored as fractions of the frame size in data/<cache_file>.
+
+    An entry may also hold a "score_pattern" regex (two groups: home, away) for channels
+    whose overlay separates the scores in a way SCORE_PATTERN does not accept.
+    """
+
+    def __init__(self, cache_file: str = "scoreboard_rois.json"):
+        self.cache_path = os.path.join(os.path.dirname(__file__), "..", "data", cache_file)
+        self._lock = threading.Lock()
+        self.rois: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                self.rois = json.load(f)
+
+    def get(self, channel_id: str) -> Optional[Dict[str, Any]]:
+        return self.rois.get(channel_id)
+
+    def put(self, channel_id: str, roi: Dict[str, Any]):
+        with self._lock:
+            self.rois[channel_id] = roi
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.rois, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_path)
+
+
+class ScoreboardReader:
+    """Reads the score/clock overlay of a match and emits a score and clock timeline.
+
+    The overlay is located once per channel: it is the region that stays static while
+    the picture behind it moves, and it has dense edges (text). Every sampled frame is then
+    compared with the last OCR'd crop on a small grayscale thumbnail; OCR only runs when
+    the score part changed. The ticking clock digits are masked out of that comparison
+    and read every clock_interval seconds instead.
+
+    A reading exactly one goal away from the current score is a goal. Any other new score
+    is only trusted once it has been read confirm_reads times in a row; the score then
+    re-syncs to it and the change is recorded as an uncertain event.
+    """
+
+    def __init__(self, output_folder: str, catalog: Optional[Catalog] = None, roi_cache: Optional[RoiCache] = None,
+                 ocr: Optional[Callable[[np.ndarray], str]] = None, watch_fps: float = 2.0,
+                 clock_interval: float = 60.0, change_threshold: float = 0.02, search_region: float = 0.35,
+                 calibration_samples: int = 60, clock_calibration: float = 30.0, confirm_reads: int = 3):
+        self.output_folder = output_folder
+        self.catalog = catalog
+        self.roi_cache = roi_cache or RoiCache()
+        self.ocr = ocr or tesseract_ocr
+        self.watch_fps = watch_fps
+        self.clock_interval = clock_interval
+        # Fraction of changed thumbnail pixels above which the scoreboard changed; a single
+        # digit is only a few percent of the overlay, so a mean difference would miss it
+        self.change_threshold = change_threshold
+        # Fraction of the frame height (from the top) where the overlay is searched
+        self.search_region = search_region
+        self.calibration_samples = calibration_samples
+        # Seconds watched at the start of each video to learn where the clock ticks
+        self.clock_calibration = clock_calibration
+        # Consecutive identical readings after which a score that is not a single goal away
+        # is accepted anyway (misread first reading, overlay hidden during a goal)
+        self.confirm_reads = confirm_reads
+        os.makedirs(output_folder, exist_ok=True)
+
+    @staticmethod
+    def _duration(video_path: str) -> float:
+        cap = cv2.VideoCapture(video_path)
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / (cap.get(cv2.CAP_PROP_FPS) or 25.0)
+        cap.release()
+        return duration
+
+    def locate_roi(self, video_path: str) -> Dict[str, Any]:
+        """Find the overlay: low temporal variance and high edge density in the top of the frame."""
+        duration = self._duration(video_path)
+        sample_times = np.linspace(0.1 * duration, 0.9 * duration, self.calibration_samples)
+        grays, edges, frame_h = [], [], None
+        for _, frame in iter_sampled_frames(video_path, sample_times, width=640):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            frame_h = gray.shape[0]
+            gray = gray[:int(frame_h * self.search_region)]
+            grays.append(gray.astype(np.float32))
+            edges.append(cv2.Canny(gray, 100, 200) > 0)
+        if len(grays) < 2:
+            raise RuntimeError("Not enough frames to locate the scoreboard")
+
+        # The overlay background is static; its digits change now and then, so they are
+        # filled in by the closing and only required to show edges in some samples
+        static = (np.std(grays, axis=0) < 8).astype(np.uint8)
+        # Opening drops thin static lines (pitch markings) before the closing could join them to the overlay
+        mask = cv2.morphologyEx(static, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((9, 25), np.uint8))
+        texty = np.mean(edges, axis=0) > 0.1
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask)
+        frame_w = grays[0].shape[1]
+        # Pitch lines and banners also stay put but span most of the width
+        candidates = [
+            i for i in range(1, count)
+            if stats[i, cv2.CC_STAT_WIDTH] < 0.6 * frame_w and texty[labels == i].mean() > 0.05
+        ]
+        if not candidates:
+            raise RuntimeError("No static overlay found")
+
+        # Largest component, padded a little so the digits are not clipped
+        x, y, w, h, _ = stats[max(candidates, key=lambda i: stats[i, cv2.CC_STAT_AREA])]
+        x, y = max(0, x - 4), max(0, y - 4)
+        w, h = min(frame_w - x, w + 8), min(frame_h - y, h + 8)
+        return {"x": float(x / frame_w), "y": float(y / frame_h), "w": float(w / frame_w), "h": float(h / frame_h)}
+
+    def channel_id(self, video_id: str) -> str:
+        channel_id = self.catalog.channel_of(video_id) if self.catalog is not None else None
+        return channel_id or "default"
+
+    def roi_for(self, video_path: str, channel_id: str) -> Dict[str, Any]:
+        roi = self.roi_cache.get(channel_id)
+        if roi is None:
+            with metrics.timer("locate_roi"):
+                roi = self.locate_roi(video_path)
+            roi.update(source=os.path.basename(video_path), updated=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            self.roi_cache.put(channel_id, roi)
+            logging.info(f"Located scoreboard of channel {channel_id}: {roi}")
+        return roi
+
+    @staticmethod
+    def crop(frame: np.ndarray, roi: Dict[str, Any]) -> np.ndarray:
+        h, w = frame.shape[:2]
+        x0, y0 = int(roi["x"] * w), int(roi["y"] * h)
+        x1, y1 = int((roi["x"] + roi["w"]) * w), int((roi["y"] + roi["h"]) * h)
+        return frame[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
+
+    @staticmethod
+    def thumbnail(crop: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (96, 24), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    @staticmethod
+    def prepare(crop: np.ndarray) -> np.ndarray:
+        """Upscaled, binarized crop for tesseract, dark text on a light background."""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary if np.mean(binary) > 127 else 255 - binary
+
+    def volatile_mask(self, thumbnails: List[np.ndarray]) -> np.ndarray:
+        """Pixels that change repeatedly during calibration: the seconds digits of the clock.
+
+        The minute digits change once a minute and still trigger OCR, which doubles as the clock read.
+        """
+        changes = np.mean([np.abs(b - a) > 25 for a, b in zip(thumbnails, thumbnails[1:])], axis=0)
+        mask = cv2.dilate((changes > 0.03).astype(np.uint8), np.ones((3, 3), np.uint8))
+        return mask > 0
+
+    def read_video(self, video_path: str, channel_id: Optional[str] = None) -> Dict[str, Any]:
+        video_id = os.path.splitext(os.path.basename(video_path))[0]
+        channel_id = channel_id or self.channel_id(video_id)
+        roi = self.roi_for(video_path, channel_id)
+        score_pattern = re.compile(roi["score_pattern"]) if roi.get("score_pattern") else SCORE_PATTERN
+
+        duration = self._duration(video_path)
+        sample_times = np.arange(0, duration, 1.0 / self.watch_fps)
+        readings, events = [], []
+        ocr_calls, frames_checked = 0, 0
+        score, reference, volatile, calibration = None, None, None, []
+        # Candidate score waiting for confirmation: {"score", "t", "clock", "reads"}
+        pending = None
+        last_clock_read = -np.inf
+
+        for t, frame in iter_sampled_frames(video_path, sample_times):
+            frames_checked += 1
+            crop = self.crop(frame, roi)
+            thumb = self.thumbnail(crop)
+
+            # Learn which pixels tick with the clock from the first seconds of samples
+            if volatile is None:
+                calibration.append(thumb)
+                if len(calibration) < self.watch_fps * self.clock_calibration:
+                    continue
+                volatile = self.volatile_mask(calibration)
+                calibration = None
+
+            stable = ~volatile
+            changed = reference is None or (
+                stable.any() and np.mean(np.abs(thumb - reference)[stable] > 40) > self.change_threshold
+            )
+            # A pending score is re-read on every sample until it is confirmed or dropped
+            clock_due = t - last_clock_read >= self.clock_interval or pending is not None
+            if not changed and not clock_due:
+                continue
+
+            with metrics.timer("ocr"):
+                parsed = parse_scoreboard(self.ocr(self.prepare(crop)), score_pattern)
+            ocr_calls += 1
+            last_clock_read = t
+            readings.append({"t": round(float(t), 2), **parsed})
+            if changed:
+                reference = thumb
+
+            new_score = parsed["score"]
+            if new_score is None:
+                continue
+            if new_score == score:
+                pending = None
+                continue
+            if score is not None and self.is_goal(score, new_score):
+                team = "home" if new_score[0] > score[0] else "away"
+                events.append({"t": round(float(t), 2), "type": "goal", "team": team,
+                               "score": new_score, "clock": parsed["clock"], "uncertain": False})
+                score, pending = new_score, None
+                continue
+
+            # First reading, or a jump that is not a single goal: wait until it is read consistently
+            if pending is None or pending["score"] != new_score:
+                pending = {"score": new_score, "t": round(float(t), 2), "clock": parsed["clock"], "reads": 0}
+            pending["reads"] += 1
+            if pending["reads"] < self.confirm_reads:
+                continue
+            if score is not None:
+                events.append(self.resync_event(score, pending))
+                logging.warning(f"{video_id}: score re-synced from {score} to {new_score} at {pending['t']:.2f}s")
+            score, pending = new_score, None
+
+        metrics.count("ocr_calls", ocr_calls)
+        timeline = {
+            "video_id": video_id,
+            "channel_id": channel_id,
+            "roi": roi,
+            "watch_fps": self.watch_fps,
+            "frames_checked": frames_checked,
+            "ocr_calls": ocr_calls,
+            "final_score": score,
+            "events": events,
+            "readings": readings,
+        }
+        with open(os.path.join(self.output_folder, f"{video_id}.scoreboard.json"), 'w', encoding='utf-8') as f:
+            json.dump(timeline, f, ensure_ascii=False, indent=2)
+        return timeline
+
+    @staticmethod
+    def is_goal(score: List[int], new_score: List[int]) -> bool:
+        """Exactly one side scored exactly once."""
+        diff = (new_score[0] - score[0], new_score[1] - score[1])
+        return diff in ((1, 0), (0, 1))
+
+    @staticmethod
+    def resync_event(score: List[int], pending: Dict[str, Any]) -> Dict[str, Any]:
+        """Uncertain event for a confirmed score that is not a single goal away from the previous one.
+
+        A non-decreasing jump is one or more missed goals (overlay hidden, two goals between
+        reads); anything else means an earlier reading was wrong and is only a correction.
+        """
+        new_score = pending["score"]
+        if new_score[0] >= score[0] and new_score[1] >= score[1]:
+            scored = [side for side, before, after in zip(("home", "away"), score, new_score) if after > before]
+            event_type, team = "goal", scored[0] if len(scored) == 1 else "both"
+        else:
+            event_type, team = "correction", None
+        return {"t": pending["t"], "type": event_type, "team": team, "score": new_score,
+                "previous_score": score, "clock": pending["clock"], "uncertain": True}
+
+    def process_batch(self, input_folder: str) -> Dict[str, Any]:
+        """Read every video in input_folder; the first video of a channel locates its ROI."""
+        results = {}
+        for video_file in sorted(os.listdir(input_folder)):
+            if not video_file.endswith(('.mp4', '.mkv', '.avi')):
+                continue
+            try:
+                with metrics.video(os.path.splitext(video_file)[0], task="scoreboard"):
+                    timeline = self.read_video(os.path.join(input_folder, video_file))
+                results[video_file] = timeline
+                goals = sum(1 for event in timeline["events"] if event["type"] == "goal")
+                logging.info(f"{video_file}: {goals} goals, {timeline['ocr_calls']} OCR calls "
+                             f"for {timeline['frames_checked']} frames")
+            except Exception as e:
+                logging.error(f"Error reading scoreboard of {video_file}: {str(e)}")
+        return results
+
+
+def main():
+    try:
+        catalog = Catalog()
+        reader = ScoreboardReader("F:/scoreboard", catalog=catalog)
+        reader.process_batch("F:/processed_original_cut")
+        catalog.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import os
+import json
+import cv2
+import numpy as np
+from DurationProcessing import VideoTimeCutter, iter_sampled_frames
+
+
+class ShotBoundaryDetector(VideoTimeCutter):
+    """Chia video thành các shot trong một lượt giải mã và lưu danh sách shot ra JSON"""
+
+    def __init__(self, input_folder, output_folder, analysis_fps=10, signature_width=None,
+                 hard_threshold=0.5, soft_threshold=0.1, min_shot_length=0.5, **kwargs):
+        super().__init__(input_folder, output_folder, **kwargs)
+        self.analysis_fps = analysis_fps
+        # Frame đưa vào frame_signature đã được thu nhỏ về analysis_width (hoặc chiều rộng của proxy),
+        # nên signature_width chỉ có tác dụng khi nhỏ hơn chiều rộng đó; None: dùng mọi điểm ảnh
+        self.signature_width = signature_width
+        self.hard_threshold = hard_threshold
+        self.soft_threshold = soft_threshold
+        self.min_shot_length = min_shot_length
+
+    def frame_signature(self, frame):
+        """Histogram màu 4×4×4 đã chuẩn hóa của frame phân tích, lấy thưa còn khoảng signature_width cột"""
+        step = max(1, frame.shape[1] // self.signature_width) if self.signature_width else 1
+        small = np.ascontiguousarray(frame[::step, ::step])
+        hist = cv2.calcHist([small], [0, 1, 2], None, [4, 4, 4], [0, 256, 0, 256, 0, 256]).ravel()
+        return hist / max(hist.sum(), 1.0)
+
+    @staticmethod
+    def signature_distance(sig1, sig2):
+        """Khoảng cách L1 giữa hai histogram, chuẩn hóa về [0, 1]"""
+        return 0.5 * float(np.abs(sig1 - sig2).sum())
+
+    def detect_shots(self, video_path, batch_size=256):
+        """Phát hiện cắt cảnh (hard cut) và chuyển cảnh dần (gradual) bằng phương pháp twin-comparison"""
+        shots = []
+        state = {
+            "shot_start": 0.0,
+            "transition": None,
+            "ratio_sum": 0.0,
+            "ratio_count": 0,
+            "prev": None,        # (t, signature) của frame trước
+            "candidate": None,   # (t, signature) nơi bắt đầu một chuyển cảnh dần
+            "quiet": 0,          # số frame liên tiếp dưới soft_threshold trong lúc chuyển cảnh
+        }
+
+        def close_shot(t, transition, force=False):
+            # Shot quá ngắn (ví dụ đèn flash) được gộp vào shot hiện tại
+            if t - state["shot_start"] < self.min_shot_length and not force:
+                return
+            shots.append({
+                "start": round(float(state["shot_start"]), 3),
+                "end": round(float(t), 3),
+                "pitch_ratio": round(state["ratio_sum"] / max(state["ratio_count"], 1), 4),
+                "transition_in": state["transition"],
+            })
+            state.update(shot_start=t, transition=transition, ratio_sum=0.0, ratio_count=0)
+
+        def consume(times, frames):
+            ratios = self.green_ratios(frames)
+            for t, frame, ratio in zip(times, frames, ratios):
+                signature = self.frame_signature(frame)
+                if state["prev"] is not None:
+                    prev_t, prev_signature = state["prev"]
+                    distance = self.signature_distance(prev_signature, signature)
+                    if distance > self.hard_threshold:
+                        close_shot(t, "cut")
+                        state["candidate"] = None
+                    elif distance > self.soft_threshold:
+                        state["quiet"] = 0
+                        if state["candidate"] is None:
+                            state["candidate"] = (prev_t, prev_signature)
+                        elif self.signature_distance(state["candidate"][1], signature) > self.hard_threshold:
+                            close_shot(state["candidate"][0], "gradual")
+                            state["candidate"] = None
+                    else:
+                        # Cho phép một frame "lặng" giữa chừng trước khi hủy ứng viên chuyển cảnh dần
+                        state["quiet"] += 1
+                        if state["quiet"] > 1:
+                            state["candidate"] = None
+
+                state["prev"] = (t, signature)
+                state["ratio_sum"] += float(ratio)
+                state["ratio_count"] += 1
+
+        if self.proxy_cache is not None:
+            # Đọc thẳng các lô từ memmap của proxy (view, không copy); tần số phân tích là fps của proxy
+            proxy = self.proxy_cache.get(video_path)
+            frame_interval = 1.0 / proxy.fps
+            for times, frames in proxy.iter_batches(batch_size):
+                consume(times, frames)
+
+        else:
+            cap = cv2.VideoCapture(video_path)
+            if not cap.isOpened():
+                raise IOError(f"Cannot open video: {video_path}")
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+            cap.release()
+
+            frame_interval = 1.0 / self.analysis_fps
+            sample_times = np.arange(0, duration, frame_interval)
+            times, frames = [], []
+            for t, frame in iter_sampled_frames(video_path, sample_times, self.analysis_width):
+                times.append(t)
+                frames.append(frame)
+                if len(frames) == batch_size:
+                    consume(times, np.stack(frames))
+                    times, frames = [], []
+            if frames:
+                consume(times, np.stack(frames))
+
+        # Không giải mã được frame nào: coi là lỗi thay vì trả về danh sách shot rỗng
+        if state["prev"] is None:
+            raise IOError(f"No frames decoded from {video_path}")
+        close_shot(state["prev"][0] + frame_interval, None, force=True)
+
+        return shots
+
+    def process_single_video(self, video_path):
+        """Tạo danh sách shot cho một video và lưu thành <video_id>.shots.json"""
+        try:
+            video_id = os.path.splitext(os.path.basename(video_path))[0]
+            shots = self.detect_shots(video_path)
+
+            output_path = os.path.join(self.output_folder, f"{video_id}.shots.json")
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "video_id": video_id,
+                    "analysis_fps": self.proxy_cache.fps if self.proxy_cache is not None else self.analysis_fps,
+                    "total_shots": len(shots),
+                    "shots": shots,
+                }, f, ensure_ascii=False)
+
+            return True, video_path
+
+        except Exception as e:
+            return False, f"Error detecting shots in {video_path}: {str(e)}"
+
+
+if __name__ == "__main__":
+    detector = ShotBoundaryDetector(
+        input_folder="F:/processed_original",
+        output_folder="F:/shots"
+    )
+    detector.process_batch(num_workers=4)
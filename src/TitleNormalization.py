@@ -0,0 +1,71 @@
+import re
+import html
+import hashlib
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+# Characters that NFKD does not fold on its own: the slash look-alike yt-dlp puts in file
+# names and the Vietnamese đ, which has no decomposition
+FOLD_TABLE = str.maketrans({"⧸": "/", "đ": "d", "Đ": "D"})
+
+# Everything that is not a letter, digit or whitespace goes in one pass: punctuation,
+# emoji and the combining marks left over from NFKD (Vietnamese diacritics)
+STRIP_PATTERN = re.compile(r"[^\w\s]|_")
+
+KEY_CACHE_SIZE = 1 << 16
+
+
+def generate_hash(value: str) -> str:
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def _normalize(title: str) -> str:
+    if "&" in title:
+        # YouTube API titles are HTML-escaped (&amp;, &#39;, &quot;), file names are not
+        title = html.unescape(title)
+    title = unicodedata.normalize("NFKD", title.translate(FOLD_TABLE)).lower()
+    return '_'.join(STRIP_PATTERN.sub('', title).split())
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _normalize_and_key(title: str) -> Tuple[str, str]:
+    normalized = _normalize(title)
+    return normalized, generate_hash(normalized)
+
+
+def normalize_and_key(title: str) -> Tuple[str, str]:
+    """Canonical form of a video title or file name and the hash used to match them."""
+    if not isinstance(title, str):
+        title = ""
+    return _normalize_and_key(title)
+
+
+def normalize_title(title: str) -> str:
+    return normalize_and_key(title)[0]
+
+
+def title_key(title: str) -> str:
+    return normalize_and_key(title)[1]
+
+
+def _batch(titles: Iterable[str], field: int) -> List[str]:
+    # A column usually repeats titles, and may hold more distinct ones than the LRU keeps
+    seen = {}
+    results = []
+    for title in titles:
+        if not isinstance(title, str):
+            title = ""
+        if title not in seen:
+            seen[title] = _normalize_and_key(title)[field]
+        results.append(seen[title])
+    return results
+
+
+def normalize_titles(titles: Iterable[str]) -> List[str]:
+    """Normalize a whole title column at once."""
+    return _batch(titles, 0)
+
+
+def title_keys(titles: Iterable[str]) -> List[str]:
+    return _batch(titles, 1)
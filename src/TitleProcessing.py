@@ -1,39 +1,90 @@
-import re
 import os
 import json
 import shutil
+import hashlib
 from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any
 import logging
-import hashlib
+
+from TitleNormalization import normalize_title, title_key, title_keys
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def generate_hash(value: str) -> str:
-    return hashlib.md5(value.encode('utf-8')).hexdigest()
-
-def clean_title(title: str) -> str:
-    if not isinstance(title, str):
-        return ""
-    title = re.sub(r"[/.🔴:|：｜⧸'&＂-]", '', title)
-    title = title.lower()
-    return '_'.join(title.split())
-
-def clean_text(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    text = text.lower()
-    text = re.sub(r"[/.🔴:|'&-]", '', text)
-    text = re.sub(r"amp;", "", text)
-    text = re.sub(r"#39;", "", text)
-    text = re.sub(r"quot;", "", text)
-    return '_'.join(text.split())
+# How a matched file is placed under its video_id name. Every mode except "copy" is a
+# metadata operation; when it is not possible (other drive, no reflink support) the file
+# falls back to a verified copy.
+PLACEMENT_MODES = ("copy", "hardlink", "reflink", "move", "symlink")
+
+# Linux FICLONE ioctl (btrfs, xfs, bcachefs)
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def reflink(source_path: str, destination_path: str):
+    """Copy-on-write clone: the new file shares the data blocks of the source."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflink is not supported on this platform")
+
+    with open(source_path, 'rb') as src, open(destination_path, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination_path)
+            raise
+    shutil.copystat(source_path, destination_path)
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_with_checksum(source_path: str, destination_path: str, verify: bool = True) -> str:
+    """Copy through a temporary file, hashing the data on the way, and check the written file."""
+    tmp_path = f"{destination_path}.part"
+    digest = hashlib.blake2b()
+    with open(source_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+    checksum = digest.hexdigest()
+
+    if verify and file_checksum(tmp_path) != checksum:
+        os.remove(tmp_path)
+        raise IOError(f"Checksum mismatch while copying {source_path}")
+    shutil.copystat(source_path, tmp_path)
+    os.replace(tmp_path, destination_path)
+    return checksum
+
 
 class VideoFileRenamer:
-    def __init__(self, source_folder: str, destination_folder: str, json_file: str):
+    def __init__(self, source_folder: str, destination_folder: str, json_file: str, catalog=None,
+                 mode: str = "copy", num_workers: int = 4, verify: bool = True, dry_run: bool = False,
+                 catalog_type: str = None):
+        if mode not in PLACEMENT_MODES:
+            raise ValueError(f"Unknown placement mode: {mode}. Use one of {', '.join(PLACEMENT_MODES)}")
+        if catalog is not None and catalog_type is None:
+            raise ValueError("catalog_type (stream, highlight or short) is required with a catalog")
+
         self.source_folder = source_folder
+        # Optional Catalog: file names are then resolved by a title-hash query of catalog_type
+        # instead of json_file, so a stream file never resolves to a highlight with the same title
+        self.catalog = catalog
+        self.catalog_type = catalog_type
+        self.mode = mode
+        self.num_workers = num_workers
+        self.verify = verify
+        self.dry_run = dry_run
         self.destination_folder = destination_folder
         self.json_file = os.path.join(
             os.path.dirname(__file__),
@@ -44,10 +95,10 @@ class VideoFileRenamer:
         os.makedirs(destination_folder, exist_ok=True)
 
     def find_matching_video(self, filename: str, datas: list) -> dict:
-        cleaned_filename = self.clean_title(filename)
+        cleaned_filename = normalize_title(filename)
 
         for video in datas:
-            json_title = self.clean_text(video.get("title", ""))
+            json_title = normalize_title(video.get("title", ""))
             similarity = SequenceMatcher(None, cleaned_filename, json_title).ratio()
 
             if similarity >= 0.95:
@@ -58,44 +109,111 @@ class VideoFileRenamer:
                 }
         return None
 
-    def process_files(self):
+    def place(self, source_path: str, destination_path: str) -> str:
+        """Place one file with the configured mode; returns the mode used or "copy" when it must fall back."""
+        if self.mode == "copy":
+            return "copy"
+
         try:
-            with open(self.json_file, 'r', encoding="utf-8") as f:
-                file_data = json.load(f)
+            if self.mode == "hardlink":
+                os.link(source_path, destination_path)
+            elif self.mode == "reflink":
+                reflink(source_path, destination_path)
+            elif self.mode == "move":
+                # os.rename is atomic but only within one filesystem
+                os.rename(source_path, destination_path)
+            elif self.mode == "symlink":
+                os.symlink(os.path.abspath(source_path), destination_path)
+            return self.mode
+        except OSError as e:
+            logging.warning(f"{self.mode} failed for {source_path} ({str(e)}), falling back to copy")
+            return "copy"
+
+    def _copy_file(self, source_path: str, destination_path: str) -> str:
+        checksum = copy_with_checksum(source_path, destination_path, self.verify)
+        if self.mode == "move":
+            os.remove(source_path)
+        return checksum
+
+    def execute_plan(self, plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run metadata placements first, then copy the remaining files in parallel."""
+        to_copy = []
+        for entry in plan:
+            if os.path.exists(entry["destination_path"]):
+                entry["mode"] = "existing"
+                continue
+            entry["mode"] = self.place(entry["source_path"], entry["destination_path"])
+            if entry["mode"] == "copy":
+                to_copy.append(entry)
+
+        if to_copy:
+            logging.info(f"Copying {len(to_copy)} files with {self.num_workers} workers")
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                futures = {
+                    executor.submit(self._copy_file, entry["source_path"], entry["destination_path"]): entry
+                    for entry in to_copy
+                }
+                for future in as_completed(futures):
+                    entry = futures[future]
+                    try:
+                        entry["checksum"] = future.result()
+                    except Exception as e:
+                        entry["mode"] = "failed"
+                        logging.error(f"Error copying {entry['source_path']}: {str(e)}")
+
+        return plan
 
-            datas = file_data.get("infos")
-            processed_count = 0
+    def process_files(self) -> List[Dict[str, Any]]:
+        try:
+            plan = []
             skipped_count = 0
 
             video_info_by_hash = {}
-            for video in datas:
-                hashed_title = generate_hash(clean_text(video["title"]))
-                video_info_by_hash[hashed_title] = video
+            if self.catalog is None:
+                with open(self.json_file, 'r', encoding="utf-8") as f:
+                    file_data = json.load(f)
+
+                datas = file_data.get("infos")
+                video_info_by_hash = dict(zip(title_keys(video["title"] for video in datas), datas))
 
             for file_name in os.listdir(self.source_folder):
                 if file_name.endswith(".mp4"):
-                    cleaned_file_name = clean_title(os.path.splitext(file_name)[0])
-                    hashed_file_name = generate_hash(cleaned_file_name)
+                    hashed_file_name = title_key(os.path.splitext(file_name)[0])
 
                     # match = self.find_matching_video(filename, datas)
-                    if hashed_file_name in video_info_by_hash:
-                        extension = os.path.splitext(file_name)[1]
-                        new_file_name = f"{video_info_by_hash[hashed_file_name]["video_id"]}{extension}"
-
-                        source_path = os.path.join(self.source_folder, file_name)
-                        destination_path = os.path.join(self.destination_folder, new_file_name)
-                        shutil.copy2(source_path, destination_path)
+                    if self.catalog is not None:
+                        video = self.catalog.find_by_title_hash(hashed_file_name, self.catalog_type)
+                    else:
+                        video = video_info_by_hash.get(hashed_file_name)
 
-                        processed_count += 1
+                    if video is not None:
+                        extension = os.path.splitext(file_name)[1]
+                        new_file_name = f"{video["video_id"]}{extension}"
 
-                        logging.info(f"Processed: {file_name}")
-                        logging.info(f"New name: {new_file_name}")
+                        plan.append({
+                            "video_id": video["video_id"],
+                            "source_path": os.path.join(self.source_folder, file_name),
+                            "destination_path": os.path.join(self.destination_folder, new_file_name),
+                        })
                         # logging.info(f"Similarity: {match["similarity"]:.2%}")
                     else:
                         skipped_count += 1
                         logging.warning(f"No match found for: {file_name}")
 
-            logging.info(f"Processing completed. Processed: {processed_count}, Skipped: {skipped_count}")
+            if self.dry_run:
+                for entry in plan:
+                    print(f"[{self.mode}] {entry['source_path']} -> {entry['destination_path']}")
+                logging.info(f"Dry run: {len(plan)} files would be placed, Skipped: {skipped_count}")
+                return plan
+
+            self.execute_plan(plan)
+            modes = {}
+            for entry in plan:
+                modes[entry["mode"]] = modes.get(entry["mode"], 0) + 1
+                logging.info(f"Processed: {os.path.basename(entry['source_path'])} -> {entry['video_id']} ({entry['mode']})")
+
+            logging.info(f"Processing completed. Processed: {len(plan)} {modes}, Skipped: {skipped_count}")
+            return plan
 
         except Exception as e:
             logging.error(f"Error: {str(e)}")
@@ -108,7 +226,8 @@ def main():
         # "json_file": "Full_Match_Info.json"
         "source_folder": r"F:/highlight",
         "destination_folder": r"F:/processed_highlight",
-        "json_file": "Highlight_Match_Info.json"
+        "json_file": "Highlight_Match_Info.json",
+        "mode": "hardlink",
     }
 
     try:
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+from urllib.parse import urlparse, unquote
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+class DownloadManifest:
+    """Per-video_id download state with the exact output path.
+
+    Each update is appended to <manifest_file>.log instead of rewriting the whole manifest;
+    the log is replayed on load and save() folds it into the JSON snapshot atomically.
+    """
+
+    def __init__(self, manifest_file: str):
+        self.path = os.path.join(os.path.dirname(__file__), "..", "data", manifest_file)
+        self.log_path = f"{self.path}.log"
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Last line cut short by an interrupted run
+                        break
+                    self._apply(record["video_id"], record["fields"])
+
+    def _apply(self, video_id: str, fields: Dict[str, Any]):
+        entry = self.entries.setdefault(video_id, {"status": "pending", "path": None, "attempts": 0})
+        entry.update(fields)
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(video_id)
+
+    def is_done(self, video_id: str) -> bool:
+        entry = self.entries.get(video_id)
+        return bool(entry and entry["status"] == "done" and os.path.exists(entry["path"]))
+
+    def update(self, video_id: str, **fields):
+        fields["updated"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._apply(video_id, fields)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"video_id": video_id, "fields": fields}, ensure_ascii=False) + "\n")
+
+    def save(self):
+        """Write the snapshot atomically and drop the log it now contains."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+
+
+class HostThrottle:
+    """Keep at least min_interval seconds between two download starts on the same host."""
+
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_start: Dict[str, float] = {}
+
+    def wait(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class YtDlpBackend:
+    def __init__(self, binary: Optional[str] = None, video_format: str = "best[height<=480]"):
+        self.binary = binary or shutil.which("yt-dlp") or "yt-dlp"
+        self.video_format = video_format
+
+    def download(self, url: str, output_folder: str, video_id: str) -> str:
+        """Download one video and return the exact file path reported by yt-dlp."""
+        result = subprocess.run([
+            self.binary, "-f", self.video_format,
+            "-o", os.path.join(output_folder, "%(title)s.%(ext)s"),
+            # Resume .part files left by an interrupted run
+            "--continue", "--no-overwrites",
+            "--no-simulate", "--print", "after_move:filepath",
+            url,
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8')
+        if result.returncode != 0:
+            raise RuntimeError(f"yt-dlp failed: {result.stderr.strip()[-500:]}")
+
+        lines = [line for line in result.stdout.splitlines() if line.strip()]
+        if not lines:
+            raise RuntimeError(f"yt-dlp did not report an output file for {video_id}")
+        return lines[-1].strip()
+
+
+class HttpBackend:
+    """Plain HTTP(S) download with Range resume, for direct file URLs and local test servers."""
+
+    def __init__(self, chunk_size: int = 1 << 20, timeout: float = 30.0):
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+
+    def download(self, url: str, output_folder: str, video_id: str) -> str:
+        file_name = os.path.basename(unquote(urlparse(url).path)) or f"{video_id}.mp4"
+        output_path = os.path.join(output_folder, file_name)
+        part_path = f"{output_path}.part"
+
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            # Range not satisfiable: the partial file is already complete
+            os.replace(part_path, output_path)
+            return output_path
+
+        with response:
+            # A server that ignores Range answers 200 with the whole file
+            mode = 'ab' if offset and response.status == 206 else 'wb'
+            with open(part_path, mode) as f:
+                for chunk in iter(lambda: response.read(self.chunk_size), b''):
+                    f.write(chunk)
+
+        os.replace(part_path, output_path)
+        return output_path
+
+
+class DownloadScheduler:
+    def __init__(self, output_folder: str, manifest_file: str = "download_manifest.json", backend=None,
+                 num_workers: int = 4, max_retries: int = 3, backoff: float = 5.0, host_interval: float = 1.0):
+        self.output_folder = output_folder
+        self.manifest = DownloadManifest(manifest_file)
+        self.backend = backend or YtDlpBackend()
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.throttle = HostThrottle(host_interval)
+        os.makedirs(output_folder, exist_ok=True)
+
+    def download_one(self, video: Dict[str, Any]) -> Dict[str, Any]:
+        video_id, url = video["video_id"], video["video_url"]
+        for attempt in range(1, self.max_retries + 1):
+            self.throttle.wait(url)
+            self.manifest.update(video_id, status="downloading", url=url, attempts=attempt)
+            try:
+                path = self.backend.download(url, self.output_folder, video_id)
+                self.manifest.update(video_id, status="done", path=path, error=None)
+                logging.info(f"Downloaded {video_id}: {path}")
+                break
+            except Exception as e:
+                self.manifest.update(video_id, status="failed", error=str(e))
+                logging.warning(f"Attempt {attempt}/{self.max_retries} failed for {video_id}: {str(e)}")
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+        return self.manifest.get(video_id)
+
+    def download_all(self, videos: List[Dict[str, Any]]) -> Dict[str, Any]:
+        pending = [video for video in videos if not self.manifest.is_done(video["video_id"])]
+        logging.info(f"{len(videos) - len(pending)} videos already downloaded, {len(pending)} to go")
+
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                futures = {executor.submit(self.download_one, video): video for video in pending}
+                for future in as_completed(futures):
+                    entry = future.result()
+                    if entry["status"] != "done":
+                        failed.append(futures[future]["video_id"])
+        finally:
+            self.manifest.save()
+
+        logging.info(f"Downloads completed. Success: {len(pending) - len(failed)}, Failed: {len(failed)}")
+        return {"downloaded": len(pending) - len(failed), "failed": failed}
+
+
+def load_videos(json_file: str, start_id: int = 1, num_videos: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Videos of a fetcher output file (streams or highlights) from start_id on."""
+    path = os.path.join(os.path.dirname(__file__), "..", "data", json_file)
+    with open(path, 'r', encoding='utf-8') as f:
+        file_data = json.load(f)
+
+    videos = file_data.get("streams") or file_data.get("videos") or []
+    videos = [video for video in videos if video["id"] >= start_id]
+    return videos[:num_videos] if num_videos else videos
+
+
+def main():
+    try:
+        # scheduler = DownloadScheduler("F:/original", "download_manifest_streams.json")
+        # scheduler.download_all(load_videos("youtube_streams.json", start_id=246))
+        scheduler = DownloadScheduler("F:/highlight", "download_manifest_highlights.json")
+        scheduler.download_all(load_videos("youtube_highlights.json", start_id=371))
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
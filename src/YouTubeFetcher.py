@@ -0,0 +1,299 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import urllib.request
+import urllib.parse
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator
+
+from Catalog import Catalog
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Data API v3 quota units per call
+QUOTA_COSTS = {"search": 100, "videos": 1, "channels": 1}
+VIDEOS_BATCH_SIZE = 50
+# publishedAfter of a watermark that covers the whole channel history
+EPOCH = "1970-01-01T00:00:00Z"
+
+# search.list filters and post-filters of each catalogue type (same rules as the notebook fetchers)
+FETCH_KINDS = {
+    "stream": {"search": {"eventType": "completed"}, "max_duration": None,
+               "url": "https://www.youtube.com/watch?v={}"},
+    "highlight": {"search": {"q": "highlights"}, "max_duration": 1800, "title_filter": True,
+                  "url": "https://www.youtube.com/watch?v={}"},
+    "short": {"search": {"videoDuration": "short"}, "max_duration": 900,
+              "url": "https://www.youtube.com/shorts/{}"},
+}
+
+HIGHLIGHT_PATTERNS = [
+    re.compile(r'highlights?[:]\s*', re.IGNORECASE),
+    re.compile(r'highlights?\s+', re.IGNORECASE),
+    re.compile(r'[\[\(]highlights?[\]\)]', re.IGNORECASE),
+]
+DURATION_PATTERN = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?)?')
+
+
+def is_highlight_title(title: str) -> bool:
+    cleaned_title = re.sub(r'[*_\s]+', ' ', title).strip()
+    return any(pattern.search(cleaned_title) for pattern in HIGHLIGHT_PATTERNS)
+
+
+def parse_duration(value: str) -> float:
+    """ISO 8601 duration of contentDetails.duration (PT1H2M3S) in seconds."""
+    match = DURATION_PATTERN.fullmatch(value or "")
+    if not match:
+        return 0.0
+    days, hours, minutes, seconds = match.groups()
+    return int(days or 0) * 86400 + int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+
+class TokenBucket:
+    """Quota budget: capacity units, refilled continuously; acquire() blocks until enough are available."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, cost: float):
+        if cost > self.capacity:
+            raise ValueError(f"Request cost {cost} exceeds bucket capacity {self.capacity}")
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+                self.updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    self.spent += cost
+                    return
+                wait = (cost - self.tokens) / self.refill_per_second
+            time.sleep(wait)
+
+
+class YouTubeClient:
+    """Minimal Data API v3 REST client; base_url can point at a local fake server."""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://www.googleapis.com/youtube/v3",
+                 timeout: float = 30.0, max_retries: int = 3):
+        self.api_key = api_key or os.environ.get("YOUTUBE_API_KEY", "")
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def list(self, resource: str, **params) -> Dict[str, Any]:
+        query = {key: value for key, value in params.items() if value is not None}
+        query["key"] = self.api_key
+        url = f"{self.base_url}/{resource}?{urllib.parse.urlencode(query)}"
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                    return json.load(response)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"API error on {resource}, retrying ({attempt}/{self.max_retries}): {str(e)}")
+                time.sleep(2 * attempt)
+
+
+class YouTubeFetcher:
+    def __init__(self, catalog: Catalog, client: Optional[YouTubeClient] = None, daily_quota: int = 10000,
+                 num_workers: int = 4):
+        self.catalog = catalog
+        self.client = client or YouTubeClient()
+        # The whole daily quota may be spent at once, then it refills over 24 hours
+        self.quota = TokenBucket(daily_quota, daily_quota / 86400)
+        self.num_workers = num_workers
+        self._id_lock = threading.Lock()
+        self._next_ids: Dict[str, int] = {}
+
+    def _call(self, resource: str, **params) -> Dict[str, Any]:
+        self.quota.acquire(QUOTA_COSTS[resource])
+        return self.client.list(resource, **params)
+
+    def _reserve_ids(self, video_type: str, count: int) -> int:
+        """First of `count` consecutive ids of video_type, so a concurrent fetch of the same type cannot interleave."""
+        with self._id_lock:
+            if video_type not in self._next_ids:
+                self._next_ids[video_type] = self.catalog.max_id(video_type)
+            first = self._next_ids[video_type] + 1
+            self._next_ids[video_type] += count
+            return first
+
+    def channel_title(self, channel_id: str) -> str:
+        response = self._call("channels", part="snippet", id=channel_id)
+        items = response.get("items", [])
+        return items[0]["snippet"]["title"] if items else ""
+
+    def search_ids(self, channel_id: str, video_type: str, published_after: Optional[str] = None,
+                   max_results: int = 2000) -> Iterator[List[str]]:
+        """Page through search.list newest first and yield new video ids in videos.list-sized batches."""
+        kind = FETCH_KINDS[video_type]
+        batch, seen, page_token = [], 0, None
+        # Ids already handed out but possibly not stored yet by the concurrent batches: search
+        # pages can repeat a video, which would otherwise be fetched and numbered twice
+        queued = set()
+        while seen < max_results:
+            response = self._call("search", part="snippet", channelId=channel_id, maxResults=50, type="video",
+                                  order="date", publishedAfter=published_after, pageToken=page_token,
+                                  **kind["search"])
+            items = response.get("items", [])
+            if kind.get("title_filter"):
+                items = [item for item in items if is_highlight_title(item["snippet"]["title"])]
+
+            ids = [item["id"]["videoId"] for item in items]
+            known = self.catalog.known_ids(ids)
+            for video_id in ids:
+                if video_id not in known and video_id not in queued and seen < max_results:
+                    batch.append(video_id)
+                    queued.add(video_id)
+                    seen += 1
+                if len(batch) == VIDEOS_BATCH_SIZE:
+                    yield batch
+                    batch = []
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        if batch:
+            yield batch
+
+    def video_details(self, video_ids: List[str]) -> List[Dict[str, Any]]:
+        response = self._call("videos", part="snippet,statistics,contentDetails,topicDetails,status",
+                              id=",".join(video_ids))
+        return response.get("items", [])
+
+    def build_record(self, details: Dict[str, Any], video_type: str) -> Optional[Dict[str, Any]]:
+        kind = FETCH_KINDS[video_type]
+        snippet = details["snippet"]
+        statistics = details.get("statistics", {})
+        content = details.get("contentDetails", {})
+        duration = parse_duration(content.get("duration"))
+        if kind["max_duration"] and duration > kind["max_duration"]:
+            return None
+
+        published = datetime.strptime(snippet["publishedAt"], '%Y-%m-%dT%H:%M:%SZ')
+        view_count = int(statistics.get("viewCount", 0))
+        like_count = int(statistics.get("likeCount", 0))
+        comment_count = int(statistics.get("commentCount", 0))
+        record = {
+            "id": None,
+            "video_id": details["id"],
+            "video_url": kind["url"].format(details["id"]),
+            "title": snippet["title"],
+            "published_date": snippet["publishedAt"],
+            "description": snippet.get("description", ""),
+            "duration_seconds": duration,
+            "definition": content.get("definition", ""),
+            "view_count": view_count,
+            "like_count": like_count,
+            "comment_count": comment_count,
+            "tags": snippet.get("tags", []),
+            "privacy_status": details.get("status", {}).get("privacyStatus", ""),
+            "day_of_week": published.strftime('%A'),
+            "month_published": published.strftime('%B'),
+            "year_published": published.year,
+        }
+        if video_type == "highlight":
+            record["duration_minutes"] = round(duration / 60, 2)
+        elif video_type == "stream":
+            record.update({
+                "dimension": content.get("dimension", ""),
+                "caption": content.get("caption", ""),
+                "category_id": snippet.get("categoryId", ""),
+                "topics": details.get("topicDetails", {}).get("topicCategories", []),
+                "license": details.get("status", {}).get("license", ""),
+                "embeddable": details.get("status", {}).get("embeddable", False),
+                "hour_published": published.hour,
+                "engagement_ratio": (like_count + comment_count) / view_count * 100 if view_count else 0,
+            })
+        return record
+
+    def _fetch_batch(self, video_ids: List[str], video_type: str) -> List[Dict[str, Any]]:
+        records = [self.build_record(details, video_type) for details in self.video_details(video_ids)]
+        return [record for record in records if record is not None]
+
+    def fetch(self, channel_id: str, video_type: str, max_results: int = 2000) -> int:
+        """Fetch the videos of one type published since the last complete fetch.
+
+        The watermark only advances once every batch is stored and the search was not cut
+        short by max_results; a failed or truncated run is simply searched again next time
+        (already stored ids are skipped). Catalogues without a watermark yet, e.g. imported
+        from the JSON files, resume from their newest video.
+        """
+        started = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        published_after = self.catalog.watermark(video_type, channel_id) \
+            or self.catalog.latest_published(video_type, channel_id)
+        logging.info(f"Fetching {video_type} of {channel_id} published after {published_after or 'the beginning'}")
+
+        # Search pages are sequential (page tokens), the videos.list batches run concurrently;
+        # they share the catalogue connection, whose reads and writes Catalog serializes
+        searched, futures = 0, []
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for batch in self.search_ids(channel_id, video_type, published_after, max_results):
+                searched += len(batch)
+                futures.append(executor.submit(self._fetch_batch, batch, video_type))
+            records = [record for future in futures for record in future.result()]
+
+        # Search pages come newest first and batches finish in any order: number the records
+        # once all are in, oldest first, so ids follow publication order within a fetch and
+        # do not depend on which batch finished first
+        records.sort(key=lambda record: (record["published_date"], record["video_id"]))
+        first_id = self._reserve_ids(video_type, len(records))
+        for offset, record in enumerate(records):
+            record["id"] = first_id + offset
+        stored = self.catalog.upsert_videos(records, video_type, channel_id)
+        if searched < max_results:
+            self.catalog.set_watermark(video_type, channel_id, started)
+        else:
+            # Older videos past the limit are still missing: search the same window next time
+            # (pinned, so the newest stored video cannot become the starting point)
+            self.catalog.set_watermark(video_type, channel_id, published_after or EPOCH)
+            logging.info(f"Reached {max_results} new {video_type} of {channel_id}, watermark kept")
+        logging.info(f"Stored {stored} new {video_type} records of {channel_id}")
+        return stored
+
+    def refresh_channels(self, channel_ids: List[str], video_types: List[str] = None,
+                         max_results: int = 2000) -> Dict[str, Dict[str, int]]:
+        video_types = video_types or list(FETCH_KINDS)
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            futures = {
+                (channel_id, video_type): executor.submit(self.fetch, channel_id, video_type, max_results)
+                for channel_id in channel_ids for video_type in video_types
+            }
+            for channel_id in channel_ids:
+                channel = self.catalog.get_channel(channel_id)
+                title = (channel or {}).get("channel_title") or self.channel_title(channel_id)
+                results[channel_id] = {
+                    video_type: futures[(channel_id, video_type)].result() for video_type in video_types
+                }
+                self.catalog.upsert_channel(channel_id, title, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+        logging.info(f"Quota spent: {self.quota.spent} units")
+        return results
+
+
+def main():
+    try:
+        catalog = Catalog()
+        fetcher = YouTubeFetcher(catalog)
+        fetcher.refresh_channels(["UCndcERoL9eG-XNljgUk1Gag"])
+        catalog.close()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()